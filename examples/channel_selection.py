@@ -0,0 +1,35 @@
+import os
+import pickle
+
+import matplotlib.pyplot as plt
+
+from bci4als.channel_selection import rank_channels, reduced_model
+from bci4als.ml_model import MLModel
+from bci4als.storage import SessionStore
+
+if __name__ == '__main__':
+
+    # Load the session (run examples/convert_recordings.py to create the store of old sessions)
+    session = os.path.join('../recordings', 'avi', '9')
+    store = SessionStore(session)
+
+    # Rank the channels by backward elimination
+    ranking = rank_channels(store.epochs(), store.labels, store.sfreq, store.ch_names)
+    print(ranking.report[['n_channels', 'cv_mean', 'cv_std']].to_string(index=False))
+    print(f'Channels ranking: {ranking.ranking}')
+
+    # The fewest channels within 2% of the best accuracy
+    k = ranking.best_k(tolerance=0.02)
+    print(f'Reduced montage ({k} channels): {ranking.top(k)}')
+
+    # Train & save the reduced model, it still takes the windows of the full montage
+    model = MLModel(list(store.epochs()), store.labels, sfreq=store.sfreq)
+    with open(os.path.join(session, f'model_{k}ch.pickle'), 'wb') as file:
+        pickle.dump(reduced_model(model, ranking, k), file)
+
+    # Accuracy versus channels
+    plt.errorbar(ranking.report['n_channels'], ranking.report['cv_mean'], ranking.report['cv_std'], marker='o')
+    plt.xlabel('Channels')
+    plt.ylabel('Accuracy (CV)')
+    plt.gca().invert_xaxis()
+    plt.show()
@@ -2,7 +2,9 @@ import sys
 import threading
 import time
 from PyQt5.QtWidgets import QApplication
+from bci4als.artifacts import ArtifactGate
 from bci4als.eeg import EEG
+from bci4als.idle import IdleDetector
 from bci4als.ml_model import MLModel
 from bci4als.mouse import VirtualMouse, MouseConfig
 
@@ -12,7 +14,8 @@ def control_mouse(config: MouseConfig, model_path: str):
     # Init variables
     model = MLModel(model_path=model_path)
     eeg = EEG(board_id=-1)
-    vm = VirtualMouse(eeg=eeg, model=model, mouse_actions=config.mouse_actions)
+    vm = VirtualMouse(eeg=eeg, model=model, mouse_actions=config.mouse_actions,
+                      idle_detector=IdleDetector(r=25, dwell=2), artifact_gate=ArtifactGate(adaptive=True))
 
     # Turn EEG on
     eeg.on()
@@ -20,11 +23,15 @@ def control_mouse(config: MouseConfig, model_path: str):
     # Start controlling the virtual mouse
     while True:
 
-        # Monitor the movement to indicate standstill
-        vm.monitor(r=25, counter_limit=5, interval=0.4)
+        # Wait for standstill of the cursor
+        motion_stop = vm.wait_idle()
 
-        # Predict the label imagined by the user
-        label = vm.predict(buffer_time=4)
+        # Predict the label imagined by the user, from the EEG since the cursor stopped
+        label = vm.predict(buffer_time=4, since=motion_stop)
+
+        # Do nothing for windows with artifacts
+        if label is None:
+            continue
 
         # Convert the label to action according to current config
         action = config.get_action(label=label)
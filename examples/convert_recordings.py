@@ -0,0 +1,5 @@
+from bci4als.storage import convert_recordings
+
+# Convert the trials of the old sessions (trials.pickle / model.pickle) to the memory mapped store
+converted = convert_recordings('../recordings')
+print(f'Converted {len(converted)} sessions')
@@ -1,20 +1,18 @@
 import os
-import pickle
-from typing import List
 
 import matplotlib.pyplot as plt
 import mne
 import numpy as np
-import pandas as pd
 from mne.channels import make_standard_montage
 from mne.decoding import CSP
 from numpy import ndarray
-from pandas import DataFrame
 from sklearn.discriminant_analysis import LinearDiscriminantAnalysis
 from sklearn.metrics import plot_confusion_matrix
 from sklearn.model_selection import ShuffleSplit, cross_val_score
 from sklearn.pipeline import Pipeline
 
+from bci4als.storage import SessionStore
+
 
 ###############################################################################
 # Prepare Data
@@ -24,19 +22,17 @@ from sklearn.pipeline import Pipeline
 recordings_path = '../recordings'
 subject = 'adi'
 session_id = '6'
-labels_path = os.path.join(recordings_path, subject, session_id, 'labels.csv')
-trials_path = os.path.join(recordings_path, subject, session_id, 'trials.pickle')
 
-# load data
-trials: List[DataFrame] = pickle.load(open(trials_path, 'rb'))
-labels = pd.read_csv(labels_path, header=None).to_numpy().squeeze()
+# load data (memory mapped, run examples/convert_recordings.py to create the store of old sessions)
+store = SessionStore(os.path.join(recordings_path, subject, session_id))
+labels = store.labels
 
 # convert data to mne.Epochs
-ch_names = list(trials[0].columns)
+ch_names = store.ch_names
 ch_types = ['eeg'] * len(ch_names)
 sfreq = 120
 
-epochs_array: ndarray = np.stack([df[:480].to_numpy().T for df in trials])
+epochs_array: ndarray = store.epochs(480)
 
 info = mne.create_info(ch_names, sfreq, ch_types)
 epochs = mne.EpochsArray(epochs_array, info)
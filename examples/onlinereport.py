@@ -1,31 +1,23 @@
-import json
-import typing
 import matplotlib.pyplot as plt
 import numpy
 import numpy as np
+from bci4als.analytics import OnlineAnalytics
 
-
-def trial_accuracy(trial: typing.List[typing.List[int]]):
-    target = trial[0][0]
-    n_attempts = len(trial)
-    n_success = len([1 for t, p in trial if t == p])
-    accuracy = n_success / n_attempts
-    return accuracy
-
+analytics = OnlineAnalytics.from_catalog("../recordings", subject='avi')
+trials = analytics.trials()
+summary = analytics.sessions_summary()
+print(summary[['session', 'n_trials', 'accuracy', 'itr', 'skip_rate', 'attempts_to_threshold']])
 
 best_accuracies = []
 errors = []
 
-sessions = [7, 12, 13, 14, 15, 17, 21, 23]
-for session_number in sessions:
-    fpath = f"../recordings/avi/{session_number}/results.json"
-    results = json.load(open(fpath))
-
-    accuracies = [trial_accuracy(trial) for trial in results]
+for index, session_number in enumerate(summary['session']):
+    session_trials = trials[trials['session'] == index]
+    accuracies = (session_trials['n_correct'] / session_trials['n_attempts']).to_numpy()
 
     plt.plot(accuracies, label="accuracy")
-    plt.hlines(numpy.mean(accuracies), 0, len(results), colors='black', linestyle='-', label="mean accuracy")
-    plt.hlines(0.2, 0, len(results), colors='black', linestyle='--', label="chance")
+    plt.hlines(numpy.mean(accuracies), 0, len(accuracies), colors='black', linestyle='-', label="mean accuracy")
+    plt.hlines(0.2, 0, len(accuracies), colors='black', linestyle='--', label="chance")
     plt.xlabel("Trial Number")
     plt.ylabel("Accuracy")
     # datetime =
@@ -50,3 +42,10 @@ plt.ylim(-0.05, 1.05)
 # plt.xticks(numpy.arange(len(best_accuracies)), numpy.arange(1, len(best_accuracies) + 1))
 plt.legend()
 plt.show()
+
+# Information transfer rate by session
+plt.bar(summary['session'], summary['itr'])
+plt.title("ITR by Session")
+plt.xlabel("Session Number")
+plt.ylabel("ITR (bits/min)")
+plt.show()
@@ -0,0 +1,15 @@
+import os
+
+from bci4als.storage import SessionStore
+from bci4als.xdf import xdf_to_store
+
+# The channels of the lab recorder sessions, the same as the .pkl files (channels 4-16 of the EEG stream)
+ch_names = ['C03', 'C04', 'P07', 'P08', 'O01', 'O02', 'F07', 'F08', 'F03', 'F04', 'T07', 'T08', 'P03']
+
+base_path = "adi_eden_records"
+for subject in ["Sub2011001", "Sub2111001", "Sub2211001"]:
+    session = os.path.join(base_path, subject)
+    durations, labels = xdf_to_store(os.path.join(session, 'EEG.xdf'), session, ch_names=ch_names,
+                                     channels=range(3, 16))
+    store = SessionStore(session)
+    print(f'{subject}: {len(store)} trials, epochs {store.epochs().shape}')
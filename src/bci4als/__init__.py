@@ -5,7 +5,17 @@ __author__ = """Evyatar Luvaton, Noam Siegel"""
 __email__ = 'noamsi@post.bgu.ac.il'
 __version__ = importlib_metadata.version('bci4als')
 
-from bci4als.experiments.offline import OfflineExperiment
-from bci4als.experiments.online import OnlineExperiment
 from .eeg import EEG
 from .ml_model import MLModel
+
+
+def __getattr__(name):
+    # The experiments import psychopy, which parses sys.argv on import (e.g. takes over `--help` of the
+    # `python -m bci4als.benchmark` tools), so they are imported on first use
+    if name == 'OfflineExperiment':
+        from bci4als.experiments.offline import OfflineExperiment
+        return OfflineExperiment
+    if name == 'OnlineExperiment':
+        from bci4als.experiments.online import OnlineExperiment
+        return OnlineExperiment
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
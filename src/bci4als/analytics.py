@@ -0,0 +1,310 @@
+import hashlib
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from bci4als.catalog import Catalog, read_metadata
+from bci4als.experiments.event_log import EVENTS_FILE, read_events
+from nptyping import NDArray
+
+# The prediction records of the online sessions
+RECORD_DTYPE = np.dtype([('session', np.int64), ('trial', np.int64), ('attempt', np.int64),
+                         ('target', np.int64), ('prediction', np.int64), ('time', np.float64)])
+
+# Name of the aggregates cache file inside the recordings folder, and the version of the cached aggregates
+ANALYTICS_FILE = '.analytics.json'
+ANALYTICS_VERSION = 2
+
+
+def wolpaw_bits(accuracy, n_classes: int):
+    """
+    Wolpaw information transfer per selection:
+        B = log2(N) + P*log2(P) + (1-P)*log2((1-P)/(N-1))
+    Accuracy at or below chance transfers no information.
+    :param accuracy: the selection accuracy (scalar or array)
+    :param n_classes: the number of classes (N)
+    :return: bits per selection
+    """
+    p = np.clip(np.asarray(accuracy, dtype=np.float64), 1 / n_classes, 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        bits = np.log2(n_classes) + p * np.log2(p) + (1 - p) * np.log2((1 - p) / (n_classes - 1))
+    return np.where(p >= 1, np.log2(n_classes), np.where(p <= 1 / n_classes, 0., bits))
+
+
+def load_records(session_directory: str, session: int = 0) -> NDArray:
+    """
+    Load the predictions of an online session as records.
+    Sessions recorded before the event log have no prediction times (NaN).
+    :param session_directory: path to the session folder
+    :param session: the session index of the records
+    :return: array of RECORD_DTYPE
+    """
+    events_path = os.path.join(session_directory, EVENTS_FILE)
+    if os.path.isfile(events_path):
+        rows = [(session, e['trial'], e['attempt'], e['target'], e['prediction'], e['time'])
+                for e in read_events(events_path, 'prediction')]
+    else:
+        with open(os.path.join(session_directory, 'results.json')) as file:
+            rows = [(session, trial, attempt, target, prediction, np.nan)
+                    for trial, pairs in enumerate(json.load(file))
+                    for attempt, (target, prediction) in enumerate(pairs)]
+
+    return np.array(rows, dtype=RECORD_DTYPE)
+
+
+def load_selections(session_directory: str) -> Dict[int, bool]:
+    """
+    Load the outcome of each trial of an online session: True if the trial selected the target.
+    With dynamic stopping the selection is the decided class, otherwise the trial selects the target
+    when it reached the threshold (confident). Sessions recorded before the event log have no outcomes.
+    :param session_directory: path to the session folder
+    :return: the outcome by trial index
+    """
+    events_path = os.path.join(session_directory, EVENTS_FILE)
+    if not os.path.isfile(events_path):
+        return {}
+
+    selections = {}
+    for e in read_events(events_path, 'trial_end'):
+        decision = e.get('decision')
+        selections[e['trial']] = decision == e['target'] if decision is not None else bool(e['confident'])
+
+    return selections
+
+
+def _group_sum(keys: NDArray, values: NDArray, n_keys: int) -> NDArray:
+    return np.bincount(keys, weights=values, minlength=n_keys)
+
+
+class OnlineAnalytics:
+    """
+    Performance analytics of online sessions: accuracy, information transfer rate (ITR),
+    attempts to reach the threshold, skip rate and confusion matrices per session and per subject.
+
+    A selection is the outcome of a trial (the threshold reached, the decision of the dynamic stopping,
+    or a skip), so the ITR is the Wolpaw ITR of the trials: the selection accuracy over the mean trial
+    duration. The rate of the single predictions (every window as a selection) is `window_itr`.
+
+    All the predictions of all the sessions are loaded to one flat records array and every metric is a
+    NumPy group-by on it. The aggregates are cached next to the sessions and rebuilt only when a
+    session changes.
+
+    Usage:
+        analytics = OnlineAnalytics.from_catalog('../recordings', subject='avi')
+        analytics.sessions_summary()[['session', 'accuracy', 'itr']]
+
+    Attributes:
+
+        sessions (List[str]):
+            The session directories.
+
+        subjects (List[str]):
+            The subject of each session.
+
+        n_classes (int):
+            The number of classes of the sessions.
+
+        thresholds (NDArray):
+            The correct predictions needed to finish a trial, per session. Read from the metadata,
+            or the given default, or for older sessions the most correct predictions of any trial.
+
+        buffer_times (NDArray):
+            The seconds between predictions, per session. Read from the metadata or the given default.
+    """
+
+    def __init__(self, sessions: List[str], n_classes: int = 5, threshold: Optional[int] = None,
+                 buffer_time: float = 4, cache_path: Optional[str] = None):
+
+        self.sessions: List[str] = list(sessions)
+        self.subjects: List[str] = [os.path.basename(os.path.dirname(os.path.normpath(s))) for s in self.sessions]
+        self.n_classes: int = n_classes
+        self.cache_path: Optional[str] = cache_path
+        self._threshold, self._buffer_time = threshold, buffer_time
+        self._records: Optional[NDArray] = None
+        self._aggregates: Optional[Dict[str, Any]] = None
+
+        metadata = [read_metadata(s) for s in self.sessions]
+        self.buffer_times: NDArray = np.array([float(m['Buffer time']) if m.get('Buffer time', 'None') != 'None'
+                                               else buffer_time for m in metadata])
+        self._metadata_thresholds = [m.get('Threshold') for m in metadata]
+
+    @classmethod
+    def from_catalog(cls, root: str, **kwargs) -> 'OnlineAnalytics':
+        """
+        Analyze the online sessions of the recordings folder.
+        :param root: the recordings folder
+        :param kwargs: the params of `Catalog.query` and of the analytics
+        :return: the analytics of the sessions, cached in the recordings folder
+        """
+        query = {k: kwargs.pop(k) for k in ('subject', 'headset', 'min_trials') if k in kwargs}
+        catalog = Catalog(root)
+        sessions = [catalog.path(e) for e in catalog.query(experiment_type='Online', **query)]
+        return cls(sessions, cache_path=os.path.join(root, ANALYTICS_FILE), **kwargs)
+
+    @property
+    def records(self) -> NDArray:
+        """The predictions of all the sessions, ordered by session, trial & attempt"""
+        if self._records is None:
+            records = [load_records(s, i) for i, s in enumerate(self.sessions)]
+            records = np.concatenate(records) if records else np.empty(0, RECORD_DTYPE)
+            self._records = records[np.lexsort((records['attempt'], records['trial'], records['session']))]
+
+        return self._records
+
+    @property
+    def thresholds(self) -> NDArray:
+        trials = self.trials()
+        inferred = np.zeros(len(self.sessions))
+        np.maximum.at(inferred, trials['session'].to_numpy(), trials['n_correct'].to_numpy())
+
+        default = inferred if self._threshold is None else np.full(len(self.sessions), self._threshold)
+        return np.array([float(t) if t not in (None, 'None') else d
+                         for t, d in zip(self._metadata_thresholds, default)])
+
+    def trials(self) -> pd.DataFrame:
+        """
+        Return the metrics of each trial: attempts, correct predictions, duration (seconds from the
+        trial start to the last prediction) and the logged outcome (1 if the trial selected the target,
+        0 if not, NaN for sessions without the event log).
+        """
+        records = self.records
+
+        # The trials as group keys: first record of each (session, trial)
+        new_trial = np.ones(len(records), dtype=bool)
+        new_trial[1:] = (records['session'][1:] != records['session'][:-1]) | \
+                        (records['trial'][1:] != records['trial'][:-1])
+        starts = np.flatnonzero(new_trial)
+        keys = np.cumsum(new_trial) - 1
+
+        n_attempts = np.bincount(keys, minlength=len(starts))
+        n_correct = _group_sum(keys, (records['target'] == records['prediction']).astype(float), len(starts))
+        session = records['session'][starts]
+
+        # The duration from the prediction times, or from the buffer time for sessions without times
+        buffer_times = self.buffer_times[session]
+        ends = starts + n_attempts - 1
+        timed = records['time'][ends] - records['time'][starts] + buffer_times
+        duration = np.where(np.isnan(timed), n_attempts * buffer_times, timed)
+
+        # The logged outcomes of the trials
+        selections = [load_selections(s) for s in self.sessions]
+        selected = np.array([float(selections[s][t]) if t in selections[s] else np.nan
+                             for s, t in zip(session, records['trial'][starts])])
+
+        trials = pd.DataFrame({'session': session, 'trial': records['trial'][starts],
+                               'target': records['target'][starts], 'n_attempts': n_attempts,
+                               'n_correct': n_correct, 'duration': duration, 'selected': selected})
+        return trials
+
+    def _compute(self) -> Dict[str, Any]:
+        records, trials = self.records, self.trials()
+        n_sessions, n = len(self.sessions), self.n_classes
+        subject_names = sorted(set(self.subjects))
+        session_subject = np.array([subject_names.index(s) for s in self.subjects], dtype=np.int64)
+
+        thresholds = self.thresholds
+        reached = trials['n_correct'].to_numpy() >= thresholds[trials['session'].to_numpy()]
+
+        # A trial selects the target by its logged outcome, or else if it reached the threshold
+        logged = trials['selected'].to_numpy()
+        selected = np.where(np.isnan(logged), reached, logged == 1)
+        trial_session = trials['session'].to_numpy()
+        correct = (records['target'] == records['prediction']).astype(float)
+
+        def summary(record_keys: NDArray, trial_keys: NDArray, n_keys: int) -> Dict[str, List]:
+            attempts = np.bincount(record_keys, minlength=n_keys)
+            n_trials = np.bincount(trial_keys, minlength=n_keys)
+            n_reached = _group_sum(trial_keys, reached.astype(float), n_keys)
+            durations = _group_sum(trial_keys, trials['duration'].to_numpy(), n_keys)
+            reached_attempts = _group_sum(trial_keys, trials['n_attempts'].to_numpy() * reached, n_keys)
+            reached_time = _group_sum(trial_keys, trials['duration'].to_numpy() * reached, n_keys)
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                accuracy = _group_sum(record_keys, correct, n_keys) / attempts
+
+                # Every trial is a selection of one of the classes, made every durations / n_trials seconds
+                selection_accuracy = _group_sum(trial_keys, selected.astype(float), n_keys) / n_trials
+                bits = wolpaw_bits(selection_accuracy, n)
+
+                # The rate of the single predictions, a window every durations / attempts seconds
+                window_itr = wolpaw_bits(accuracy, n) * 60 / (durations / attempts)
+                return {'n_trials': n_trials.tolist(), 'n_attempts': attempts.tolist(),
+                        'accuracy': accuracy.tolist(), 'selection_accuracy': selection_accuracy.tolist(),
+                        'bits_per_selection': bits.tolist(), 'itr': (bits * 60 / (durations / n_trials)).tolist(),
+                        'window_itr': window_itr.tolist(),
+                        'skip_rate': (1 - n_reached / n_trials).tolist(),
+                        'attempts_to_threshold': (reached_attempts / n_reached).tolist(),
+                        'time_to_target': (reached_time / n_reached).tolist()}
+
+        def confusion(record_keys: NDArray, n_keys: int) -> List:
+            index = (record_keys * n + records['target']) * n + records['prediction']
+            return np.bincount(index, minlength=n_keys * n * n).reshape(n_keys, n, n).tolist()
+
+        record_subject = session_subject[records['session']]
+        return {'sessions': summary(records['session'], trial_session, n_sessions),
+                'subjects': summary(record_subject, session_subject[trial_session], len(subject_names)),
+                'subject_names': subject_names,
+                'thresholds': thresholds.tolist(),
+                'confusion_sessions': confusion(records['session'], n_sessions),
+                'confusion_subjects': confusion(record_subject, len(subject_names))}
+
+    def _cache_key(self) -> str:
+        sources = []
+        for session in self.sessions:
+            source = os.path.join(session, EVENTS_FILE)
+            source = source if os.path.isfile(source) else os.path.join(session, 'results.json')
+            sources.append([source, os.stat(source).st_mtime, os.path.getmtime(session)])
+        params = [ANALYTICS_VERSION, self.n_classes, self._threshold, self._buffer_time, sources]
+        return hashlib.sha1(json.dumps(params).encode()).hexdigest()
+
+    @property
+    def aggregates(self) -> Dict[str, Any]:
+        """The metrics of the sessions and the subjects, from the cache if no session changed"""
+        if self._aggregates is not None:
+            return self._aggregates
+
+        key = self._cache_key()
+        if self.cache_path is not None and os.path.isfile(self.cache_path):
+            with open(self.cache_path) as file:
+                cache = json.load(file)
+            if cache.get('key') == key:
+                self._aggregates = cache['aggregates']
+                return self._aggregates
+
+        self._aggregates = self._compute()
+        if self.cache_path is not None:
+            with open(self.cache_path, 'w') as file:
+                json.dump({'key': key, 'aggregates': self._aggregates}, file)
+
+        return self._aggregates
+
+    def sessions_summary(self) -> pd.DataFrame:
+        """
+        Return the metrics of each session: trials, attempts, accuracy of the predictions & of the trial
+        selections, bits per selection, ITR of the trials & of the windows (bits/min), skip rate, attempts &
+        time (seconds) to reach the threshold.
+        """
+        summary = pd.DataFrame(self.aggregates['sessions'])
+        summary.insert(0, 'subject', self.subjects)
+        summary.insert(1, 'session', [os.path.basename(os.path.normpath(s)) for s in self.sessions])
+        summary.insert(2, 'threshold', self.aggregates['thresholds'])
+        return summary
+
+    def subjects_summary(self) -> pd.DataFrame:
+        """Return the metrics of each subject over all the subject sessions"""
+        summary = pd.DataFrame(self.aggregates['subjects'])
+        summary.insert(0, 'subject', self.aggregates['subject_names'])
+        return summary
+
+    def confusion(self, by: str = 'session') -> NDArray:
+        """
+        Return the confusion matrices (target rows, prediction columns).
+        :param by: 'session' or 'subject'
+        :return: array with the shape (n_sessions or n_subjects, n_classes, n_classes)
+        """
+        if by not in ('session', 'subject'):
+            raise ValueError(f'Unknown group `{by}`, use `session` or `subject`')
+
+        return np.array(self.aggregates[f'confusion_{by}s'])
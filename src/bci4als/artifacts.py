@@ -0,0 +1,158 @@
+from typing import Dict, List, Optional
+
+import numpy as np
+from nptyping import NDArray
+
+# The rejection reasons
+PEAK_TO_PEAK = 'peak_to_peak'
+VARIANCE = 'variance'
+FLATLINE = 'flatline'
+ADAPTIVE = 'adaptive'
+REASONS = (PEAK_TO_PEAK, VARIANCE, FLATLINE, ADAPTIVE)
+
+# The minimal std of the adaptive baseline (log variance units)
+MIN_LOG_STD = 0.1
+
+
+def detrend(data: NDArray) -> NDArray:
+    """Remove the linear trend (and the offset) of each channel, (n_channels, n_samples)"""
+    n_samples = data.shape[1]
+    if n_samples < 2:
+        return data - data.mean(axis=1, keepdims=True)
+
+    t = np.arange(n_samples) - (n_samples - 1) / 2
+    mean = data.mean(axis=1, keepdims=True)
+    slope = (data @ t)[:, np.newaxis] / (t @ t)
+    return data - mean - slope * t
+
+
+class ArtifactGate:
+    """
+    Reject EEG windows with artifacts (blinks, jaw clenches, electrode pops or disconnections)
+    before the model classifies them or trains on them.
+
+    All the checks are vectorized over the channels of the window (uV, after removing the linear trend):
+        peak_to_peak - the peak to peak amplitude is above `ptp_max`
+        variance     - the variance is above `var_max`
+        flatline     - the peak to peak amplitude is below `flat_min`
+        adaptive     - the log variance is more than `z_max` std above the channel baseline. The baseline
+                       is a running mean & variance of the accepted windows, used after `warmup` windows.
+    A window is rejected when at least `min_channels` channels fail a check.
+
+    Usage:
+        gate = ArtifactGate(ptp_max=200, adaptive=True)
+        if gate.accept(window):
+            prediction = model.online_predict(window, eeg)
+
+    Attributes:
+
+        counters (Dict[str, int]):
+            The number of checked windows, rejected windows and of the rejections by each reason.
+
+        channel_counts (NDArray):
+            The number of rejected windows in which each channel failed.
+
+        last_reasons (Dict[str, List[int]]):
+            The failing channels by reason of the last checked window.
+    """
+
+    def __init__(self, ptp_max: Optional[float] = 200., var_max: Optional[float] = None,
+                 flat_min: Optional[float] = 1., adaptive: bool = False, z_max: float = 4., warmup: int = 5,
+                 alpha: float = 0.05, min_channels: int = 1, remove_trend: bool = True):
+
+        self.ptp_max: Optional[float] = ptp_max
+        self.var_max: Optional[float] = var_max
+        self.flat_min: Optional[float] = flat_min
+        self.adaptive: bool = adaptive
+        self.z_max: float = z_max
+        self.warmup: int = warmup
+        self.alpha: float = alpha
+        self.min_channels: int = min_channels
+        self.remove_trend: bool = remove_trend
+
+        self.counters: Dict[str, int] = {'windows': 0, 'rejected': 0, **{reason: 0 for reason in REASONS}}
+        self.channel_counts: Optional[NDArray] = None
+        self.last_reasons: Dict[str, List[int]] = {}
+
+        # Running baseline of the log variance of each channel
+        self._n_baseline: int = 0
+        self._mean: Optional[NDArray] = None
+        self._var: Optional[NDArray] = None
+
+    def _features(self, data: NDArray):
+        """Return the peak to peak amplitude & the variance of each channel"""
+        data = np.asarray(data, dtype=np.float64)
+        if self.remove_trend:
+            data = detrend(data)
+
+        return data.max(axis=1) - data.min(axis=1), data.var(axis=1)
+
+    def check(self, data: NDArray) -> Dict[str, NDArray]:
+        """
+        Check each channel of the window, without updating the counters.
+        :param data: the window, (n_channels, n_samples) in uV
+        :return: boolean array of the failing channels by reason
+        """
+        return self._failed(*self._features(data))
+
+    def _failed(self, ptp: NDArray, var: NDArray) -> Dict[str, NDArray]:
+        no_check = np.zeros(len(ptp), dtype=bool)
+
+        failed = {PEAK_TO_PEAK: ptp > self.ptp_max if self.ptp_max is not None else no_check,
+                  VARIANCE: var > self.var_max if self.var_max is not None else no_check,
+                  FLATLINE: ptp < self.flat_min if self.flat_min is not None else no_check,
+                  ADAPTIVE: no_check}
+
+        if self.adaptive and self._n_baseline >= self.warmup:
+            # The std is floored, so a very steady baseline does not reject normal fluctuations
+            z = (np.log(var + 1e-12) - self._mean) / np.maximum(np.sqrt(self._var), MIN_LOG_STD)
+            failed[ADAPTIVE] = z > self.z_max
+
+        return failed
+
+    def accept(self, data: NDArray) -> bool:
+        """
+        Check the window, count the rejection and update the baseline with accepted windows.
+        :param data: the window, (n_channels, n_samples) in uV
+        :return: True if the window is clean
+        """
+        ptp, var = self._features(data)
+        failed = self._failed(ptp, var)
+        bad = np.logical_or.reduce(list(failed.values()))
+        rejected = bad.sum() >= self.min_channels
+
+        self.counters['windows'] += 1
+        self.last_reasons = {reason: np.flatnonzero(f).tolist() for reason, f in failed.items() if f.any()}
+        if self.channel_counts is None:
+            self.channel_counts = np.zeros(len(bad), dtype=np.int64)
+
+        if rejected:
+            self.counters['rejected'] += 1
+            self.channel_counts += bad
+            for reason in self.last_reasons:
+                self.counters[reason] += 1
+        elif self.adaptive:
+            self._update_baseline(var)
+
+        return not rejected
+
+    def _update_baseline(self, var: NDArray):
+        """Exponentially weighted mean & variance of the channels log variance (plain mean while warming up)"""
+        log_var = np.log(var + 1e-12)
+        self._n_baseline += 1
+        if self._mean is None:
+            self._mean, self._var = log_var, np.zeros_like(log_var)
+            return
+
+        alpha = max(self.alpha, 1 / self._n_baseline)
+        delta = log_var - self._mean
+        self._mean = self._mean + alpha * delta
+        self._var = (1 - alpha) * (self._var + alpha * delta ** 2)
+
+    @property
+    def rejection_rate(self) -> float:
+        return self.counters['rejected'] / self.counters['windows'] if self.counters['windows'] else 0.
+
+    def summary(self) -> Dict[str, float]:
+        """Return the counters and the rejection rate"""
+        return {**self.counters, 'rejection_rate': self.rejection_rate}
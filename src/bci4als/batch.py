@@ -0,0 +1,242 @@
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from bci4als.catalog import Catalog
+from bci4als.dataset import EpochCache, SessionDataset
+from bci4als.ml_model import MLModel
+from sklearn.model_selection import StratifiedKFold, cross_val_score
+
+# Files of the batch output folder
+SUMMARY_FILE = 'summary.csv'
+RESULT_FILE = 'result.json'
+MODEL_FILE = 'model.pickle'
+
+
+def _limit_memory(max_memory: Optional[int]):
+    """Cap the address space of the worker process, so a runaway session fails with MemoryError"""
+    if max_memory is None:
+        return
+
+    # Not available on Windows
+    import resource
+    resource.setrlimit(resource.RLIMIT_AS, (max_memory, max_memory))
+
+
+def _params_hash(params: Dict[str, Any]) -> str:
+    return hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def _names(session: str) -> Dict[str, str]:
+    """Return the subject & session names of the session directory"""
+    session = os.path.normpath(session)
+    return {'subject': os.path.basename(os.path.dirname(session)), 'session': os.path.basename(session)}
+
+
+def session_output(output_dir: str, session: str) -> str:
+    """Return the output folder of the session (<output>/<subject>/<session>)"""
+    names = _names(session)
+    return os.path.join(output_dir, names['subject'], names['session'])
+
+
+def train_session(session: str, output_dir: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Cross validate and train the model of a single session and save the model and the result.
+    :param session: the session directory
+    :param output_dir: the batch output folder
+    :param params: the training params (see `BatchTrainer`)
+    :return: the result row of the session
+    """
+    out = session_output(output_dir, session)
+    result = {**_names(session), 'path': session, 'params': _params_hash(params), 'status': 'ok',
+              'n_trials': None, 'n_channels': None, 'sfreq': None, 'cv_mean': None, 'cv_std': None, 'train_time': None, 'model_path': None, 'error': None}
+    start = time.perf_counter()
+
+    try:
+        cache = EpochCache(params['cache']) if params.get('cache') else None
+        dataset = SessionDataset([session], sfreq=params['sfreq'])
+        raw, labels = dataset.raw_epochs(0)
+        result['n_trials'], result['n_channels'], result['sfreq'] = raw.shape[0], raw.shape[1], dataset.sfreq
+
+        # The model of the session, at the rate recorded in the session
+        # Single precision stores train in single precision
+        dtype = np.float32 if raw.dtype == np.float32 else np.float64
+        model = MLModel(trials=list(raw), labels=labels.tolist(), sfreq=dataset.sfreq, dtype=dtype)
+
+        # Cross validation of the pipeline on the epochs the model trains on (no more folds than the rarest
+        # label trials), the preprocessed epochs are cached for the training
+        X, y = model.training_epochs(cache=cache), model.labels
+        n_folds = min(params['n_folds'], np.unique(y, return_counts=True)[1].min())
+        if n_folds >= 2:
+            scores = cross_val_score(model.csp_lda_pipeline(min(6, X.shape[1])), X, y,
+                                     cv=StratifiedKFold(n_folds, shuffle=True, random_state=0))
+            result['cv_mean'], result['cv_std'] = float(scores.mean()), float(scores.std())
+
+        # Train the model on all the trials
+        model.offline_training(eeg=None, model_type=params['model_type'], cache=cache)
+
+        os.makedirs(out, exist_ok=True)
+        result['model_path'] = os.path.join(out, MODEL_FILE)
+        with open(result['model_path'], 'wb') as file:
+            pickle.dump(model, file)
+
+    except MemoryError:
+        result['status'], result['error'] = 'memory', 'The worker exceeded the memory limit'
+    except Exception as e:
+        result['status'], result['error'] = 'failed', f'{type(e).__name__}: {e}'
+        traceback.print_exc()
+
+    result['train_time'] = time.perf_counter() - start
+
+    # The result is written last, so a session with a result is complete
+    os.makedirs(out, exist_ok=True)
+    tmp_path = os.path.join(out, RESULT_FILE + '.tmp')
+    with open(tmp_path, 'w') as file:
+        json.dump(result, file, indent=4)
+    os.replace(tmp_path, os.path.join(out, RESULT_FILE))
+
+    return result
+
+
+class BatchTrainer:
+    """
+    Train and evaluate the models of many sessions in a process pool.
+
+    Every session gets a folder in the output folder with the trained model and the result, and
+    `summary.csv` collects the results of all the sessions. Sessions which already have a result with
+    the same params are skipped, so an interrupted batch resumes where it stopped (failed sessions are
+    trained again).
+
+    Usage:
+        trainer = BatchTrainer('../models', workers=4, max_memory=2 * 1024 ** 3)
+        summary = trainer.run(trainer.query('../recordings', subject='avi', min_trials=20))
+
+    Attributes:
+
+        output_dir (str):
+            The output folder.
+
+        workers (int):
+            The number of worker processes.
+
+        max_memory (int):
+            The address space limit of each worker in bytes (None for no limit, Unix only).
+
+        params (Dict[str, Any]):
+            The training params: model type, sampling rate (None for the rate recorded in each session),
+            cross validation folds and the epochs cache folder. The cross validation runs on the epochs
+            preprocessed as the model is trained, so the score is of the saved model.
+    """
+
+    def __init__(self, output_dir: str, workers: Optional[int] = None, max_memory: Optional[int] = None,
+                 model_type: str = 'csp_lda', sfreq: Optional[float] = None, n_folds: int = 5,
+                 cache: Optional[str] = None):
+
+        self.output_dir: str = output_dir
+        self.workers: int = workers or os.cpu_count()
+        self.max_memory: Optional[int] = max_memory
+        self.params: Dict[str, Any] = {'model_type': model_type, 'sfreq': sfreq, 'n_folds': n_folds,
+                                       'cache': cache}
+
+    @staticmethod
+    def query(root: str, **query) -> List[str]:
+        """
+        Return the offline sessions of the catalog query.
+        :param root: the recordings folder
+        :param query: the params of `Catalog.query`
+        :return: list of the session directories
+        """
+        catalog = Catalog(root)
+        query.setdefault('experiment_type', 'Offline')
+        return [catalog.path(e) for e in catalog.query(**query)]
+
+    def _done(self, session: str) -> Optional[Dict[str, Any]]:
+        """Return the result of the session if it was already trained successfully with the same params"""
+        path = os.path.join(session_output(self.output_dir, session), RESULT_FILE)
+        if not os.path.isfile(path):
+            return None
+
+        with open(path) as file:
+            result = json.load(file)
+
+        return result if result['params'] == _params_hash(self.params) and result['status'] == 'ok' else None
+
+    def run(self, sessions: List[str]) -> pd.DataFrame:
+        """
+        Train the models of the sessions.
+        :param sessions: the session directories
+        :return: the summary table of all the sessions
+        """
+        results = {}
+        todo = []
+        for session in sessions:
+            done = self._done(session)
+            if done is not None:
+                results[session] = done
+            else:
+                todo.append(session)
+
+        print(f'Training {len(todo)} sessions ({len(results)} already done) with {self.workers} workers')
+
+        with ProcessPoolExecutor(self.workers, initializer=_limit_memory, initargs=(self.max_memory,)) as pool:
+            futures = {pool.submit(train_session, s, self.output_dir, self.params): s for s in todo}
+
+            for future in as_completed(futures):
+                session = futures[future]
+                try:
+                    results[session] = future.result()
+                except BrokenProcessPool:
+                    # The worker died (e.g. killed by the OS), the session is trained again on resume
+                    results[session] = {**_names(session), 'path': session, 'status': 'crashed'}
+
+                print(f'{session}: {results[session]["status"]} '
+                      f'(cv accuracy {results[session].get("cv_mean")})')
+
+        return self._save_summary([results[s] for s in sessions])
+
+    def _save_summary(self, results: List[Dict[str, Any]]) -> pd.DataFrame:
+        summary = pd.DataFrame(results)
+        os.makedirs(self.output_dir, exist_ok=True)
+        summary.to_csv(os.path.join(self.output_dir, SUMMARY_FILE), index=False)
+
+        return summary
+
+
+def _memory(value: str) -> int:
+    """Parse memory size like 512M or 2G"""
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    return int(float(value[:-1]) * units[value[-1].upper()]) if value[-1].upper() in units else int(value)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Train the models of many sessions in parallel')
+    parser.add_argument('sessions', nargs='*', help='session folders (default: query the recordings catalog)')
+    parser.add_argument('--output', required=True, help='the output folder')
+    parser.add_argument('--root', default='recordings', help='the recordings folder of the catalog query')
+    parser.add_argument('--subject', help='query: the subject name')
+    parser.add_argument('--headset', help='query: the headset name')
+    parser.add_argument('--min-trials', type=int, help='query: the minimum number of trials')
+    parser.add_argument('--workers', type=int, help='the number of worker processes')
+    parser.add_argument('--max-memory', type=_memory, help='memory limit of each worker, e.g. 2G')
+    parser.add_argument('--cache', help='the preprocessed epochs cache folder')
+    parser.add_argument('--folds', type=int, default=5, help='the number of cross validation folds')
+    args = parser.parse_args(argv)
+
+    sessions = args.sessions or BatchTrainer.query(args.root, subject=args.subject, headset=args.headset,
+                                                   min_trials=args.min_trials)
+    trainer = BatchTrainer(args.output, workers=args.workers, max_memory=args.max_memory,
+                           n_folds=args.folds, cache=args.cache)
+    print(trainer.run(sessions)[['subject', 'session', 'status', 'n_trials', 'cv_mean']].to_string())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,284 @@
+import argparse
+import copy
+import json
+import os
+import platform
+import subprocess
+import time
+import traceback
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+from bci4als.eeg import EEG, HEADSETS
+from bci4als.ml_model import H_FREQ, MLModel
+from bci4als.multirate import Decimator
+from bci4als.signal_quality import SignalQualityMonitor
+from bci4als.simulation import SimulatedEEG
+from bci4als.stream_hub import SharedRing, StreamConsumer
+from nptyping import NDArray
+
+# Default sizes of the synthetic data
+DEFAULT_SIZES = {'channels': 13, 'sfreq': 125, 'trials': 60, 'trial_length': 4., 'session_length': 600.,
+                 'buffer_time': 4., 'dtype': 'float64'}
+
+# The sampling rates of the boards (Cyton-Daisy, Cyton, and high rate boards)
+BOARD_RATES = (125, 250, 500, 1000)
+
+
+def measure(func: Callable[[Any], Any], repeat: int = 10, number: int = 1,
+            setup: Callable[[], Any] = lambda: None) -> Dict[str, float]:
+    """
+    Time a function.
+    :param func: the timed function, called with the output of `setup`
+    :param repeat: the number of measurements
+    :param number: the calls of each measurement (for very fast functions)
+    :param setup: untimed preparation before each measurement (e.g. copy of data which is changed in place)
+    :return: the statistics of a single call in ms
+    """
+    times = []
+    for _ in range(repeat):
+        args = setup()
+        start = time.perf_counter()
+        for _ in range(number):
+            func(args)
+        times.append((time.perf_counter() - start) / number * 1000)
+
+    times = np.array(times)
+    return {'repeat': repeat, 'number': number, 'mean_ms': float(times.mean()), 'median_ms': float(np.median(times)),
+            'min_ms': float(times.min()), 'std_ms': float(times.std())}
+
+
+def synthetic_board_data(eeg: EEG, n_trials: int, trial_length: float, session_length: float, sfreq: float,
+                         seed: int = 0) -> NDArray:
+    """
+    Generate BrainFlow board data of a session: noise in the EEG rows, timestamps and start & stop
+    markers of the trials spread evenly over the session.
+    :return: array with the shape (n_rows, session_length * sfreq)
+    """
+    rng = np.random.default_rng(seed)
+    n_samples = int(session_length * sfreq)
+    data = np.zeros((eeg.board.get_num_rows(eeg.board_id), n_samples))
+    data[eeg.board.get_eeg_channels(eeg.board_id)] = rng.normal(0, 10, (len(eeg.board.get_eeg_channels(eeg.board_id)),
+                                                                        n_samples))
+    data[eeg.timestamp_row] = time.time() + np.arange(n_samples) / sfreq
+
+    step, length = n_samples // max(n_trials, 1), int(trial_length * sfreq)
+    for i in range(n_trials):
+        label = int(rng.integers(5))
+        data[eeg.marker_row, i * step] = EEG.encode_marker('start', label, i)
+        data[eeg.marker_row, min(i * step + length, (i + 1) * step - 1)] = EEG.encode_marker('stop', label, i)
+
+    return data
+
+
+def synthetic_trials(n_trials: int, n_channels: int, n_samples: int, sfreq: float, seed: int = 0):
+    """Generate trials (n_channels, n_samples) with a 10 Hz rhythm on a channel by the label (0 or 1)"""
+    rng = np.random.default_rng(seed)
+    labels = [i % 2 for i in range(n_trials)]
+    rhythm = 20 * np.sin(2 * np.pi * 10 * np.arange(n_samples) / sfreq)
+    trials = []
+    for label in labels:
+        trial = rng.normal(0, 10, (n_channels, n_samples))
+        trial[label] += rhythm
+        trials.append(trial)
+
+    return trials, labels
+
+
+def run_benchmarks(channels: int = 13, sfreq: float = 125, trials: int = 60, trial_length: float = 4.,
+                   session_length: float = 600., buffer_time: float = 4., repeat: int = 10,
+                   only: Optional[List[str]] = None, dtype: str = 'float64') -> Dict[str, Dict[str, Any]]:
+    """
+    Benchmark the hot paths on synthetic data, without a board or a display.
+
+    The board methods run on board data of the simulated Cyton-Daisy layout, `session_length` seconds long.
+    The laplacian and the online pipe need the channels of the headset, so they use its 13 channels.
+    The model runs on `trials` trials of `channels` channels.
+
+    :param channels: the channels of the model trials
+    :param sfreq: the sampling rate of the synthetic data
+    :param trials: the number of trials of the session & the model
+    :param trial_length: the trial length in seconds
+    :param session_length: the session length in seconds
+    :param buffer_time: the online prediction window in seconds
+    :param repeat: the measurements of each benchmark
+    :param only: the names of the benchmarks to run, all by default
+    :param dtype: the samples type of the EEG & the model, 'float32' for the single precision mode
+    :return: the statistics of each benchmark, or the error if it failed
+    """
+    eeg = SimulatedEEG(seed=0, dtype=dtype)
+    eeg.sfreq = sfreq
+    board_data = synthetic_board_data(eeg, trials, trial_length, session_length, sfreq)
+    markers = board_data[eeg.marker_row][board_data[eeg.marker_row] != 0]
+    names = list(HEADSETS[eeg.headset])
+    window = board_data[eeg.get_board_channels(), :int(buffer_time * sfreq)].astype(dtype)
+    window_board, channels_rows = board_data[:, :int(buffer_time * sfreq)], eeg.get_board_channels()
+
+    # Shared ring of the stream hub, a poll of the producer is 20 ms of board data
+    ring = SharedRing.create(board_data.shape[0], int(10 * sfreq), sfreq)
+    poll = board_data[:, :max(int(0.02 * sfreq), 1)]
+
+    # Trained model
+    model_trials, labels = synthetic_trials(trials, channels, int(trial_length * sfreq), sfreq)
+    model_trials = [trial.astype(dtype) for trial in model_trials]
+    model = MLModel(model_trials, labels, sfreq=sfreq, dtype=dtype)
+    model.offline_training(eeg=None)
+    model_window = model_trials[0][:, :int(buffer_time * sfreq)]
+
+    # The online experiment for its features pipe (constructed headless, nothing is displayed)
+    from bci4als.experiments.online import OnlineExperiment
+    online = OnlineExperiment(eeg=eeg, model=model, num_trials=1, buffer_time=buffer_time, threshold=3,
+                              audio=False, headless=True)
+
+    benchmarks = {
+        'EEG.extract_trials': lambda: measure(lambda _: eeg.extract_trials(board_data), repeat),
+        'EEG.decode_marker': lambda: measure(lambda _: [EEG.decode_marker(m) for m in markers], repeat,
+                                             number=10),
+        'EEG.laplacian': lambda: measure(lambda data: EEG.laplacian(data, names), repeat, number=10,
+                                         setup=window.copy),
+        'EEG._numpy_to_df': lambda: measure(lambda _: eeg._numpy_to_df(board_data), repeat),
+        'EEG._board_to_data': lambda: measure(lambda _: eeg._board_to_data(window_board, channels_rows, names),
+                                              repeat, number=10),
+        'EEGData.to_mne': lambda: measure(lambda _: eeg._board_to_data(window_board, channels_rows, names).to_mne(),
+                                          repeat),
+        'StreamConsumer.read': lambda: measure(lambda consumer: (ring.write(poll), consumer.read()), repeat,
+                                               number=100, setup=lambda: StreamConsumer(ring)),
+        'SignalQualityMonitor.update': lambda: measure(lambda monitor: monitor.update(poll[channels_rows]), repeat,
+                                                       number=100, setup=lambda: SignalQualityMonitor(sfreq, names)),
+        'MLModel._csp_lda': lambda: measure(lambda _: model._csp_lda(None), repeat),
+        'MLModel.online_predict': lambda: measure(lambda _: model.online_predict(model_window, eeg), repeat,
+                                                  number=10),
+        'MLModel.partial_fit': lambda: measure(lambda m: m.partial_fit(None, model_window, 0), repeat,
+                                               setup=lambda: copy.deepcopy(model)),
+        'OnlineExperiment.online_pipe': lambda: measure(lambda _: online.online_pipe(window), repeat),
+    }
+
+    results = {}
+    for name, benchmark in benchmarks.items():
+        if only is not None and name not in only:
+            continue
+        try:
+            results[name] = benchmark()
+        except Exception as e:
+            results[name] = {'error': f'{type(e).__name__}: {e}'}
+            traceback.print_exc()
+    ring.close()
+
+    return results
+
+
+def run_board_rate_benchmarks(rates=BOARD_RATES, channels: int = 13, trials: int = 60, trial_length: float = 4.,
+                              buffer_time: float = 4., repeat: int = 10) -> Dict[str, Dict[str, Any]]:
+    """
+    Benchmark the cost of a decision and of a retrain at each board rate, with and without the decimation.
+
+    A decision is the acquisition of a new window (decimated by the streaming decimator of the EEG when
+    decimating) and the model prediction. A retrain is the training of the model on all the trials.
+
+    :param rates: the board sampling rates
+    :param channels, trials, trial_length, buffer_time, repeat: see `run_benchmarks`
+    :return: the statistics of `decision@<rate>Hz`, `retrain@<rate>Hz` and of their `+decimate` versions
+    """
+    results = {}
+    for rate in rates:
+        model_trials, labels = synthetic_trials(trials, channels, int(trial_length * rate), rate)
+        window = model_trials[0][:, :int(buffer_time * rate)]
+
+        for decimate in (False, True):
+            suffix = '+decimate' if decimate else ''
+            eeg = SimulatedEEG(seed=0)
+            eeg.sfreq = rate
+            if decimate:
+                eeg.decimator = Decimator(rate, h_freq=H_FREQ)
+
+            model = MLModel(model_trials, labels, sfreq=rate, decimate=decimate)
+            try:
+                model.offline_training(eeg)
+
+                def decision(_):
+                    data = window if eeg.decimator is None else eeg.decimator.process(window)
+                    return model.online_predict(data, eeg)
+
+                results[f'decision@{rate:g}Hz{suffix}'] = measure(decision, repeat)
+                results[f'retrain@{rate:g}Hz{suffix}'] = measure(lambda _: model._csp_lda(eeg), repeat)
+            except Exception as e:
+                results[f'decision@{rate:g}Hz{suffix}'] = {'error': f'{type(e).__name__}: {e}'}
+                traceback.print_exc()
+
+    return results
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(__file__), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_results(results: Dict[str, Dict[str, Any]], path: str, sizes: Dict[str, Any]):
+    """Save the benchmark results with the sizes, the commit and the platform"""
+    report = {'created': datetime.now().isoformat(), 'commit': _git_commit(), 'python': platform.python_version(),
+              'numpy': np.__version__, 'platform': platform.platform(), 'sizes': sizes, 'results': results}
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as file:
+        json.dump(report, file, indent=2)
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any]) -> Dict[str, Optional[float]]:
+    """
+    Compare two benchmark reports.
+    :return: the speedup (baseline median / current median) of each benchmark in both reports
+    """
+    speedups = {}
+    for name, result in current['results'].items():
+        base = baseline['results'].get(name, {})
+        if 'median_ms' in base and 'median_ms' in result:
+            speedups[name] = base['median_ms'] / result['median_ms']
+
+    return speedups
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Benchmark the hot paths on synthetic data')
+    parser.add_argument('--channels', type=int, default=DEFAULT_SIZES['channels'], help='channels of the model')
+    parser.add_argument('--sfreq', type=float, default=DEFAULT_SIZES['sfreq'], help='the sampling rate')
+    parser.add_argument('--trials', type=int, default=DEFAULT_SIZES['trials'], help='the number of trials')
+    parser.add_argument('--trial-length', type=float, default=DEFAULT_SIZES['trial_length'], help='in seconds')
+    parser.add_argument('--session-length', type=float, default=DEFAULT_SIZES['session_length'], help='in seconds')
+    parser.add_argument('--buffer-time', type=float, default=DEFAULT_SIZES['buffer_time'], help='in seconds')
+    parser.add_argument('--dtype', choices=['float64', 'float32'], default=DEFAULT_SIZES['dtype'],
+                        help='the samples type (float32 for the single precision mode)')
+    parser.add_argument('--repeat', type=int, default=10, help='the measurements of each benchmark')
+    parser.add_argument('--only', nargs='*', help='the benchmarks to run, e.g. EEG.laplacian')
+    parser.add_argument('--board-rates', nargs='*', type=float,
+                        help=f'benchmark the decision cost at these board rates (default {list(BOARD_RATES)})')
+    parser.add_argument('--output', default=os.path.join('benchmarks', 'results.json'), help='the JSON report')
+    parser.add_argument('--compare', help='a previous JSON report to compare with')
+    args = parser.parse_args(argv)
+
+    sizes = {'channels': args.channels, 'sfreq': args.sfreq, 'trials': args.trials,
+             'trial_length': args.trial_length, 'session_length': args.session_length,
+             'buffer_time': args.buffer_time, 'dtype': args.dtype}
+    results = run_benchmarks(**sizes, repeat=args.repeat, only=args.only)
+    if args.board_rates is not None:
+        results.update(run_board_rate_benchmarks(args.board_rates or BOARD_RATES, channels=args.channels,
+                                                 trials=args.trials, trial_length=args.trial_length,
+                                                 buffer_time=args.buffer_time, repeat=args.repeat))
+    save_results(results, args.output, sizes)
+
+    speedups = {}
+    if args.compare:
+        with open(args.compare) as file:
+            speedups = compare(json.load(file), {'results': results})
+
+    for name, result in results.items():
+        line = result['error'] if 'error' in result else f"{result['median_ms']:10.3f} ms"
+        if name in speedups:
+            line += f'  (x{speedups[name]:.2f})'
+        print(f'{name:30s} {line}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+from typing import List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from nptyping import NDArray
+
+
+class EpochBuffer:
+    """
+    Growable buffer of epochs in one contiguous array with the shape (capacity, n_channels, n_samples).
+
+    Appending copies the epoch into the preallocated array, and the capacity doubles when it is full,
+    so adding an epoch is amortized O(1) and the epochs are never re-stacked. Epochs may have different
+    lengths: the samples dimension grows to the longest epoch, and the shorter epochs are zero padded
+    (see `lengths` & `mask`).
+
+    Usage:
+        buffer = EpochBuffer(capacity=64)
+        buffer.append(trial, label)
+        X, y = buffer.epochs(), buffer.labels
+
+    Attributes:
+
+        capacity (int):
+            The number of epochs the buffer can hold before growing.
+
+        dtype:
+            The samples type.
+    """
+
+    def __init__(self, n_channels: Optional[int] = None, n_samples: int = 0, capacity: int = 16, dtype=np.float64):
+
+        self.dtype = np.dtype(dtype)
+        self._data: Optional[NDArray] = None
+        self._labels: NDArray = np.zeros(capacity, dtype=np.int64)
+        self._lengths: NDArray = np.zeros(capacity, dtype=np.int64)
+        self._n: int = 0
+        if n_channels is not None:
+            self._data = np.zeros((capacity, n_channels, n_samples), dtype=self.dtype)
+
+    @property
+    def capacity(self) -> int:
+        return len(self._labels)
+
+    @property
+    def n_channels(self) -> Optional[int]:
+        return None if self._data is None else self._data.shape[1]
+
+    @property
+    def n_samples(self) -> int:
+        """The samples dimension of the buffer (the longest epoch)"""
+        return 0 if self._data is None else self._data.shape[2]
+
+    def __len__(self) -> int:
+        return self._n
+
+    def __getitem__(self, i: int) -> NDArray:
+        """Return view of the epoch i, without the padding"""
+        if not -self._n <= i < self._n:
+            raise IndexError(f'Epoch {i} out of range, the buffer has {self._n} epochs')
+        i %= self._n
+        return self._data[i, :, :self._lengths[i]]
+
+    @property
+    def data(self) -> NDArray:
+        """View of the epochs with the padding, (n_epochs, n_channels, n_samples)"""
+        if self._data is None:
+            return np.zeros((0, 0, 0), dtype=self.dtype)
+        return self._data[:self._n]
+
+    @property
+    def labels(self) -> NDArray:
+        """View of the labels of the epochs"""
+        return self._labels[:self._n]
+
+    @property
+    def lengths(self) -> NDArray:
+        """View of the number of valid samples of each epoch"""
+        return self._lengths[:self._n]
+
+    @property
+    def mask(self) -> NDArray:
+        """The valid samples (not padding), (n_epochs, n_samples) boolean array"""
+        return np.arange(self.n_samples) < self.lengths[:, np.newaxis]
+
+    def _grow(self, capacity: int, n_samples: int):
+        """Reallocate the buffer with at least the given capacity & samples"""
+        capacity, n_samples = max(capacity, self.capacity), max(n_samples, self.n_samples)
+        data = np.zeros((capacity, self._data.shape[1], n_samples), dtype=self.dtype)
+        data[:self._n, :, :self._data.shape[2]] = self._data[:self._n]
+        self._data = data
+
+        for name in ('_labels', '_lengths'):
+            array = np.zeros(capacity, dtype=np.int64)
+            array[:self._n] = getattr(self, name)[:self._n]
+            setattr(self, name, array)
+
+    def append(self, epoch, label: int):
+        """
+        Copy an epoch into the buffer.
+        :param epoch: array with the shape (n_channels, n_samples), or DataFrame (n_samples, n_channels)
+        :param label: the label of the epoch
+        """
+        # A DataFrame is (samples, channels), copy its values transposed without building a new frame
+        epoch = epoch.to_numpy().T if isinstance(epoch, pd.DataFrame) else np.asarray(epoch)
+        if epoch.ndim != 2:
+            raise ValueError(f'The epoch must be (n_channels, n_samples), got the shape {epoch.shape}')
+
+        if self._data is None:
+            self._data = np.zeros((self.capacity, epoch.shape[0], epoch.shape[1]), dtype=self.dtype)
+        elif epoch.shape[0] != self.n_channels:
+            raise ValueError(f'The epoch has {epoch.shape[0]} channels, the buffer has {self.n_channels}')
+
+        # Double the capacity when full, grow the samples to the longest epoch
+        if self._n == self.capacity or epoch.shape[1] > self.n_samples:
+            self._grow(2 * self.capacity if self._n == self.capacity else self.capacity, epoch.shape[1])
+
+        self._data[self._n, :, :epoch.shape[1]] = epoch
+        self._data[self._n, :, epoch.shape[1]:] = 0
+        self._labels[self._n] = label
+        self._lengths[self._n] = epoch.shape[1]
+        self._n += 1
+
+    def extend(self, epochs: Sequence, labels: Sequence[int]):
+        """Copy many epochs into the buffer, allocating once"""
+        if len(epochs) != len(labels):
+            raise ValueError(f'{len(epochs)} epochs but {len(labels)} labels')
+
+        if self._data is not None and self._n + len(epochs) > self.capacity:
+            self._grow(self._n + len(epochs), 0)
+        elif self._data is None and len(epochs) > self.capacity:
+            self._labels = np.zeros(len(epochs), dtype=np.int64)
+            self._lengths = np.zeros(len(epochs), dtype=np.int64)
+
+        for epoch, label in zip(epochs, labels):
+            self.append(epoch, label)
+
+    def epochs(self, n_samples: Optional[int] = None) -> NDArray:
+        """
+        Return view of the epochs cut to the same length, without copy.
+        :param n_samples: the samples of each epoch, the shortest epoch length by default
+        :return: array with the shape (n_epochs, n_channels, n_samples)
+        """
+        shortest = int(self.lengths.min()) if self._n else 0
+        n_samples = shortest if n_samples is None else n_samples
+        if n_samples > shortest:
+            raise ValueError(f'{n_samples} samples requested, the shortest epoch has {shortest}')
+
+        return self.data[:, :, :n_samples]
+
+    def to_list(self) -> List[NDArray]:
+        """Return the epochs as list of views, without the padding"""
+        return [self[i] for i in range(self._n)]
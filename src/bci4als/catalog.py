@@ -0,0 +1,213 @@
+import json
+import os
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from bci4als.eeg import HEADSETS
+from bci4als.experiments.event_log import EVENTS_FILE, load_results
+from bci4als.storage import LABELS_FILE, STORE_DIR, read_metadata_channels
+
+# Name of the index cache file inside the recordings folder
+CATALOG_FILE = '.catalog.json'
+
+# Bump when the index entries change, old caches are rebuilt
+CATALOG_VERSION = 1
+
+
+def session_ids(subject_folder: str) -> List[int]:
+    """Return the numbers of the session folders in the subject folder"""
+    ids = []
+    for f in os.listdir(subject_folder):
+
+        # Skip files and sessions folders which are not integer
+        if f.isdigit() and os.path.isdir(os.path.join(subject_folder, f)):
+            ids.append(int(f))
+
+    return sorted(ids)
+
+
+def read_metadata(session_directory: str) -> Dict[str, str]:
+    """
+    Parse the `key: value` lines of the `metadata.txt` of the session.
+    :param session_directory: path to the session folder
+    :return: dict of the metadata values, empty if the session has no metadata
+    """
+    path = os.path.join(session_directory, 'metadata.txt')
+    if not os.path.isfile(path):
+        return {}
+
+    metadata = {}
+    with open(path) as file:
+        for line in file:
+            if ':' in line and not line.startswith('Channel '):
+                key, value = line.split(':', 1)
+                metadata[key.strip()] = value.strip()
+
+    return metadata
+
+
+def _session_mtime(session_directory: str) -> float:
+    """The newest modification time of the session folder and its files"""
+    mtimes = [os.stat(session_directory).st_mtime]
+    mtimes += [entry.stat().st_mtime for entry in os.scandir(session_directory)]
+    return max(mtimes)
+
+
+def index_session(session_directory: str) -> Dict[str, Any]:
+    """
+    Build the catalog entry of a session, without loading the pickle files.
+    :param session_directory: path to the session folder
+    :return: the session entry
+    """
+    files = {entry.name: entry.stat().st_size if entry.is_file() else
+             sum(f.stat().st_size for f in os.scandir(entry.path) if f.is_file())
+             for entry in os.scandir(session_directory)}
+    metadata = read_metadata(session_directory)
+    channels = read_metadata_channels(session_directory)
+
+    # Old sessions have no headset line, identify the headset by the channels
+    headset = metadata.get('Headset')
+    if headset is None and channels is not None:
+        headset = next((name for name, names in HEADSETS.items() if names == channels), None)
+
+    # Old sessions have no experiment type line, identify the type by the files
+    experiment_type = metadata.get('Experiment Type')
+    if experiment_type is None:
+        if EVENTS_FILE in files or 'results.json' in files:
+            experiment_type = 'Online'
+        elif 'labels.csv' in files or STORE_DIR in files:
+            experiment_type = 'Offline'
+
+    # The labels of offline sessions are the trials labels, and the targets of online sessions
+    labels: Optional[List[int]] = None
+    if EVENTS_FILE in files or 'results.json' in files:
+        labels = [trial[0][0] for trial in load_results(session_directory) if trial]
+    elif STORE_DIR in files:
+        labels = np.load(os.path.join(session_directory, STORE_DIR, LABELS_FILE)).tolist()
+    elif 'labels.csv' in files:
+        with open(os.path.join(session_directory, 'labels.csv')) as file:
+            labels = [int(float(line)) for line in file if line.strip()]
+
+    return {'subject': os.path.basename(os.path.dirname(session_directory)),
+            'session': os.path.basename(session_directory),
+            'experiment_type': experiment_type,
+            'datetime': metadata.get('Experiment datetime'),
+            'headset': headset,
+            'channels': channels,
+            'n_trials': len(labels) if labels is not None else None,
+            'label_counts': {str(k): v for k, v in sorted(Counter(labels or []).items())},
+            'files': files,
+            'size': sum(files.values()),
+            'mtime': _session_mtime(session_directory)}
+
+
+class Catalog:
+    """
+    Index of all the sessions in the recordings folder (root/<subject>/<session>).
+
+    The index is cached in the recordings folder and every `refresh` re-indexes only the
+    sessions which changed since they were indexed (by modification time).
+
+    Usage:
+        catalog = Catalog('../recordings')
+        catalog.query(subject='avi', experiment_type='Offline', min_trials=20, headset='avi13')
+
+    Attributes:
+
+        root (str):
+            The recordings folder.
+
+        sessions (Dict[str, Dict[str, Any]]):
+            The entry of each session by the session path relative to the root ('<subject>/<session>').
+    """
+
+    def __init__(self, root: str, cache: bool = True):
+
+        self.root: str = root
+        self.cache_path: Optional[str] = os.path.join(root, CATALOG_FILE) if cache else None
+        self.sessions: Dict[str, Dict[str, Any]] = self._load_cache()
+        self.refresh()
+
+    def _load_cache(self) -> Dict[str, Dict[str, Any]]:
+        if self.cache_path is None or not os.path.isfile(self.cache_path):
+            return {}
+
+        try:
+            with open(self.cache_path) as file:
+                cache = json.load(file)
+        except ValueError:
+            return {}
+
+        return cache['sessions'] if cache.get('version') == CATALOG_VERSION else {}
+
+    def _save_cache(self):
+        if self.cache_path is None:
+            return
+
+        # Replace the cache at once, so a crash never leaves a partial file
+        tmp_path = self.cache_path + '.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump({'version': CATALOG_VERSION, 'sessions': self.sessions}, file)
+        os.replace(tmp_path, self.cache_path)
+
+    def refresh(self) -> int:
+        """
+        Index the new and changed sessions and drop the deleted sessions.
+        :return: the number of sessions indexed
+        """
+        found, indexed = set(), 0
+        for subject in sorted(os.listdir(self.root)):
+            subject_dir = os.path.join(self.root, subject)
+            if not os.path.isdir(subject_dir) or subject.startswith('.'):
+                continue
+
+            for session in os.listdir(subject_dir):
+                session_dir = os.path.join(subject_dir, session)
+                if not os.path.isdir(session_dir):
+                    continue
+
+                key = f'{subject}/{session}'
+                found.add(key)
+                entry = self.sessions.get(key)
+                if entry is None or entry['mtime'] != _session_mtime(session_dir):
+                    self.sessions[key] = index_session(session_dir)
+                    indexed += 1
+
+        removed = set(self.sessions) - found
+        for key in removed:
+            del self.sessions[key]
+
+        if indexed or removed:
+            self._save_cache()
+
+        return indexed
+
+    def path(self, entry: Dict[str, Any]) -> str:
+        """Return the session directory of the entry"""
+        return os.path.join(self.root, entry['subject'], entry['session'])
+
+    def query(self, subject: Optional[str] = None, experiment_type: Optional[str] = None,
+              headset: Optional[str] = None, min_trials: Optional[int] = None,
+              label: Optional[int] = None, has_file: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Return the sessions entries which match all the given conditions, ordered by subject & session.
+        :param subject: the subject name
+        :param experiment_type: 'Offline' or 'Online' (case insensitive)
+        :param headset: the headset name
+        :param min_trials: the minimum number of trials
+        :param label: sessions with at least one trial of the label
+        :param has_file: sessions with the file (or folder), e.g. 'trials.pickle' or 'store'
+        :return: list of the matching entries
+        """
+        def match(entry: Dict[str, Any]) -> bool:
+            return ((subject is None or entry['subject'] == subject) and
+                    (experiment_type is None or (entry['experiment_type'] or '').lower() == experiment_type.lower()) and
+                    (headset is None or entry['headset'] == headset) and
+                    (min_trials is None or (entry['n_trials'] or 0) >= min_trials) and
+                    (label is None or str(label) in entry['label_counts']) and
+                    (has_file is None or has_file in entry['files']))
+
+        entries = [e for e in self.sessions.values() if match(e)]
+        return sorted(entries, key=lambda e: (e['subject'], int(e['session']) if e['session'].isdigit() else 0,
+                                              e['session']))
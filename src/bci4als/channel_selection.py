@@ -0,0 +1,154 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from bci4als.dataset import preprocess_epochs
+from bci4als.eeg import EEG
+from bci4als.ml_model import MLModel
+from nptyping import NDArray
+from sklearn.model_selection import StratifiedKFold, cross_validate
+
+# The epochs of the worker processes, sent once when the pool starts
+_worker_data: Dict[str, object] = {}
+
+
+def _init_worker(X: NDArray, y: NDArray, n_folds: int, reference: Optional[str]):
+    _worker_data.update(X=X, y=y, n_folds=n_folds, reference=reference)
+
+
+def _score(channels: Sequence[int]) -> Tuple[float, float, float]:
+    """
+    Cross validate the CSP & LDA pipeline on the channels of the worker epochs.
+    :return: the accuracy mean & std and the log loss, which separates montages with the same accuracy
+    """
+    X, y = _worker_data['X'][:, list(channels)], _worker_data['y']
+    if _worker_data['reference'] == 'average':
+        X = X - X.mean(axis=1, keepdims=True)
+
+    cv = StratifiedKFold(_worker_data['n_folds'], shuffle=True, random_state=0)
+    scores = cross_validate(MLModel.csp_lda_pipeline(min(6, len(channels))), X, y, cv=cv,
+                            scoring=('accuracy', 'neg_log_loss'))
+    return float(scores['test_accuracy'].mean()), float(scores['test_accuracy'].std()), \
+        float(-scores['test_neg_log_loss'].mean())
+
+
+class ChannelRanking:
+    """
+    The channels ranked by their contribution to the CSP & LDA decision, and the cross validated
+    accuracy of the montage of each size.
+
+    Attributes:
+
+        ch_names (List[str]):
+            The channels of the full montage, in the data order.
+
+        ranking (List[str]):
+            The channels from the most to the least important.
+
+        report (pd.DataFrame):
+            The accuracy versus channels report: n_channels, channels, cv_mean, cv_std & log_loss of each
+            montage, from the full montage to the smallest.
+    """
+
+    def __init__(self, ch_names: List[str], ranking: List[str], report: pd.DataFrame):
+        self.ch_names: List[str] = list(ch_names)
+        self.ranking: List[str] = list(ranking)
+        self.report: pd.DataFrame = report
+
+    def top(self, k: int) -> List[str]:
+        """Return the k most important channels, in the data order"""
+        top = set(self.ranking[:k])
+        return [ch for ch in self.ch_names if ch in top]
+
+    def indices(self, k: int) -> List[int]:
+        """Return the indices (in the full montage) of the k most important channels"""
+        return [self.ch_names.index(ch) for ch in self.top(k)]
+
+    def best_k(self, tolerance: float = 0.) -> int:
+        """Return the fewest channels with accuracy within `tolerance` of the best montage"""
+        report = self.report
+        good = report[report['cv_mean'] >= report['cv_mean'].max() - tolerance]
+        return int(good['n_channels'].min())
+
+
+def rank_channels(epochs: NDArray, labels: Sequence[int], sfreq: float, ch_names: List[str], n_folds: int = 5,
+                  min_channels: int = 2, workers: Optional[int] = None, l_freq: Optional[float] = 7.,
+                  h_freq: Optional[float] = 30., tmin: Optional[float] = None, tmax: Optional[float] = None,
+                  reference: Optional[str] = None) -> ChannelRanking:
+    """
+    Rank the channels by cross validated backward elimination: starting from all the channels, each step
+    removes the channel without which the CSP & LDA accuracy is the highest, until `min_channels` are left.
+    The candidates of each step are cross validated in parallel.
+
+    The band-pass filter is applied once, for all the channels (it is per channel), the common average
+    reference (if asked) is computed on each montage.
+
+    :param epochs: the raw epochs, (n_epochs, n_channels, n_samples)
+    :param labels: the label of each epoch
+    :param sfreq: the sampling rate
+    :param ch_names: the channel names of the epochs
+    :param n_folds: the cross validation folds (no more than the trials of the rarest label)
+    :param min_channels: the channels left at the end of the elimination
+    :param workers: the worker processes, all the CPUs by default, 1 to run in this process
+    :param l_freq, h_freq, tmin, tmax, reference: the preprocessing, see `preprocess_epochs`
+    :return: the ranking and the accuracy versus channels report
+    """
+    X = preprocess_epochs(epochs, sfreq, l_freq=l_freq, h_freq=h_freq, tmin=tmin, tmax=tmax)
+    y = np.asarray(labels)
+    n_folds = int(min(n_folds, np.unique(y, return_counts=True)[1].min()))
+    if n_folds < 2:
+        raise ValueError('Ranking the channels needs at least 2 trials of each label')
+
+    # The epochs are sent to each worker once, the tasks are only the channels
+    pool = None
+    if (workers or os.cpu_count()) > 1:
+        pool = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(X, y, n_folds, reference))
+        score = pool.map
+    else:
+        _init_worker(X, y, n_folds, reference)
+        score = map
+
+    try:
+        remaining = list(range(X.shape[1]))
+        rows = [(len(remaining), *next(iter(score(_score, [remaining]))), list(remaining))]
+        removed = []
+
+        while len(remaining) > min_channels:
+            candidates = [[c for c in remaining if c != channel] for channel in remaining]
+            scores = list(score(_score, candidates))
+
+            # Remove the channel whose removal hurts the accuracy the least (then the log loss)
+            best = max(range(len(scores)), key=lambda i: (scores[i][0], -scores[i][2]))
+            removed.append(remaining[best])
+            remaining = candidates[best]
+            rows.append((len(remaining), *scores[best], list(remaining)))
+            print(f'{len(remaining)} channels: removed {ch_names[removed[-1]]}, accuracy {scores[best][0]:.3f}')
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    report = pd.DataFrame([{'n_channels': n, 'channels': [ch_names[c] for c in channels],
+                            'cv_mean': mean, 'cv_std': std, 'log_loss': loss}
+                           for n, mean, std, loss, channels in rows])
+    ranking = [ch_names[c] for c in remaining] + [ch_names[c] for c in reversed(removed)]
+
+    return ChannelRanking(ch_names, ranking, report)
+
+
+def reduced_model(model: MLModel, ranking: ChannelRanking, k: int, eeg: Optional[EEG] = None) -> MLModel:
+    """
+    Train a copy of the model on the k most important channels only.
+    The model keeps the full montage trials and takes full montage windows for predictions, the
+    channels are selected inside.
+    :param model: the model with the trials of the full montage
+    :param ranking: the channels ranking of the montage
+    :param k: the number of channels
+    :param eeg: the EEG for the sampling rate, the model sampling rate by default
+    :return: the trained reduced model
+    """
+    reduced = MLModel(model.trials, model.labels, sfreq=model.sfreq, channels=ranking.indices(k), dtype=model.dtype)
+    reduced.decimate, reduced.decimation = model.decimate, model.decimation
+    reduced.offline_training(eeg)
+    return reduced
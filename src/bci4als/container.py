@@ -0,0 +1,127 @@
+from typing import List, Optional, Sequence
+
+import mne
+import numpy as np
+from bci4als.dataset import band_pass
+from nptyping import NDArray
+
+# The scale of each unit to volts, the unit of MNE
+UNITS = {'V': 1., 'uV': 1e-6}
+
+
+class EEGData:
+    """
+    Minimal container of EEG samples for the hot paths, instead of the MNE objects.
+
+    Building an MNE object validates the info and copies or scales the data on every call. The
+    container only keeps references: the samples array (a window or epochs), the channel names, the
+    sampling rate and the events. `to_mne` is the explicit bridge to MNE for plotting and export, and it
+    shares the samples when they are float64 volts.
+
+    Usage:
+        window = EEGData(data, ch_names, sfreq=125)
+        features = extract(window.filter(8, 30).get_data())
+        window.to_mne().plot()
+
+    Attributes:
+
+        data (NDArray):
+            The samples, (n_channels, n_samples) for a window or (n_epochs, n_channels, n_samples) for epochs.
+
+        ch_names (List[str]):
+            The channel names, in the data order.
+
+        sfreq (float):
+            The sampling rate.
+
+        events (NDArray):
+            The events in the MNE format (sample, 0, id) with the shape (n_events, 3), or None.
+            For epochs, one event per epoch with its label.
+
+        units (str):
+            The unit of the samples, 'uV' (BrainFlow) or 'V' (MNE).
+    """
+
+    __slots__ = ('data', 'ch_names', 'sfreq', 'events', 'units')
+
+    def __init__(self, data: NDArray, ch_names: Sequence[str], sfreq: float, events: Optional[NDArray] = None,
+                 units: str = 'uV'):
+
+        if data.ndim not in (2, 3) or data.shape[-2] != len(ch_names):
+            raise ValueError(f'The data shape {data.shape} does not match {len(ch_names)} channels')
+        if units not in UNITS:
+            raise ValueError(f'Unknown units `{units}`, use one of {list(UNITS)}')
+
+        self.data: NDArray = data
+        self.ch_names: List[str] = list(ch_names)
+        self.sfreq: float = sfreq
+        self.events: Optional[NDArray] = events
+        self.units: str = units
+
+    @classmethod
+    def from_epochs(cls, epochs: NDArray, labels: Sequence[int], ch_names: Sequence[str], sfreq: float,
+                    units: str = 'uV') -> 'EEGData':
+        """Return container of epochs, with an event of each epoch by its label"""
+        events = np.zeros((len(labels), 3), dtype=np.int64)
+        events[:, 0] = np.arange(len(labels)) * epochs.shape[-1]
+        events[:, 2] = labels
+        return cls(epochs, ch_names, sfreq, events=events, units=units)
+
+    @property
+    def epoched(self) -> bool:
+        return self.data.ndim == 3
+
+    @property
+    def n_channels(self) -> int:
+        return self.data.shape[-2]
+
+    @property
+    def n_samples(self) -> int:
+        return self.data.shape[-1]
+
+    @property
+    def times(self) -> NDArray:
+        return np.arange(self.n_samples) / self.sfreq
+
+    def get_data(self, picks: Optional[Sequence[str]] = None) -> NDArray:
+        """Return the samples (a view without picks), the same call as the MNE objects"""
+        if picks is None:
+            return self.data
+        return self.data[..., [self.ch_names.index(ch) for ch in picks], :]
+
+    def pick(self, ch_names: Sequence[str]) -> 'EEGData':
+        """Return container of the given channels only"""
+        return EEGData(self.get_data(ch_names), ch_names, self.sfreq, events=self.events, units=self.units)
+
+    def crop(self, tmin: Optional[float] = None, tmax: Optional[float] = None) -> 'EEGData':
+        """Return container of the samples between tmin & tmax seconds (a view), the events are not cropped"""
+        start = int(round(tmin * self.sfreq)) if tmin is not None else 0
+        stop = int(round(tmax * self.sfreq)) if tmax is not None else self.n_samples
+        return EEGData(self.data[..., start:stop], self.ch_names, self.sfreq, events=self.events, units=self.units)
+
+    def filter(self, l_freq: Optional[float], h_freq: Optional[float], pad: str = 'reflect_limited') -> 'EEGData':
+        """
+        Return container of the band-pass filtered samples, the filter of `mne.filter.filter_data`.
+        Unlike the MNE objects the container is not changed, float32 samples are filtered in float32.
+        """
+        data = band_pass(self.data, self.sfreq, l_freq, h_freq, pad=pad)
+        return EEGData(data, self.ch_names, self.sfreq, events=self.events, units=self.units)
+
+    def to_mne(self):
+        """
+        Return the MNE object of the samples, `mne.io.RawArray` for a window or `mne.EpochsArray` for epochs.
+        The MNE object shares the samples when they are float64 volts, otherwise the samples are
+        converted (a copy).
+        """
+        data = self.data
+        if self.units != 'V' or data.dtype != np.float64:
+            data = np.multiply(data, UNITS[self.units], dtype=np.float64)
+
+        info = mne.create_info(ch_names=self.ch_names, sfreq=self.sfreq, ch_types='eeg')
+        if not self.epoched:
+            return mne.io.RawArray(data, info, verbose=False)
+
+        event_id = None
+        if self.events is not None:
+            event_id = {str(label): int(label) for label in np.unique(self.events[:, 2])}
+        return mne.EpochsArray(data, info, events=self.events, event_id=event_id, verbose=False)
@@ -0,0 +1,325 @@
+import hashlib
+import json
+import os
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import mne
+import numpy as np
+from scipy.signal import oaconvolve
+from bci4als.storage import STORE_DIR, SessionStore, load_legacy_session
+from nptyping import NDArray
+
+# Default preprocessing, the same as the CSP & LDA training
+DEFAULT_PREPROCESSING = {'l_freq': 7., 'h_freq': 30., 'tmin': None, 'tmax': None, 'reference': None}
+
+# The sampling rate of the sessions saved before the store format (not recorded), the Cyton-Daisy rate
+LEGACY_SFREQ = 125
+
+# The maximal relative error of the single precision processing against the double precision
+FLOAT32_TOLERANCE = 1e-4
+
+
+def band_pass(data: NDArray, sfreq: float, l_freq: Optional[float], h_freq: Optional[float],
+              pad: str = 'reflect_limited') -> NDArray:
+    """
+    Zero phase FIR band-pass filter of the last axis, the filter of `mne.filter.filter_data`.
+    MNE filters float64 only: float32 data is filtered in single precision with the same filter (designed
+    by MNE), so the samples are not copied to float64.
+    :param data: array with the samples in the last axis, float32 or float64
+    :param sfreq: the sampling rate
+    :param l_freq, h_freq: the band edges (None for low-pass / high-pass)
+    :param pad: the padding of the edges, 'reflect_limited' or a `np.pad` mode (as in MNE)
+    :return: the filtered data, with the data type of the data (float32 or float64)
+    """
+    if data.dtype != np.float32:
+        return mne.filter.filter_data(np.asarray(data, dtype=np.float64), sfreq, l_freq, h_freq,
+                                      fir_design='firwin', pad=pad, verbose=False)
+
+    h = mne.filter.create_filter(None, sfreq, l_freq, h_freq, fir_design='firwin', verbose=False)
+    h = h.astype(np.float32)
+
+    # Pad the edges like MNE (`reflect_limited` is odd reflection, which fits since the pad is shorter than
+    # the data), convolve and keep the samples of the data, shifted back by the filter delay
+    n_samples = data.shape[-1]
+    n_edge = max(min(len(h), n_samples) - 1, 0)
+    widths = [(0, 0)] * (data.ndim - 1) + [(n_edge, n_edge)]
+    if pad == 'reflect_limited':
+        padded = np.pad(data, widths, mode='reflect', reflect_type='odd')
+    else:
+        padded = np.pad(data, widths, mode=pad)
+
+    h = h.reshape((1,) * (data.ndim - 1) + (-1,))
+    shift = (len(h.ravel()) - 1) // 2 + n_edge
+    return oaconvolve(padded, h, mode='full', axes=-1)[..., shift:shift + n_samples]
+
+
+def preprocess_epochs(epochs: NDArray, sfreq: float, l_freq: Optional[float] = 7., h_freq: Optional[float] = 30.,
+                      tmin: Optional[float] = None, tmax: Optional[float] = None,
+                      reference: Optional[str] = None, dtype=np.float64) -> NDArray:
+    """
+    Preprocess the epochs: band-pass filter, crop and spatial filter.
+    :param epochs: array with the shape (n_epochs, n_channels, n_samples)
+    :param sfreq: the sampling rate
+    :param l_freq: the low cut frequency of the band-pass filter (None for low-pass)
+    :param h_freq: the high cut frequency of the band-pass filter (None for high-pass)
+    :param tmin: the crop start in seconds from the epoch start (after filtering, so the edges are cut)
+    :param tmax: the crop end in seconds from the epoch start
+    :param reference: 'average' for common average reference, None to keep the data reference
+    :param dtype: the samples type of the preprocessing, float64 or float32 (single precision)
+    :return: the preprocessed epochs
+    """
+    epochs = np.asarray(epochs, dtype=dtype)
+
+    # Band-pass filter, the same filter `mne.Epochs.filter` applies
+    if l_freq is not None or h_freq is not None:
+        epochs = band_pass(epochs, sfreq, l_freq, h_freq, pad='edge')
+
+    # Crop
+    start = int(round(tmin * sfreq)) if tmin is not None else 0
+    stop = int(round(tmax * sfreq)) if tmax is not None else epochs.shape[2]
+    epochs = epochs[:, :, start:stop]
+
+    # Spatial filter
+    if reference == 'average':
+        epochs = epochs - epochs.mean(axis=1, keepdims=True)
+    elif reference is not None:
+        raise ValueError(f'Unknown reference `{reference}`')
+
+    return np.ascontiguousarray(epochs)
+
+
+class EpochCache:
+    """
+    On-disk cache of preprocessed epochs.
+
+    The key of the cached epochs is a hash of the raw epochs content and the preprocessing params,
+    so a change in the data or in the params is never served from the cache. When the cache grows
+    above `max_bytes` the least recently used entries are removed.
+
+    Attributes:
+
+        directory (str):
+            The cache folder.
+
+        max_bytes (int):
+            The maximal size of the cache.
+
+        hits (int):
+            The number of epochs arrays loaded from the cache.
+
+        misses (int):
+            The number of epochs arrays preprocessed and added to the cache.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 2 * 1024 ** 3):
+
+        self.directory: str = directory
+        self.max_bytes: int = max_bytes
+        self.hits: int = 0
+        self.misses: int = 0
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(epochs: NDArray, sfreq: float, params: Dict[str, Any]) -> str:
+        """Return the cache key of the raw epochs and the preprocessing params"""
+        epochs = np.ascontiguousarray(epochs)
+        digest = hashlib.sha1()
+        digest.update(json.dumps({'shape': epochs.shape, 'dtype': epochs.dtype.str, 'sfreq': sfreq,
+                                  'params': params}, sort_keys=True).encode())
+        digest.update(memoryview(epochs).cast('B'))
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f'{key}.npy')
+
+    def get(self, key: str) -> Optional[NDArray]:
+        """Return the cached epochs (memory mapped) or None if the key is not in the cache"""
+        path = self._path(key)
+        if not os.path.isfile(path):
+            return None
+
+        # Mark the entry as recently used
+        os.utime(path)
+        return np.load(path, mmap_mode='r')
+
+    def put(self, key: str, epochs: NDArray):
+        """Add the epochs to the cache and evict old entries if the cache is too big"""
+        tmp_path = self._path(key) + '.tmp'
+        with open(tmp_path, 'wb') as file:
+            np.save(file, epochs)
+        os.replace(tmp_path, self._path(key))
+        self._evict()
+
+    def _evict(self):
+        entries = [e for e in os.scandir(self.directory) if e.name.endswith('.npy')]
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        size = sum(e.stat().st_size for e in entries)
+
+        # Remove the least recently used entries, but never the newest
+        for entry in entries[:-1]:
+            if size <= self.max_bytes:
+                break
+            size -= entry.stat().st_size
+            os.remove(entry.path)
+
+    def preprocess(self, epochs: NDArray, sfreq: float, **params) -> NDArray:
+        """
+        Return the preprocessed epochs from the cache, or preprocess them and add them to the cache.
+        :param epochs: the raw epochs with the shape (n_epochs, n_channels, n_samples)
+        :param sfreq: the sampling rate
+        :param params: the params of `preprocess_epochs`
+        :return: the preprocessed epochs
+        """
+        params = {**DEFAULT_PREPROCESSING, **params}
+        key = self.key(epochs, sfreq, params)
+
+        cached = self.get(key)
+        if cached is not None:
+            self.hits += 1
+            return cached
+
+        self.misses += 1
+        preprocessed = preprocess_epochs(epochs, sfreq, **params)
+        self.put(key, preprocessed)
+        return preprocessed
+
+
+class SessionDataset:
+    """
+    Epochs of several sessions (of one or more subjects) as one dataset.
+
+    The sessions are opened and preprocessed only when their epochs are needed, and the preprocessed
+    epochs are taken from the cache if one is given.
+
+    Usage:
+        catalog = Catalog('../recordings')
+        sessions = [catalog.path(e) for e in catalog.query(experiment_type='Offline', headset='avi13')]
+        dataset = SessionDataset(sessions, n_samples=480, cache=EpochCache('../cache'))
+        X, y = dataset.load()
+
+    Attributes:
+
+        sessions (List[str]):
+            The session directories.
+
+        ch_names (List[str]):
+            The channels of the epochs, by default the channels of the first session.
+            Every session must have all of the channels.
+
+        n_samples (int):
+            The number of raw samples of each epoch, by default the shortest trial of all the sessions.
+
+        sfreq (float):
+            The sampling rate of the sessions, recorded in the session stores (`LEGACY_SFREQ` for the old
+            sessions without it). All the sessions must have the same rate.
+
+        preprocessing (Dict[str, Any]):
+            The params of `preprocess_epochs`.
+    """
+
+    def __init__(self, sessions: List[str], ch_names: Optional[List[str]] = None, n_samples: Optional[int] = None,
+                 sfreq: Optional[float] = None, cache: Optional[EpochCache] = None, **preprocessing):
+
+        self.sessions: List[str] = list(sessions)
+        self.cache: Optional[EpochCache] = cache
+        self.preprocessing: Dict[str, Any] = {**DEFAULT_PREPROCESSING, **preprocessing}
+
+        self._raw: Dict[int, Tuple[Any, NDArray, List[str]]] = {}
+        self.ch_names: List[str] = ch_names if ch_names is not None else self._open(0)[2]
+
+        # The rate recorded in the first session, a given rate must agree with it
+        recorded = self._recorded_sfreq(0)
+        if sfreq is not None and sfreq != recorded:
+            raise ValueError(f'The sampling rate {sfreq:g} Hz disagrees with the {recorded:g} Hz recorded '
+                             f'in the session {self.sessions[0]}')
+        self.sfreq: float = recorded
+        self._n_samples: Optional[int] = n_samples
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+    def _open(self, index: int) -> Tuple[Any, NDArray, List[str]]:
+        """Return the trials (store or list of arrays), labels and channel names of the session"""
+        if index not in self._raw:
+            session = self.sessions[index]
+            if os.path.isdir(os.path.join(session, STORE_DIR)):
+                store = SessionStore(session)
+                self._raw[index] = (store, store.labels, store.ch_names)
+            else:
+                loaded = load_legacy_session(session)
+                if loaded is None or loaded[2] is None:
+                    raise ValueError(f'The session {session} has no trials with channel names')
+                trials, labels, ch_names = loaded
+                self._raw[index] = (trials, np.asarray(labels), ch_names)
+
+        return self._raw[index]
+
+    def _recorded_sfreq(self, index: int) -> float:
+        """The sampling rate recorded in the session store, `LEGACY_SFREQ` for the old sessions"""
+        trials = self._open(index)[0]
+        return float(trials.sfreq) if isinstance(trials, SessionStore) else float(LEGACY_SFREQ)
+
+    @property
+    def n_samples(self) -> int:
+        if self._n_samples is None:
+            self._n_samples = min(self._min_length(i) for i in range(len(self)))
+        return self._n_samples
+
+    def _min_length(self, index: int) -> int:
+        trials = self._open(index)[0]
+        return int(trials.lengths.min()) if isinstance(trials, SessionStore) else min(t.shape[1] for t in trials)
+
+    def raw_epochs(self, index: int) -> Tuple[NDArray, NDArray]:
+        """
+        Return the raw epochs and labels of a session.
+        :param index: the session index
+        :return: epochs with the shape (n_trials, n_channels, n_samples) and the labels
+        """
+        trials, labels, ch_names = self._open(index)
+        recorded = self._recorded_sfreq(index)
+        if recorded != self.sfreq:
+            raise ValueError(f'The session {self.sessions[index]} is recorded at {recorded:g} Hz, '
+                             f'the dataset at {self.sfreq:g} Hz')
+
+        missing = set(self.ch_names) - set(ch_names)
+        if missing:
+            raise ValueError(f'The session {self.sessions[index]} has no channels {sorted(missing)}')
+
+        if isinstance(trials, SessionStore):
+            epochs = trials.epochs(self.n_samples)
+        else:
+            epochs = np.stack([t[:, :self.n_samples] for t in trials])
+
+        # Keep the dataset channels, in the dataset order
+        if ch_names != self.ch_names:
+            epochs = epochs[:, [ch_names.index(ch) for ch in self.ch_names]]
+
+        return epochs, labels
+
+    def epochs(self, index: int) -> Tuple[NDArray, NDArray]:
+        """
+        Return the preprocessed epochs and labels of a session.
+        :param index: the session index
+        :return: epochs with the shape (n_trials, n_channels, n_samples) and the labels
+        """
+        epochs, labels = self.raw_epochs(index)
+        if self.cache is not None:
+            return self.cache.preprocess(epochs, self.sfreq, **self.preprocessing), labels
+
+        return preprocess_epochs(epochs, self.sfreq, **self.preprocessing), labels
+
+    def __iter__(self) -> Iterator[Tuple[NDArray, NDArray]]:
+        for index in range(len(self)):
+            yield self.epochs(index)
+
+    def load(self) -> Tuple[NDArray, NDArray]:
+        """
+        Return the preprocessed epochs and labels of all the sessions.
+        :return: epochs with the shape (n_trials, n_channels, n_samples) and the labels
+        """
+        epochs, labels = zip(*self)
+        return np.concatenate(epochs), np.concatenate(labels)
+
+    def groups(self) -> NDArray:
+        """Return the session index of each epoch, e.g. for leave-session-out cross validation"""
+        return np.concatenate([np.full(len(self._open(i)[1]), i) for i in range(len(self))])
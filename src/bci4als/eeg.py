@@ -1,13 +1,22 @@
 from typing import List, Tuple, Optional
 
-import mne
 import numpy as np
 import pandas as pd
 import serial.tools.list_ports
+from bci4als.container import EEGData
+from bci4als.multirate import Decimator
+from bci4als.profiling import PROFILER
+from bci4als.signal_quality import SignalQualityMonitor
 from brainflow import BrainFlowInputParams, BoardShim, BoardIds
 from mne_features.feature_extraction import extract_features
 from nptyping import NDArray
 
+# The channel names of each headset, in the board channels order
+HEADSETS = {
+    # 'avi16': ['Fp1', 'Fp2', 'C3', 'C4', 'CP5', 'CP6', 'O1', 'O2', 'FC1', 'FC2', 'Cz', 'T8', 'FC5', 'FC6', 'CP1', 'CP2']
+    'avi13': ['CP2', 'FC2', 'CP6', 'C4', 'C3', 'CP5', 'FC1', 'CP1', 'Cz', 'FC6', 'T8', 'T7', 'FC5'],
+}
+
 
 class EEG:
     """
@@ -24,9 +33,17 @@ class EEG:
         serial port for the board
     headset : str
         the headset name we use, will be presented in the metadata
+    decimator : Decimator
+        the streaming decimation of the channels data, None for the board rate
+    dtype : np.dtype
+        the samples type of the channels data (float32 for single precision)
+    quality : SignalQualityMonitor
+        the signal quality of the channels data at the board rate, None if not monitored
+    sample_clock
+        the clock of the samples timestamps for the latency tracing, None for unix time (BrainFlow)
     """
     def __init__(self, board_id: int = BoardIds.CYTON_DAISY_BOARD.value, ip_port: int = 6677,
-                 serial_port: Optional[str] = None, headset: str = "avi13"):
+                 serial_port: Optional[str] = None, headset: str = "avi13", dtype=np.float64):
 
         # Board Id and Headset Name
         self.board_id = board_id
@@ -43,8 +60,20 @@ class EEG:
         # Other Params
         self.sfreq = self.board.get_sampling_rate(board_id)
         self.marker_row = self.board.get_marker_channel(self.board_id)
+        self.timestamp_row = self.board.get_timestamp_channel(self.board_id)
         self.eeg_names = self.get_board_names()
 
+        # Timestamp of the newest sample read with `get_channels_data`
+        self.last_sample_time: Optional[float] = None
+        self.sample_clock = None
+
+        # Streaming decimation of `get_channels_data`, see `set_decimation`
+        self.decimator: Optional[Decimator] = None
+        self.dtype: np.dtype = np.dtype(dtype)
+
+        # Signal quality of the channels data, see `monitor_quality`
+        self.quality: Optional[SignalQualityMonitor] = None
+
     def extract_trials(self, data: NDArray) -> [List[Tuple], List[int]]:
         """
         The method get ndarray and extract the labels and durations from the data.
@@ -80,6 +109,12 @@ class EEG:
         self.board.prepare_session()
         self.board.start_stream()
 
+        # A new stream, without the filter tail of the previous one
+        if self.decimator is not None:
+            self.decimator.reset()
+        if self.quality is not None:
+            self.quality.reset()
+
     def off(self):
         """Turn EEG Off"""
         self.board.stop_stream()
@@ -91,8 +126,7 @@ class EEG:
         marker = self.encode_marker(status, label, index)  # encode marker
         self.board.insert_marker(marker)  # insert the marker to the stream
 
-        # print(f'Status: { status }, Marker: { marker }')  # debug
-        # print(f'Count: { self.board.get_board_data_count() }')  # debug
+        PROFILER.instant('marker', 'eeg', status=status, label=label, index=index, marker=marker)
 
     def _numpy_to_df(self, board_data: NDArray):
         """
@@ -124,34 +158,35 @@ class EEG:
         df[['marker_status', 'marker_label', 'marker_index']] = pd.DataFrame(df['marker'].tolist(), index=df.index)
         return df
 
-    def _board_to_mne(self, board_data: NDArray, ch_names: List[str]) -> mne.io.RawArray:
+    def _board_to_data(self, board_data: NDArray, indices: List[int], ch_names: List[str]) -> EEGData:
         """
-        Convert the ndarray board data to mne object
+        Convert the board data to a container of the channels, in volts (as MNE), with the markers as events.
         :param board_data: raw ndarray from board
-        :return:
+        :param indices: the rows of the channels
+        :param ch_names: the names of the channels
+        :return: the container of the channels data
         """
-        eeg_data = board_data / 1000000  # BrainFlow returns uV, convert to V for MNE
+        # Selecting the rows is the only copy, BrainFlow returns uV which are scaled to V in place
+        eeg_data = board_data[indices].astype(np.float64)
+        eeg_data *= 1e-6
 
-        # Creating MNE objects from BrainFlow data arrays
-        ch_types = ['eeg'] * len(board_data)
-        info = mne.create_info(ch_names=ch_names, sfreq=self.sfreq, ch_types=ch_types)
-        raw = mne.io.RawArray(eeg_data, info, verbose=False)
+        markers = board_data[self.marker_row]
+        samples = np.flatnonzero(markers)
+        events = np.stack([samples, np.zeros_like(samples), markers[samples].astype(np.int64)], axis=1)
 
-        return raw
+        return EEGData(eeg_data, ch_names, self.sfreq, events=events, units='V')
 
-    def get_raw_data(self, ch_names: List[str]) -> mne.io.RawArray:
+    def get_raw_data(self, ch_names: List[str]) -> EEGData:
         """
-        The method returns dataframe with all the raw data, and empties the buffer
+        The method returns the raw data of the channels (`to_mne` for MNE object), and empties the buffer
 
         :param ch_names: list[str] of channels to select
-        :return: mne_raw data
+        :return: the container of the raw data
         """
 
-        indices = [self.eeg_names.index(ch) for ch in ch_names]
+        indices = [self.get_board_channels()[self.eeg_names.index(ch)] for ch in ch_names]
 
-        data = self.board.get_board_data()[indices]
-
-        return self._board_to_mne(data, ch_names)
+        return self._board_to_data(self.board.get_board_data(), indices, ch_names)
 
     def get_features(self, channels: List[str], selected_funcs: List[str],
                      notch: float = 50, low_pass: float = 4, high_pass: float = 50) -> NDArray:
@@ -185,9 +220,8 @@ class EEG:
 
     def get_board_names(self) -> List[str]:
         """The method returns the board's channels"""
-        if self.headset == "avi13":
-            # return ['Fp1', 'Fp2', 'C3', 'C4', 'CP5', 'CP6', 'O1', 'O2', 'FC1', 'FC2', 'Cz', 'T8', 'FC5', 'FC6', 'CP1', 'CP2']
-            return ['CP2', 'FC2', 'CP6', 'C4', 'C3', 'CP5', 'FC1', 'CP1', 'Cz', 'FC6', 'T8', 'T7', 'FC5']
+        if self.headset in HEADSETS:
+            return list(HEADSETS[self.headset])
         else:
             return self.board.get_eeg_names(self.board_id)
 
@@ -200,7 +234,52 @@ class EEG:
 
     def get_channels_data(self):
         """Get NDArray only with the channels data (without all the markers and other stuff)"""
-        return self.board.get_board_data()[self.get_board_channels()]
+        with PROFILER.span('acquire', 'eeg'):
+            data = self.board.get_board_data()
+
+        # Keep the BrainFlow timestamp of the newest sample for latency tracing
+        if data.shape[1] > 0:
+            self.last_sample_time = float(data[self.timestamp_row, -1])
+
+        # Decimate the channels at acquisition (the stream continues from the previous call)
+        data = data[self.get_board_channels()].astype(self.dtype, copy=False)
+
+        # Monitor the quality at the board rate, before the decimation removes the line noise
+        if self.quality is not None:
+            with PROFILER.span('quality', 'eeg'):
+                self.quality.update(data)
+
+        if self.decimator is not None:
+            with PROFILER.span('decimate', 'eeg', factor=self.decimator.factor):
+                data = self.decimator.process(data)
+
+        return data
+
+    @property
+    def channels_sfreq(self) -> float:
+        """The sampling rate of `get_channels_data` (after the decimation)"""
+        return self.decimator.sfreq if self.decimator is not None else self.sfreq
+
+    def set_decimation(self, h_freq: Optional[float] = 30., factor: Optional[int] = None):
+        """
+        Decimate the channels data at acquisition, for high sample rate boards.
+        The board data (markers & trials) keeps the board rate.
+        :param h_freq: the high cut frequency of the model band, which sets the decimation factor
+        :param factor: the decimation factor, by the band if None (1 or h_freq None to stop decimating)
+        """
+        decimator = Decimator(self.sfreq, factor=factor, h_freq=h_freq)
+        self.decimator = decimator if decimator.factor > 1 else None
+        if self.decimator is not None:
+            print(f'Decimating the channels data by {decimator.factor}: {self.sfreq} Hz -> {decimator.sfreq:.1f} Hz')
+
+    def monitor_quality(self, **params) -> SignalQualityMonitor:
+        """
+        Monitor the signal quality of the channels data read with `get_channels_data`.
+        :param params: the params of `SignalQualityMonitor` (window, line_freq, thresholds...)
+        :return: the monitor, also in the `quality` attribute
+        """
+        self.quality = SignalQualityMonitor(self.sfreq, self.eeg_names, **params)
+        return self.quality
 
     def find_serial_port(self) -> str:
         """
@@ -221,13 +300,10 @@ class EEG:
             return FTDIlist[0].name
 
     @staticmethod
-    def filter_data(data: mne.io.RawArray,
-                    notch: float, low_pass: float, high_pass: float) -> mne.io.RawArray:
+    def filter_data(data: EEGData, notch: float, low_pass: float, high_pass: float) -> EEGData:
 
         # data.notch_filter(freqs=notch, verbose=False)
-        data.filter(l_freq=low_pass, h_freq=high_pass, verbose=False)
-
-        return data
+        return data.filter(l_freq=low_pass, h_freq=high_pass)
 
     @staticmethod
     def encode_marker(status: str, label: int, index: int):
@@ -0,0 +1,188 @@
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import soundfile
+from nptyping import NDArray
+from scipy.signal import resample_poly
+
+# The audio cues are shipped with the package
+AUDIO_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'audio')
+
+
+def default_cues() -> Dict[str, str]:
+    """
+    Return dict with all the audio cues shipped with the package.
+    :return: dict with the cue name as key and the mp3 path as value
+    """
+    return {os.path.splitext(f)[0]: os.path.join(AUDIO_DIR, f)
+            for f in sorted(os.listdir(AUDIO_DIR)) if f.endswith('.mp3')}
+
+
+class NullOutput:
+    """
+    Output device which plays nothing.
+    The onset is reported immediately, so the engine can run headless (servers, tests).
+
+    Attributes:
+
+        played (List[str]):
+            The names of the cues which were played, in order.
+    """
+
+    def __init__(self):
+        self.played: List[str] = []
+
+    def open(self, sfreq: int, channels: int):
+        pass
+
+    def play(self, name: str, samples: NDArray, on_onset: Callable[[float], None]):
+        self.played.append(name)
+        on_onset(time.perf_counter())
+
+    def close(self):
+        pass
+
+
+class SoundDeviceOutput:
+    """
+    Output device which keeps one PortAudio stream open for the whole session.
+
+    Playing a cue only swaps the buffer the stream callback reads from, so the caller never
+    waits for the device. A new cue cuts the one currently playing.
+    The onset time is taken from the DAC time of the first block of the cue.
+    """
+
+    def __init__(self, device: Optional[int] = None, latency: str = 'low'):
+        # Imported here since PortAudio is not available on headless machines
+        import sounddevice
+        self._sd = sounddevice
+        self.device = device
+        self.latency = latency
+        self.stream = None
+        self._lock = threading.Lock()
+        self._current: Optional[Tuple[str, NDArray, Callable[[float], None]]] = None
+        self._position: int = 0
+
+    def open(self, sfreq: int, channels: int):
+        self.stream = self._sd.OutputStream(samplerate=sfreq, channels=channels, dtype='float32',
+                                            device=self.device, latency=self.latency,
+                                            callback=self._callback)
+        self.stream.start()
+
+    def play(self, name: str, samples: NDArray, on_onset: Callable[[float], None]):
+        with self._lock:
+            self._current = (name, samples, on_onset)
+            self._position = 0
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.stop()
+            self.stream.close()
+            self.stream = None
+
+    def _callback(self, outdata, frames, time_info, status):
+        outdata.fill(0)
+
+        with self._lock:
+            if self._current is None:
+                return
+            name, samples, on_onset = self._current
+            start = self._position
+            chunk = samples[start:start + frames]
+            outdata[:len(chunk)] = chunk
+            self._position += len(chunk)
+            if self._position >= len(samples):
+                self._current = None
+
+        # Translate the DAC time of the first block to the perf_counter clock
+        if start == 0:
+            on_onset(time.perf_counter() + time_info.outputBufferDacTime - self.stream.time)
+
+
+class AudioEngine:
+    """
+    Play audio cues without blocking the caller.
+
+    All the cues are decoded once into memory when the engine is created, and converted to
+    the same sampling rate and number of channels, so playing a cue never touches the disk.
+
+    Attributes:
+
+        cues (Dict[str, NDArray]):
+            The decoded cues as float32 arrays with the shape (n_samples, n_channels).
+
+        sfreq (int):
+            The sampling rate of the output stream.
+
+        output:
+            The output device. `SoundDeviceOutput` by default, `NullOutput` for headless runs.
+
+        latencies (List[Tuple[str, float]]):
+            The measured onset latency in seconds (from the `play` call until the sound onset) of each cue.
+    """
+
+    def __init__(self, cues: Optional[Dict[str, str]] = None, output=None, sfreq: Optional[int] = None):
+
+        cues = cues if cues is not None else default_cues()
+        decoded = {name: soundfile.read(path, dtype='float32', always_2d=True) for name, path in cues.items()}
+
+        # Use one rate and one channels count for the stream
+        self.sfreq: int = sfreq if sfreq is not None else max(sr for _, sr in decoded.values())
+        self.n_channels: int = max(data.shape[1] for data, _ in decoded.values())
+        self.cues: Dict[str, NDArray] = {name: self._conform(data, sr) for name, (data, sr) in decoded.items()}
+
+        self.latencies: List[Tuple[str, float]] = []
+        self._lock = threading.Lock()
+
+        self.output = output if output is not None else SoundDeviceOutput()
+        self.output.open(self.sfreq, self.n_channels)
+
+    def play(self, name: str):
+        """
+        Start playing the given cue and return immediately.
+        :param name: the name of the cue (e.g. 'start', 'right', 'success')
+        :return:
+        """
+        requested = time.perf_counter()
+        self.output.play(name, self.cues[name], lambda onset: self._on_onset(name, requested, onset))
+
+    def latency_summary(self) -> Dict[str, float]:
+        """
+        Summarize the measured onset latencies.
+        :return: dict with the count, mean, median and max latency in milliseconds
+        """
+        with self._lock:
+            values = np.array([latency for _, latency in self.latencies]) * 1000
+
+        if len(values) == 0:
+            return {'count': 0}
+
+        return {'count': len(values), 'mean_ms': float(values.mean()),
+                'median_ms': float(np.median(values)), 'max_ms': float(values.max())}
+
+    def close(self):
+        """Close the output device"""
+        self.output.close()
+
+    def _on_onset(self, name: str, requested: float, onset: float):
+        with self._lock:
+            self.latencies.append((name, max(0., onset - requested)))
+
+    def _conform(self, data: NDArray, sfreq: int) -> NDArray:
+        """
+        Resample the cue to the stream rate and duplicate mono cues to all channels.
+        :param data: decoded audio with the shape (n_samples, n_channels)
+        :param sfreq: the sampling rate of the decoded audio
+        :return: float32 C-contiguous array with the shape (n_samples, self.n_channels)
+        """
+        if sfreq != self.sfreq:
+            gcd = np.gcd(int(sfreq), int(self.sfreq))
+            data = resample_poly(data, self.sfreq // gcd, sfreq // gcd, axis=0)
+
+        if data.shape[1] != self.n_channels:
+            data = np.repeat(data[:, :1], self.n_channels, axis=1)
+
+        return np.ascontiguousarray(data, dtype=np.float32)
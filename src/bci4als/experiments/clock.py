@@ -0,0 +1,61 @@
+import threading
+import time
+
+
+class WallClock:
+    """The real time source of the experiments"""
+
+    @staticmethod
+    def now() -> float:
+        """Return the current time in seconds"""
+        return time.perf_counter()
+
+    @staticmethod
+    def sleep(seconds: float):
+        """Wait for the given amount of seconds"""
+        if seconds > 0:
+            time.sleep(seconds)
+
+
+class VirtualClock:
+    """
+    Simulated time source for headless experiments.
+    Sleeping only moves the time forward, so a whole session runs as fast as the computations allow.
+
+    Attributes:
+
+        time (float):
+            The current virtual time in seconds.
+    """
+
+    def __init__(self, start: float = 0.):
+        self.time: float = start
+        self._lock = threading.Lock()
+
+    def now(self) -> float:
+        """Return the current virtual time in seconds"""
+        return self.time
+
+    def sleep(self, seconds: float):
+        """Move the virtual time forward by the given amount of seconds"""
+        if seconds > 0:
+            with self._lock:
+                self.time += seconds
+
+
+class Timer:
+    """
+    Stopwatch on top of a clock, with the same interface as `psychopy.core.Clock`.
+    """
+
+    def __init__(self, clock=None):
+        self.clock = clock if clock is not None else WallClock()
+        self._start: float = self.clock.now()
+
+    def getTime(self) -> float:
+        """Return the time in seconds since the timer was created or reset"""
+        return self.clock.now() - self._start
+
+    def reset(self):
+        """Start counting from zero"""
+        self._start = self.clock.now()
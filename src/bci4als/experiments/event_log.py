@@ -0,0 +1,156 @@
+import json
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+# Name of the log file inside the session directory
+EVENTS_FILE = 'events.jsonl'
+
+
+class EventLog:
+    """
+    Append-only, line-delimited JSON log of the events of an online session.
+
+    The caller only puts the event on a queue. A background thread writes the events in
+    batches, so logging never waits for the disk.
+
+    Attributes:
+
+        path (str):
+            Path of the log file. Events are appended, one JSON object per line.
+
+        batch_size (int):
+            The maximal amount of events written together.
+
+        flush_interval (float):
+            Time in seconds the writer waits for more events before writing a partial batch.
+
+        fsync (str):
+            When to force the data to the disk - 'never', 'batch' (after each batch) or 'always'
+            (after each event).
+    """
+
+    _STOP = object()
+
+    def __init__(self, path: str, batch_size: int = 32, flush_interval: float = 0.5, fsync: str = 'batch'):
+
+        if fsync not in ('never', 'batch', 'always'):
+            raise ValueError(f'Unknown fsync policy `{fsync}`. Use never, batch or always.')
+
+        self.path: str = path
+        self.batch_size: int = batch_size
+        self.flush_interval: float = flush_interval
+        self.fsync: str = fsync
+
+        self._queue: queue.Queue = queue.Queue()
+        self._file = open(self.path, 'a', encoding='utf-8')
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def log(self, event: str, **fields: Any):
+        """
+        Append an event to the log.
+        :param event: the event type (e.g. 'prediction', 'retrain', 'trial_end')
+        :param fields: the event data, must be JSON serializable
+        :return:
+        """
+        self._queue.put({'event': event, 'time': time.time(), **fields})
+
+    def close(self):
+        """Write all the pending events and close the file"""
+        if self._file.closed:
+            return
+        self._queue.put(self._STOP)
+        self._writer.join()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _write_loop(self):
+
+        stop = False
+        while not stop:
+
+            # Block until the first event of the batch, then take whatever is ready
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and batch[-1] is not self._STOP:
+                try:
+                    batch.append(self._queue.get(timeout=max(0., deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+
+            if batch[-1] is self._STOP:
+                stop = True
+                batch.pop()
+
+            for event in batch:
+                self._file.write(json.dumps(event) + '\n')
+                if self.fsync == 'always':
+                    self._sync()
+
+            if batch and self.fsync == 'batch':
+                self._sync()
+            else:
+                self._file.flush()
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+
+def read_events(path: str, event: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Read the events from a log file.
+    A partially written last line (e.g. after a crash) is ignored.
+    :param path: path to the log file
+    :param event: optionally return only events of this type
+    :return: list of events in the order they were logged
+    """
+    events = []
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            try:
+                e = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if event is None or e['event'] == event:
+                events.append(e)
+
+    return events
+
+
+def events_to_results(events: List[Dict[str, Any]]) -> List[List[List[int]]]:
+    """
+    Rebuild the `results.json` structure from the prediction events.
+    :param events: events from `read_events`
+    :return: list of lists of target-prediction pairs per trial
+    """
+    results: Dict[int, List[List[int]]] = {}
+    for e in events:
+        if e['event'] == 'prediction':
+            results.setdefault(e['trial'], []).append([e['target'], e['prediction']])
+
+    return [results[trial] for trial in sorted(results)]
+
+
+def load_results(session_directory: str) -> List[List[List[int]]]:
+    """
+    Load the target-prediction pairs of an online session.
+    Sessions recorded with the event log are rebuilt from it, older sessions are read from `results.json`.
+    :param session_directory: path to the session folder
+    :return: list of lists of target-prediction pairs per trial
+    """
+    events_path = os.path.join(session_directory, EVENTS_FILE)
+
+    if os.path.isfile(events_path):
+        return events_to_results(read_events(events_path))
+
+    with open(os.path.join(session_directory, 'results.json')) as file:
+        return json.load(file)
@@ -2,34 +2,62 @@ import os
 import random
 import sys
 from datetime import datetime
+from typing import Optional
 from tkinter import messagebox
 from tkinter.filedialog import askdirectory
 
 import brainflow
 import numpy as np
 
+from bci4als.catalog import session_ids
 from bci4als.eeg import EEG
+from bci4als.experiments.clock import WallClock
 from bci4als.experiments.feedback import Feedback
-from psychopy import event
+from bci4als.experiments.renderer import Renderer, NullRenderer
 
 
 class Experiment:
-    def __init__(self, eeg, num_trials):
+    """
+    Base class for the experiments.
+
+    Attributes:
+
+        session_directory (str):
+            The folder of the session files. If not given, the user is asked for the subject folder
+            and a new session folder is created in it.
+
+        headless (bool):
+            Run without window, dialogs and keyboard (e.g. on a server or in tests).
+            Nothing is displayed and the user never needs to press a key.
+
+        clock:
+            The time source for all the waits of the experiment. `WallClock` by default,
+            `VirtualClock` for running headless sessions faster than real time.
+    """
+    def __init__(self, eeg, num_trials, session_directory: Optional[str] = None,
+                 headless: bool = False, clock=None):
         self.num_trials: int = num_trials
         self.eeg: EEG = eeg
+        self.headless: bool = headless
+        self.clock = clock if clock is not None else WallClock()
+        self.renderer: Optional[Renderer] = None
 
         if self.eeg.board_id == brainflow.BoardIds.SYNTHETIC_BOARD:
-            messagebox.showwarning(title="bci4als WARNING", message="You are running a synthetic board!")
+            if not self.headless:
+                messagebox.showwarning(title="bci4als WARNING", message="You are running a synthetic board!")
             self.debug = True
         else:
             self.debug = False
         # override in subclass
         self.cue_length = None
         self.trial_length = None
-        self.session_directory = None
+        self.subject_directory = None
+        self.session_directory = session_directory
         self.enum_image = {0: 'right', 1: 'left', 2: 'idle', 3: 'tongue', 4: 'legs'}
         self.experiment_type = None
         self.skip_after = None
+        self.threshold = None
+        self.buffer_time = None
 
         #     labels
         self.labels = []
@@ -49,6 +77,7 @@ class Experiment:
             # Channels
             file.write('EEG Channels:\n')
             file.write('*************\n')
+            file.write(f'Headset: {self.eeg.headset}\n')
             for index, ch in enumerate(self.eeg.get_board_names()):
                 file.write(f'Channel {index + 1}: {ch}\n')
 
@@ -61,6 +90,33 @@ class Experiment:
             file.write(f'Cue length: {self.cue_length}\n')
             file.write(f'Labels Enum: {self.enum_image}\n')
             file.write(f'Skip After: {self.skip_after}\n')
+            file.write(f'Threshold: {self.threshold}\n')
+            file.write(f'Buffer time: {self.buffer_time}\n')
+
+    def _init_session_directory(self) -> str:
+        """
+        Return the session directory given to the experiment, or ask the user for the subject directory
+        and create a new session folder in it.
+        :return: the session directory
+        """
+        if self.session_directory is not None:
+            os.makedirs(self.session_directory, exist_ok=True)
+            return self.session_directory
+
+        self.subject_directory = self._ask_subject_directory()
+        return self.create_session_folder(self.subject_directory)
+
+    def _init_renderer(self, **window_params) -> Renderer:
+        """
+        Create the renderer of the experiment, without window if headless.
+        :param window_params: params for the psychopy window
+        :return: the renderer
+        """
+        if self.headless:
+            return NullRenderer(self.clock)
+
+        from psychopy import visual
+        return Renderer(visual.Window(**window_params))
 
     def _ask_subject_directory(self):
         """
@@ -82,8 +138,7 @@ class Experiment:
             sys.exit(-1)
         return subject_folder
 
-    @staticmethod
-    def _wait_between_trials(feedback: Feedback, eeg: EEG, use_eeg: bool):
+    def _wait_between_trials(self, feedback: Feedback, eeg: EEG, use_eeg: bool):
         """
         Method for waiting between trials.
 
@@ -96,24 +151,18 @@ class Experiment:
         feedback.display(0)
 
         # Wait for key-press
-        event.waitKeys()
+        self.renderer.wait_keys()
 
         # Empty the board
         if use_eeg:
             eeg.clear_board()
 
-    @staticmethod
-    def get_keypress():
+    def get_keypress(self):
         """
         Get keypress of the user
         :return: string of the key
         """
-
-        keys = event.getKeys()
-        if keys:
-            return keys[0]
-        else:
-            return None
+        return self.renderer.get_keypress()
 
     @staticmethod
     def create_session_folder(subject_folder: str) -> str:
@@ -125,16 +174,7 @@ class Experiment:
         :return: session folder path
         """
 
-        current_sessions = []
-        for f in os.listdir(subject_folder):
-
-            # try to convert the current sessions folder to int
-            # and except if one of the sessions folder is not integer
-            try:
-                current_sessions.append(int(f))
-
-            except ValueError:
-                continue
+        current_sessions = session_ids(subject_folder)
 
         # Create the new session folder
         session = (max(current_sessions) + 1) if len(current_sessions) > 0 else 1
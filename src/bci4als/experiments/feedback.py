@@ -1,8 +1,14 @@
 import os
-import time
 from collections import namedtuple
-from typing import Dict
-from psychopy import visual
+from typing import TYPE_CHECKING, Dict, Optional
+from bci4als.experiments.renderer import Renderer
+from bci4als.experiments.stopping import EvidenceAccumulator
+from bci4als.signal_quality import QualityOverlay
+from bci4als.tracing import DecisionTrace
+
+# Only the annotations, the stimuli are created by the renderer (see `Renderer`)
+if TYPE_CHECKING:
+    from psychopy import visual
 
 # name tuple object for the progress bar params
 Bar = namedtuple('Bar', ['pos', 'line_size', 'frame_size', 'frame_color', 'fill_color'])
@@ -35,24 +41,36 @@ class Feedback:
         bar (Bar):
             Contain the visual params of the progress bar.
 
-        refresh_rate (float):
-            The refresh rate of the feedback in seconds.
+        renderer (Renderer)
+            The renderer of the experiment window. The stimuli are taken from its cache, so they
+            are built once per session and not for each trial. Each display is paced by a single flip.
+
+        accumulator (Optional[EvidenceAccumulator])
+            Dynamic stopping: the trial stops when the accumulated evidence decides on a class, and the
+            progress bar shows the evidence of the stim. Without it the trial stops after `threshold`
+            correct predictions.
+
+        decision (Optional[int])
+            The class decided by the accumulator.
 
-        win (visual.Window)
-            The psychopy window of the experiment.
+        overlay (Optional[QualityOverlay])
+            Drawn over the feedback before each flip, e.g. the bad channels of the signal quality monitor.
 
     """
 
-    def __init__(self, win: visual.Window, stim: int, buffer_time: float, threshold: int = 3,
-                 refresh_rate: float = 0.1):
+    def __init__(self, renderer: Renderer, stim: int, buffer_time: float, threshold: int = 3,
+                 accumulator: Optional[EvidenceAccumulator] = None, overlay: Optional[QualityOverlay] = None):
 
         self.stim: int = stim
         self.threshold: int = threshold
         self.confident: bool = False
         self.stop = False
         self.progress: float = 0
-        self.refresh_rate: float = refresh_rate
         self.buffer_time: float = buffer_time
+        self.accumulator: Optional[EvidenceAccumulator] = accumulator
+        self.decision: Optional[int] = None
+        self.overlay: Optional[QualityOverlay] = overlay
+        self._trace: Optional[DecisionTrace] = None
 
         # Images params
         self.images_path: Dict[str, str] = {
@@ -70,35 +88,60 @@ class Feedback:
                                  frame_color='white', fill_color='white')
 
         # Psychopy objects
-        self.win: visual.Window = win
-        self.img_stim: visual.ImageStim = visual.ImageStim(self.win, image=self.images_path[self.enum_image[self.stim]])
-        self.center_line: visual.Rect = visual.Rect(self.win, pos=self.bar.pos, size=self.bar.line_size,
-                                                    lineColor=None, fillColor=self.bar.frame_color, autoDraw=False)
-        self.feedback_frame: visual.Rect = visual.Rect(self.win, pos=self.bar.pos, size=self.bar.frame_size,
-                                                       lineColor=self.bar.frame_color, fillColor=None, autoDraw=True)
-        self.feedback_bar: visual.Rect = visual.Rect(self.win, pos=(0, self.feedback_frame.pos[1]),
-                                                     size=(0, self.feedback_frame.size[1]),
-                                                     lineColor=self.bar.frame_color, fillColor=self.bar.fill_color)
+        self.renderer: Renderer = renderer
+        self.img_stim: 'visual.ImageStim' = renderer.image(self.enum_image[self.stim],
+                                                         self.images_path[self.enum_image[self.stim]])
+        self.center_line: 'visual.Rect' = renderer.rect('center_line', pos=self.bar.pos, size=self.bar.line_size,
+                                                      lineColor=None, fillColor=self.bar.frame_color, autoDraw=False)
+        self.feedback_frame: 'visual.Rect' = renderer.rect('feedback_frame', pos=self.bar.pos, size=self.bar.frame_size,
+                                                         lineColor=self.bar.frame_color, fillColor=None, autoDraw=True)
+        self.feedback_bar: 'visual.Rect' = renderer.rect('feedback_bar', pos=(0, self.feedback_frame.pos[1]),
+                                                       size=(0, self.feedback_frame.size[1]),
+                                                       lineColor=self.bar.frame_color, fillColor=self.bar.fill_color)
 
         # Time bar object
-        self.time_bar_frame: visual.Rect = visual.Rect(win=self.win, pos=self.time_bar.pos,
-                                                       size=self.time_bar.frame_size,
-                                                       lineColor=self.time_bar.frame_color, autoDraw=True)
-        self.time_bar: visual.Rect = visual.Rect(win=self.win, pos=(0, self.time_bar_frame.pos[1]),
-                                                 size=(0, self.time_bar_frame.size[1]),
-                                                 fillColor=self.time_bar.fill_color)
-
-    def update(self, predict_stim: int, skip: bool = False):
+        self.time_bar_frame: 'visual.Rect' = renderer.rect('time_bar_frame', pos=self.time_bar.pos,
+                                                         size=self.time_bar.frame_size,
+                                                         lineColor=self.time_bar.frame_color, autoDraw=True)
+        self.time_bar: 'visual.Rect' = renderer.rect('time_bar', pos=(0, self.time_bar_frame.pos[1]),
+                                                   size=(0, self.time_bar_frame.size[1]),
+                                                   fillColor=self.time_bar.fill_color)
+
+        # Finish messages
+        renderer.text('confident', 'Well done!\nPress any key to continue', pos=(0, 0.5))
+        renderer.text('skipping', 'Skipping.\nPress any key to continue', pos=(0, 0.5))
+
+    def update(self, predict_stim: int, skip: bool = False, trace: Optional[DecisionTrace] = None,
+               scores=None):
         """
         Update the feedback on screen.
         The update occur according to the model prediction. If the model was right
         the progress bar get wider, otherwise it stay the same size.
+        With an accumulator the progress bar follows the evidence of the stim instead.
         :param predict_stim: prediction of the model.
         :param skip: optionally skip this stimulus.
+        :param trace: optionally trace of the prediction, finished by the flip which shows the update.
+        :param scores: optionally the decision scores of the prediction, for the accumulator.
         :return:
         """
+        # A previous update which was never displayed
+        if self._trace is not None:
+            self._trace.finish()
+        if trace is not None:
+            trace.mark('feedback')
+        self._trace = trace
+
+        # Accumulate the evidence, stop on a decision for any class
+        if self.accumulator is not None:
+            self.decision = self.accumulator.update(scores=scores, prediction=predict_stim)
+            self.progress = self.accumulator.progress(self.stim)
+
+            if self.decision is not None:
+                self.confident = self.decision == self.stim
+                self.stop = True
+
         # If the model predicted right
-        if predict_stim == self.stim:
+        elif predict_stim == self.stim:
             self.progress += 1 / self.threshold
 
             if self.progress == 1:
@@ -121,17 +164,18 @@ class Feedback:
 
         # If time to stop trial draw finished message
         if self.stop:
-            if self.confident:
-                text = 'Well done!\nPress any key to continue'
-            else:
-                text = 'Skipping.\nPress any key to continue'
-            visual.TextStim(self.win, text, pos=(0, 0.5)).draw()
+            self.renderer.draw('confident' if self.confident else 'skipping')
+
+        if self.overlay is not None:
+            self.overlay.draw()
 
-        # Display window & wait
-        self.win.flip()
-        time.sleep(self.refresh_rate)
+        # Display window at the next screen refresh
+        trace, self._trace = self._trace, None
+        self.renderer.flip()
 
-        # todo: Set auto draw to false
+        if trace is not None:
+            trace.mark('flip')
+            trace.finish()
 
     def _draw_feedback(self):
         """
@@ -6,24 +6,26 @@ import sys
 import time
 from tkinter import messagebox
 from tkinter.filedialog import askdirectory
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 import numpy as np
 import pandas as pd
 from .experiment import Experiment
 from bci4als.eeg import EEG
-from playsound import playsound
-from psychopy import visual
+from bci4als.experiments.audio import AudioEngine, NullOutput
+from bci4als.experiments.trial_collector import TrialCollector
+from bci4als.profiling import PROFILER, profiled, save_session_trace
+from bci4als.storage import write_session
 
 
 class OfflineExperiment(Experiment):
 
     def __init__(self, eeg: EEG, num_trials: int, trial_length: float,
                  next_length: float = 1, cue_length: float = 0.25, ready_length: float = 1,
-                 full_screen: bool = False, audio: bool = False):
+                 full_screen: bool = False, audio: bool = False, session_directory: Optional[str] = None,
+                 headless: bool = False, clock=None):
 
-        super().__init__(eeg, num_trials)
+        super().__init__(eeg, num_trials, session_directory=session_directory, headless=headless, clock=clock)
         self.experiment_type = "Offline"
-        self.window_params: Dict[str, Any] = {}
         self.full_screen: bool = full_screen
         self.audio: bool = audio
 
@@ -34,37 +36,37 @@ class OfflineExperiment(Experiment):
         self.trial_length: float = trial_length
 
         # paths
-        self.subject_directory: str = ''
-        self.session_directory: str = ''
         self.images_path: Dict[str, str] = {
             'right': os.path.join(os.path.dirname(__file__), 'images', 'arrow_right.jpeg'),
             'left': os.path.join(os.path.dirname(__file__), 'images', 'arrow_left.jpeg'),
             'idle': os.path.join(os.path.dirname(__file__), 'images', 'square.jpeg'),
             'tongue': os.path.join(os.path.dirname(__file__), 'images', 'tongue.jpeg'),
             'legs': os.path.join(os.path.dirname(__file__), 'images', 'legs.jpeg')}
-        self.audio_path: Dict[str, str] = {label: os.path.join(os.path.dirname(__file__), 'audio', f'{label}.mp3')
-                                           for label in self.enum_image.values()}
-        self.audio_success_path = os.path.join(os.path.dirname(__file__), 'audio', f'success.mp3')
+        self.audio_engine: Optional[AudioEngine] = None
+        self.collector: Optional[TrialCollector] = None
         self.visual_params: Dict[str, Any] = {'text_color': 'white', 'text_height': 48}
 
     def _init_window(self):
         """
-        init the psychopy window
-        :return: dictionary with the window, left arrow, right arrow and idle.
+        init the psychopy window and build all the stimuli of the session.
+        :return:
         """
 
         # Create the main window
-        main_window = visual.Window(monitor='testMonitor', units='pix', color='black', fullscr=self.full_screen)
+        self.renderer = self._init_renderer(monitor='testMonitor', units='pix', color='black',
+                                            fullscr=self.full_screen)
+
+        # Create the stimulus of each label
+        for label, path in self.images_path.items():
+            self.renderer.image(label, path)
 
-        # Create right, left and idle stimulus
-        right_stim = visual.ImageStim(main_window, image=self.images_path['right'])
-        left_stim = visual.ImageStim(main_window, image=self.images_path['left'])
-        idle_stim = visual.ImageStim(main_window, image=self.images_path['idle'])
-        tongue_stim = visual.ImageStim(main_window, image=self.images_path['tongue'])
-        legs_stim = visual.ImageStim(main_window, image=self.images_path['legs'])
+        # Create the messages
+        color = self.visual_params['text_color']
+        height = self.visual_params['text_height']
+        self.renderer.text('next', 'The next stimulus is...', color=color, height=height)
+        self.renderer.text('ready', 'Ready...', pos=[0, 0], color=color, height=height)
+        self.renderer.text('state', '', pos=[0, -250], color=color, height=height)
 
-        self.window_params = {'main_window': main_window, 'right': right_stim, 'left': left_stim,
-                              'idle': idle_stim, 'tongue': tongue_stim, 'legs': legs_stim}
     #
     # def _init_labels(self):
     #     """
@@ -90,65 +92,59 @@ class OfflineExperiment(Experiment):
         :return:
         """
 
-        color = self.visual_params['text_color']
-        height = self.visual_params['text_height']
         trial_image = self.enum_image[self.labels[trial_index]]
-        win = self.window_params['main_window']
 
         # Show 'next' message
-        next_message = visual.TextStim(win, 'The next stimulus is...', color=color, height=height)
-        next_message.draw()
-        win.flip()
-        time.sleep(self.next_length)
+        with PROFILER.span('render', 'offline', stim='next'):
+            self.renderer.show(self.next_length, 'next')
+
+        # Cut the previous trial while the 'next' message is on screen
+        with PROFILER.span('acquire', 'offline'):
+            self.collector.collect()
 
         # Show cue & play sound
-        cue = visual.ImageStim(win, self.images_path[trial_image])
-        cue.draw()
-        win.flip()
-        time.sleep(self.cue_length)
+        with PROFILER.span('render', 'offline', stim='cue'):
+            self.renderer.show(self.cue_length, trial_image)
 
         # play sound
         if self.audio:
-            playsound(self.audio_path[trial_image])
+            self.audio_engine.play(trial_image)
 
         # Show ready & state message
-        state_text = 'Trial: {} / {}'.format(trial_index + 1, self.num_trials)
-        state_message = visual.TextStim(win, state_text, pos=[0, -250], color=color, height=height)
-        ready_message = visual.TextStim(win, 'Ready...', pos=[0, 0], color=color, height=height)
-        ready_message.draw()
-        state_message.draw()
-        win.flip()
-        time.sleep(self.ready_length)
+        self.renderer.text('state', 'Trial: {} / {}'.format(trial_index + 1, self.num_trials))
+        with PROFILER.span('render', 'offline', stim='ready'):
+            self.renderer.show(self.ready_length, 'ready', 'state')
 
     def _show_stimulus(self, trial_index):
         """
         Show the current condition on screen and wait.
+        The markers are inserted with the flips which show and clear the stimulus.
         Additionally response to shutdown key.
         :param trial_index: the current trial index
         :return:
         """
 
         # Params
-        win = self.window_params['main_window']
         trial_img = self.enum_image[self.labels[trial_index]]
-        audio_path = os.path.join(os.path.dirname(__file__), 'audio', '{}.mp3')
 
         # Play start sound
         if self.audio:
-            playsound(audio_path.format('start'))
+            self.audio_engine.play('start')
 
-        # Draw and push marker
-        self.eeg.insert_marker(status='start', label=self.labels[trial_index], index=trial_index)
-        self.window_params[trial_img].draw()
-        win.flip()
+        # Show the stim with the start marker on its onset
+        self.renderer.on_flip(self.eeg.insert_marker, status='start', label=self.labels[trial_index],
+                              index=trial_index)
+        with PROFILER.span('render', 'offline', stim='trial', trial=trial_index):
+            self.renderer.show(self.trial_length, trial_img)
 
-        # Wait
-        time.sleep(self.trial_length)
-        self.eeg.insert_marker(status='stop', label=self.labels[trial_index], index=trial_index)
+        # Clear the screen with the stop marker
+        self.renderer.on_flip(self.eeg.insert_marker, status='stop', label=self.labels[trial_index],
+                              index=trial_index)
+        self.renderer.flip()
 
         # Play end sound
         if self.audio:
-            playsound(audio_path.format('end'))
+            self.audio_engine.play('end')
 
         # Halt if escape was pressed
         if 'escape' == self.get_keypress():
@@ -156,31 +152,23 @@ class OfflineExperiment(Experiment):
 
     def _extract_trials(self) -> List[pd.DataFrame]:
         """
-        The method extract from the offline experiment collected EEG data and split it into trials.
-        The method export a pickle file to the subject directory with a list with all the trials.
+        The method cut the trials which are still on the board, the earlier trials were already cut
+        during the session.
         :return: list of trials where each trial is a pandas DataFrame
         """
 
         # Wait for a sec to the OpenBCI to get the last marker
-        time.sleep(0.5)
+        self.clock.sleep(0.5)
 
-        # Extract the data
-        trials = []
-        data = self.eeg.get_board_data()
-        ch_names = self.eeg.get_board_names()
-        ch_channels = self.eeg.get_board_channels()
-        durations, labels = self.eeg.extract_trials(data)
+        # Cut the last trials
+        self.collector.collect()
 
         # Assert the labels
-        assert self.labels == labels, 'The labels are not equals to the extracted labels'
-
-        # Append each
-        for start, end in durations:
-            trial = data[ch_channels, start:end]
-            trials.append(pd.DataFrame(data=trial.T, columns=ch_names))
+        assert self.labels == self.collector.labels, 'The labels are not equals to the extracted labels'
 
-        return trials
+        return self.collector.trials
 
+    @profiled('persist', 'offline')
     def _export_files(self, trials):
         """
         Export the experiment files (trials & labels)
@@ -197,19 +185,29 @@ class OfflineExperiment(Experiment):
         print(f"Saving labels to {labels_path}")
         pd.DataFrame.from_dict({'name': self.labels}).to_csv(labels_path, index=False, header=False)
 
+        # Save the memory mapped store of the trials, in the samples type of the EEG
+        store_path = write_session(self.session_directory, [t.to_numpy().T for t in trials], self.labels,
+                                   self.eeg.get_board_names(), self.eeg.sfreq, metadata={'headset': self.eeg.headset},
+                                   dtype=self.eeg.dtype)
+        print(f"Saving trials store to {store_path}")
+
     def run(self):
         # Init the current experiment folder
-        self.subject_directory = self._ask_subject_directory()
-        self.session_directory = self.create_session_folder(self.subject_directory)
+        self.session_directory = self._init_session_directory()
 
         # Create experiment's metadata
         self.write_metadata()
 
-        messagebox.showinfo(title='bci4als', message='Start running trials...')
+        if not self.headless:
+            messagebox.showinfo(title='bci4als', message='Start running trials...')
 
         # Init psychopy and screen params
         self._init_window()
 
+        # Decode all the audio cues before the first trial
+        if self.audio:
+            self.audio_engine = AudioEngine(output=NullOutput() if self.headless else None)
+
 
         # This moved to the base class
         # # Init label vector
@@ -219,6 +217,7 @@ class OfflineExperiment(Experiment):
         # initialize headset
         print("Turning EEG connection ON")
         self.eeg.on()
+        self.collector = TrialCollector(self.eeg, self.labels)
 
         print(f"Running {self.num_trials} trials")
         # Run trials
@@ -235,7 +234,18 @@ class OfflineExperiment(Experiment):
         print("Turning EEG connection OFF")
         self.eeg.off()
 
+        if self.audio:
+            print(f'Audio onset latency: {self.audio_engine.latency_summary()}')
+            self.audio_engine.close()
+
+        # Report the stimulus timing
+        print(f'Frames timing: {self.renderer.timing_summary()}')
+        self.renderer.save_timing(os.path.join(self.session_directory, 'frame_timing.json'))
+
         # Dump files to pickle
         self._export_files(trials)
 
+        # Save the stages trace, if profiling
+        save_session_trace(self.session_directory)
+
         return trials, self.labels
@@ -1,24 +1,30 @@
-import json
 import os
 import pickle
 import random
 import sys
 import threading
 import time
-from typing import Dict, Union
+from typing import Dict, Optional, Union
 import matplotlib
 import matplotlib.pyplot as plt
-import mne
 import numpy as np
-import playsound
+from bci4als.artifacts import ArtifactGate
+from bci4als.dataset import band_pass
 from bci4als.eeg import EEG
 from .experiment import Experiment
+from bci4als.experiments.audio import AudioEngine, NullOutput
+from bci4als.experiments.clock import Timer
+from bci4als.experiments.event_log import EventLog, EVENTS_FILE
 from bci4als.experiments.feedback import Feedback
+from bci4als.experiments.stopping import EvidenceAccumulator
+from bci4als.inference_worker import InferenceWorker
 from bci4als.ml_model import MLModel
+from bci4als.profiling import PROFILER, save_session_trace
+from bci4als.signal_quality import QualityOverlay
+from bci4als.tracing import LatencyTracer
 from matplotlib.animation import FuncAnimation
 from mne_features.feature_extraction import extract_features
 from nptyping import NDArray
-from psychopy import visual, core
 from sklearn.preprocessing import StandardScaler
 
 
@@ -38,13 +44,41 @@ class OnlineExperiment(Experiment):
         threshold (int):
             The amount the times the model need to be correct (predict = stim) before moving to the next stim.
 
+        audio (bool):
+            Play the success cue after each correct prediction.
+
+        stopping (Optional[str]):
+            Dynamic stopping rule ('posterior' or 'sprt', see `EvidenceAccumulator`). The trial stops once
+            the evidence of the model scores decides on a class, instead of after `threshold` correct
+            predictions. None for the fixed threshold.
+
+        stopping_bound (Optional[float]):
+            The posterior ('posterior') or the error rate ('sprt') of the stopping rule.
+
+        artifact_gate (Optional[ArtifactGate]):
+            Reject the windows with artifacts before the prediction and the co-learning. A rejected window
+            is not a prediction, but counts toward `skip_after`.
+
+        inference_worker (bool):
+            Run the model predictions and the co-learning in a worker process (see `InferenceWorker`),
+            so the retrains do not hold the GIL of the feedback loop.
+
+        quality_overlay (bool):
+            Monitor the signal quality of the channels (see `EEG.monitor_quality`) and show the bad channels
+            over the feedback. With or without the overlay, the quality of an EEG with a monitor is logged
+            at the end of each trial.
+
     """
 
     def __init__(self, eeg: EEG, model: MLModel, num_trials: int,
                  buffer_time: float, threshold: int, skip_after: Union[bool, int] = False,
-                 co_learning: bool = False, debug=False):
+                 co_learning: bool = False, debug=False, audio: bool = True,
+                 session_directory: Optional[str] = None, headless: bool = False, clock=None,
+                 stopping: Optional[str] = None, stopping_bound: Optional[float] = None,
+                 artifact_gate: Optional[ArtifactGate] = None, inference_worker: bool = False,
+                 quality_overlay: bool = False):
 
-        super().__init__(eeg, num_trials)
+        super().__init__(eeg, num_trials, session_directory=session_directory, headless=headless, clock=clock)
         # experiment params
         self.experiment_type = "Online"
         self.threshold: int = threshold
@@ -55,11 +89,16 @@ class OnlineExperiment(Experiment):
         self.debug = debug
         self.win = None
         self.co_learning: bool = co_learning
+        self.stopping: Optional[str] = stopping
+        self.stopping_bound: Optional[float] = stopping_bound
+        self.artifact_gate: Optional[ArtifactGate] = artifact_gate
+        self.inference_worker: bool = inference_worker
+        self.worker: Optional[InferenceWorker] = None
+        self.quality_overlay: bool = quality_overlay
 
         # audio
-        # self.audio_success_path = os.path.join(os.path.dirname(__file__), 'audio', f'success.mp3')
-        self.audio_success_path = r'C:\Users\noam\PycharmProjects\bci_4_als\src\bci4als\audio\success.mp3'
-        # todo: make this path generic
+        self.audio: bool = audio
+        self.audio_engine: Optional[AudioEngine] = None
 
         # Model configs
         self.labels_enum: Dict[str, int] = {'right': 0, 'left': 1, 'idle': 2, 'tongue': 3, 'legs': 4}
@@ -69,6 +108,10 @@ class OnlineExperiment(Experiment):
         # Hold list of lists of target-prediction pairs per trial
         # Example: [ [(0, 2), (0,3), (0,0), (0,0), (0,0) ] , [ ...] , ... ,[] ]
         self.results = []
+        self.event_log: Optional[EventLog] = None
+
+        # Latency of each decision from the newest sample until the feedback flip
+        self.tracer = LatencyTracer(clock=eeg.sample_clock)
 
     def _learning_model(self, feedback: Feedback, stim: int):
 
@@ -86,51 +129,86 @@ class OnlineExperiment(Experiment):
         :return:
         """
 
-        timer = core.Clock()
+        timer = Timer(self.clock)
         target_predictions = []
+        trial = len(self.results)
         num_tries = 0
         while not feedback.stop:
             # increase num_tries by 1
             print(f"num tries {num_tries}")
 
             # Sleep until the buffer full
-            time.sleep(max(0, self.buffer_time - timer.getTime()))
-
-            # Extract features from the EEG data
-            data = self.eeg.get_channels_data()
-
-            # Predict the class
-            if self.debug:
-                # in debug mode, be correct 2/3 of the time and incorrect 1/3 of the time.
-                prediction = stim if np.random.rand() <= 2 / 3 else (stim + 1) % len(self.labels_enum)
-            else:
-                # in normal mode, use the loaded model to make a prediction
-                prediction = self.model.online_predict(data, eeg=self.eeg)
-
-            # play sound if successful
-            # todo: make this available to object params
-            self.play_sound = True
-            if self.play_sound:
-                if prediction == stim:
-                    playsound.playsound(self.audio_success_path)
-
-            # if self.co_learning and (prediction == stim):
-            if self.co_learning:
-                self.model.partial_fit(self.eeg, data, stim)
-                pickle.dump(self.model, open(os.path.join(self.session_directory, 'model.pickle'), 'wb'))
-
-            target_predictions.append((int(stim), int(prediction)))
-
-            # Reset the clock for the next buffer
-            timer.reset()
-
-            if stim == prediction:
-                num_tries = 0  # if successful, reset num_tries to 0
-            else:
-                num_tries += 1
-
-            # Update the feedback according the prediction
-            feedback.update(prediction, skip=(num_tries >= self.skip_after))
+            with PROFILER.span('buffer', 'online'):
+                self.clock.sleep(self.buffer_time - timer.getTime())
+
+            # A prediction cycle, from the acquisition to the feedback update
+            with PROFILER.span('cycle', 'online', trial=trial, attempt=len(target_predictions)):
+                # Extract features from the EEG data
+                data = self.eeg.get_channels_data()
+
+                # Reject windows with artifacts before the model classifies or learns them
+                if self.artifact_gate is not None and not self.artifact_gate.accept(data):
+                    print(f'Window rejected: {self.artifact_gate.last_reasons}')
+                    self.event_log.log('artifact', trial=trial, reasons=self.artifact_gate.last_reasons)
+                    timer.reset()
+                    num_tries += 1
+                    feedback.stop = feedback.stop or num_tries >= self.skip_after
+                    continue
+
+                trace = self.tracer.start(self.eeg.last_sample_time)
+                trace.mark('acquire')
+
+                # Predict the class
+                scores = None
+                if self.debug:
+                    # in debug mode, be correct 2/3 of the time and incorrect 1/3 of the time.
+                    prediction = stim if np.random.rand() <= 2 / 3 else (stim + 1) % len(self.labels_enum)
+                else:
+                    # in normal mode, use the loaded model (or its worker) to make a prediction
+                    model = self.model if self.worker is None else self.worker
+                    prediction, scores = model.online_predict(data, eeg=self.eeg, return_scores=True,
+                                                                   trace=trace)
+
+                self.event_log.log('prediction', trial=trial, attempt=len(target_predictions),
+                                   target=int(stim), prediction=int(prediction),
+                                   scores=None if scores is None else np.atleast_1d(scores).tolist())
+
+                # play sound if successful
+                if self.audio and prediction == stim:
+                    self.audio_engine.play('success')
+
+                # if self.co_learning and (prediction == stim):
+                if self.co_learning:
+                    retrain_start = time.perf_counter()
+                    if self.worker is None:
+                        self.model.partial_fit(self.eeg, data, stim)
+                        with PROFILER.span('persist', 'online'):
+                            pickle.dump(self.model, open(os.path.join(self.session_directory, 'model.pickle'), 'wb'))
+                        n_trials = len(self.model.labels)
+                    else:
+                        # The worker retrains & saves the model in the background
+                        self.worker.partial_fit(self.eeg, data, stim)
+                        n_trials = self.worker.n_trials
+                    self.event_log.log('retrain', trial=trial, n_trials=n_trials,
+                                       duration=time.perf_counter() - retrain_start)
+                    trace.mark('retrain')
+
+                target_predictions.append((int(stim), int(prediction)))
+
+                # Reset the clock for the next buffer
+                timer.reset()
+
+                if stim == prediction:
+                    num_tries = 0  # if successful, reset num_tries to 0
+                else:
+                    num_tries += 1
+
+                # Update the feedback according the prediction
+                feedback.update(prediction, skip=(num_tries >= self.skip_after), trace=trace, scores=scores)
+
+                # Headless the render loop runs after the trial, so each update is displayed here
+                if self.headless:
+                    feedback.display(current_time=timer.getTime())
             # feedback.update(stim)  # For debugging purposes
 
             # Update the model using partial-fit with the new EEG data
@@ -139,12 +217,34 @@ class OnlineExperiment(Experiment):
             # Debug
             print(f'Predict: {self.label_dict[prediction]}; '
                   f'True: {self.label_dict[stim]}')
-        accuracy = sum([1 if p[1] == p[0] else 0 for p in target_predictions]) / len(target_predictions)
+        accuracy = sum([1 if p[1] == p[0] else 0 for p in target_predictions]) / max(len(target_predictions), 1)
         print(f'Accuracy of last target: {accuracy}')
         self.results.append(target_predictions)
 
-        # Save Results
-        json.dump(self.results, open(os.path.join(self.session_directory, 'results.json'), "w"))
+        # Log the end of the trial, the results can be rebuilt from the log with `load_results`
+        stopping = {}
+        if feedback.accumulator is not None:
+            expected = feedback.accumulator.expected_windows()
+            stopping = {'decision': feedback.decision, 'windows': len(target_predictions),
+                        'decision_time': len(target_predictions) * self.buffer_time,
+                        'expected_time': expected * self.buffer_time if np.isfinite(expected) else None}
+            print(f"Decision after {stopping['decision_time']}s (expected {stopping['expected_time']}s)")
+        self.event_log.log('trial_end', trial=trial, target=int(stim), accuracy=accuracy,
+                           confident=feedback.confident, **stopping)
+
+        # Log the channels quality, to find the bad electrodes of the session
+        if self.eeg.quality is not None:
+            print(f'Bad channels: {self.eeg.quality.bad_channels()}')
+            self.event_log.log('signal_quality', trial=trial, **self.eeg.quality.snapshot())
+
+    def _init_accumulator(self) -> Optional[EvidenceAccumulator]:
+        """Return the evidence accumulator of a new trial, or None without dynamic stopping"""
+        if self.stopping is None:
+            return None
+
+        # The scores are in the order of the model classes
+        classes = range(self.num_labels) if self.debug else self.model.clf.classes_
+        return EvidenceAccumulator(classes, rule=self.stopping, bound=self.stopping_bound)
 
     def online_pipe(self, data: NDArray) -> NDArray:
         """
@@ -153,14 +253,16 @@ class OnlineExperiment(Experiment):
         :param data: ndarray with the shape (n_channels, n_samples)
         :return: ndarray with the shape of (1, n_features)
         """
-        # Prepare the data to MNE functions
-        data = data.astype(np.float64)
+        # Prepare the data in the samples type of the EEG
+        data = data.astype(self.eeg.dtype)
 
         # Filter the data (band-pass only)
-        data = mne.filter.filter_data(data, l_freq=8, h_freq=30, sfreq=self.eeg.sfreq, verbose=False)
+        with PROFILER.span('filter', 'online'):
+            data = band_pass(data, self.eeg.channels_sfreq, l_freq=8, h_freq=30)
 
         # Laplacian
-        data = self.eeg.laplacian(data, self.eeg.get_board_names())
+        with PROFILER.span('spatial filter', 'online'):
+            data = self.eeg.laplacian(data, self.eeg.get_board_names())
 
         # Normalize
         scaler = StandardScaler()
@@ -169,21 +271,41 @@ class OnlineExperiment(Experiment):
         # Extract features
         funcs_params = {'pow_freq_bands__freq_bands': np.array([8, 10, 12.5, 30])}
         selected_funcs = ['pow_freq_bands', 'variance']
-        X = extract_features(data[np.newaxis], self.eeg.sfreq, selected_funcs, funcs_params)[0]
+        with PROFILER.span('feature', 'online'):
+            X = extract_features(data[np.newaxis], self.eeg.channels_sfreq, selected_funcs, funcs_params)[0]
 
         return X
 
     def run(self, use_eeg: bool = True, full_screen: bool = False):
 
         # Init the current experiment folder
-        self.subject_directory = self._ask_subject_directory()
-        self.session_directory = self.create_session_folder(self.subject_directory)
+        self.session_directory = self._init_session_directory()
 
         # Create experiment's metadata
         self.write_metadata()
 
+        # Results and events log of the session
+        self.event_log = EventLog(os.path.join(self.session_directory, EVENTS_FILE))
+
         # Init experiments configurations
-        self.win = visual.Window(monitor='testMonitor', fullscr=full_screen)
+        self.renderer = self._init_renderer(monitor='testMonitor', fullscr=full_screen)
+        self.win = self.renderer.win
+
+        # Decode all the audio cues before the first trial
+        if self.audio:
+            self.audio_engine = AudioEngine(output=NullOutput() if self.headless else None)
+
+        # Start the model worker process before the stream, it loads the model in the meantime
+        if self.inference_worker and not self.debug:
+            self.worker = InferenceWorker(self.model, persist_path=os.path.join(self.session_directory, 'model.pickle'))
+            self.worker.start()
+
+        # Show the bad channels over the feedback
+        overlay = None
+        if self.quality_overlay:
+            if self.eeg.quality is None:
+                self.eeg.monitor_quality()
+            overlay = QualityOverlay(self.renderer, self.eeg.quality, self.clock)
 
         # turn on EEG streaming
         if use_eeg:
@@ -193,18 +315,24 @@ class OnlineExperiment(Experiment):
         for stim in self.labels:
 
             # Init feedback instance
-            feedback = Feedback(self.win, stim, self.buffer_time, self.threshold)
+            feedback = Feedback(self.renderer, stim, self.buffer_time, self.threshold,
+                                accumulator=self._init_accumulator(), overlay=overlay)
 
-            # Use different thread for online learning of the model
-            threading.Thread(target=self._learning_model,
-                             args=(feedback, stim), daemon=True).start()
+            # Headless there is nothing to display, learn in this thread on the experiment clock
+            if self.headless:
+                self._learning_model(feedback, stim)
+            else:
+                # Use different thread for online learning of the model
+                threading.Thread(target=self._learning_model,
+                                 args=(feedback, stim), daemon=True).start()
 
             # Maintain visual feedback on screen
-            timer = core.Clock()
+            timer = Timer(self.clock)
 
             while not feedback.stop:
 
-                feedback.display(current_time=timer.getTime())
+                with PROFILER.span('render', 'online'):
+                    feedback.display(current_time=timer.getTime())
 
                 # Reset the timer according the buffer time attribute
                 if timer.getTime() > self.buffer_time:
@@ -220,3 +348,30 @@ class OnlineExperiment(Experiment):
         # turn off EEG streaming
         if use_eeg:
             self.eeg.off()
+
+        # Take the co-learned model of the worker (after the last retrain was saved)
+        if self.worker is not None:
+            self.model = self.worker.fetch_model()
+            self.worker.close()
+            self.worker = None
+
+        if self.audio:
+            print(f'Audio onset latency: {self.audio_engine.latency_summary()}')
+            self.audio_engine.close()
+
+        if self.artifact_gate is not None:
+            print(f'Artifact gate: {self.artifact_gate.summary()}')
+            self.event_log.log('artifact_summary', **self.artifact_gate.summary())
+
+        self.event_log.close()
+
+        # Report the decisions latency
+        print(f"Decision latency: {self.tracer.summary().get('total', {}).get('p50_ms')} ms (median)")
+        self.tracer.save(self.session_directory)
+
+        # Report the feedback timing
+        print(f'Frames timing: {self.renderer.timing_summary()}')
+        self.renderer.save_timing(os.path.join(self.session_directory, 'frame_timing.json'))
+
+        # Save the stages trace, if profiling
+        save_session_trace(self.session_directory)
@@ -0,0 +1,224 @@
+import json
+import math
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional
+
+import numpy as np
+from bci4als.experiments.clock import WallClock
+from psychopy import core
+
+# The psychopy stimuli & keyboard open the display on import, they are imported by the window renderer
+# only, so the headless experiments (`NullRenderer`) run on servers without a display
+if TYPE_CHECKING:
+    from psychopy import visual
+
+
+class Renderer:
+    """
+    Wrap the psychopy window of an experiment.
+
+    All the stimuli are built once and cached by key, so presenting a stimulus never creates
+    psychopy objects or loads images during the session. Presentation times are counted in frames
+    and every flip is synced to the monitor refresh, and the flip times are recorded for
+    reporting dropped frames and jitter.
+
+    Attributes:
+
+        win (visual.Window):
+            The psychopy window of the experiment.
+
+        frame_period (float):
+            The duration of a single frame in seconds.
+
+        stims (Dict[str, Any]):
+            The cached psychopy stimuli by key.
+
+        flip_times (List[float]):
+            The time of each flip in seconds, as returned by `win.flip`.
+    """
+
+    def __init__(self, win: 'visual.Window', frame_rate: Optional[float] = None):
+
+        self.win: 'visual.Window' = win
+        self.stims: Dict[str, Any] = {}
+        self.flip_times: List[float] = []
+
+        # Measure the frame rate if not given, fall back to the monitor spec
+        if frame_rate is None:
+            frame_rate = self.win.getActualFrameRate(nIdentical=10, nMaxFrames=120, nWarmUpFrames=10)
+        self.frame_period: float = 1 / frame_rate if frame_rate else self.win.monitorFramePeriod
+
+    def image(self, key: str, image: str, **kwargs) -> 'visual.ImageStim':
+        """Return the cached image stimulus of the key, build it in the first call"""
+        if key not in self.stims:
+            from psychopy import visual
+            self.stims[key] = visual.ImageStim(self.win, image=image, **kwargs)
+        return self.stims[key]
+
+    def text(self, key: str, text: str, **kwargs) -> 'visual.TextStim':
+        """Return the cached text stimulus of the key and set its text, build it in the first call"""
+        if key not in self.stims:
+            from psychopy import visual
+            self.stims[key] = visual.TextStim(self.win, text, **kwargs)
+        elif self.stims[key].text != text:
+            self.stims[key].text = text
+        return self.stims[key]
+
+    def rect(self, key: str, **kwargs) -> 'visual.Rect':
+        """Return the cached rect stimulus of the key, build it in the first call"""
+        if key not in self.stims:
+            from psychopy import visual
+            self.stims[key] = visual.Rect(win=self.win, **kwargs)
+        return self.stims[key]
+
+    def draw(self, *keys: str):
+        """Draw the cached stimuli of the given keys"""
+        for key in keys:
+            self.stims[key].draw()
+
+    def flip(self) -> float:
+        """
+        Flip the window at the next screen refresh and record the flip time.
+        :return: the flip time in seconds
+        """
+        flip_time = self.win.flip()
+        self.flip_times.append(flip_time if flip_time is not None else core.getTime())
+        return self.flip_times[-1]
+
+    def on_flip(self, function: Callable, *args, **kwargs):
+        """Call the function right after the next flip (e.g. to insert an EEG marker at the stim onset)"""
+        self.win.callOnFlip(function, *args, **kwargs)
+
+    def show(self, duration: float, *keys: str) -> float:
+        """
+        Present the given stimuli for the given duration.
+        The duration is rounded to whole frames, the stimuli are redrawn for each frame.
+        :param duration: presentation time in seconds
+        :param keys: the keys of the stimuli to present
+        :return: the onset time (the first flip time) in seconds
+        """
+        n_frames = max(1, int(round(duration / self.frame_period)))
+
+        onset = None
+        for _ in range(n_frames):
+            self.draw(*keys)
+            flip_time = self.flip()
+            onset = flip_time if onset is None else onset
+
+        return onset
+
+    @staticmethod
+    def get_keypress() -> Optional[str]:
+        """
+        Get keypress of the user
+        :return: string of the key
+        """
+        from psychopy import event
+        keys = event.getKeys()
+        if keys:
+            return keys[0]
+        else:
+            return None
+
+    @staticmethod
+    def wait_keys():
+        """Wait for the user's key-press"""
+        from psychopy import event
+        event.waitKeys()
+
+    def timing_summary(self) -> Dict[str, float]:
+        """
+        Summarize the flips timing.
+        A frame is considered dropped when the interval between flips exceeds 1.5 frame periods.
+        Intervals longer than 10 frames are pauses (e.g. waiting for key-press) and are ignored.
+        :return: dict with the number of flips and dropped frames, and the interval stats in ms
+        """
+        intervals = np.diff(self.flip_times)
+        intervals = intervals[intervals < 10 * self.frame_period]
+
+        if len(intervals) == 0:
+            return {'flips': len(self.flip_times), 'dropped_frames': 0}
+
+        late = intervals > 1.5 * self.frame_period
+        on_time = intervals[~late]
+
+        return {'flips': len(self.flip_times),
+                'frame_period_ms': self.frame_period * 1000,
+                'dropped_frames': int((np.round(intervals[late] / self.frame_period) - 1).sum()),
+                'interval_mean_ms': float(on_time.mean() * 1000) if len(on_time) else math.nan,
+                'jitter_ms': float(on_time.std() * 1000) if len(on_time) else math.nan,
+                'interval_max_ms': float(intervals.max() * 1000)}
+
+    def save_timing(self, path: str):
+        """Save the timing summary as json file"""
+        with open(path, 'w') as file:
+            json.dump(self.timing_summary(), file, indent=4)
+
+
+class NullStim:
+    """Stimulus which draws nothing, accepts any attribute like the psychopy stimuli"""
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+        self.pos = list(kwargs.get('pos', (0, 0)))
+        self.size = list(kwargs.get('size', (0, 0)))
+        self.width = self.size[0]
+
+    def draw(self):
+        pass
+
+
+class NullRenderer(Renderer):
+    """
+    Renderer for headless experiments.
+
+    Nothing is drawn. Presenting a stimulus and flipping only sleep on the given clock,
+    so with a `VirtualClock` the presentation takes no real time. There is no keyboard, so
+    waiting for a key-press returns immediately.
+    """
+
+    def __init__(self, clock=None, frame_rate: float = 60):
+        self.win = None
+        self.clock = clock if clock is not None else WallClock()
+        self.stims: Dict[str, Any] = {}
+        self.flip_times: List[float] = []
+        self.frame_period: float = 1 / frame_rate
+        self._on_flip: List[Callable] = []
+
+    def image(self, key: str, image: str, **kwargs) -> NullStim:
+        return self.stims.setdefault(key, NullStim(image=image, **kwargs))
+
+    def text(self, key: str, text: str, **kwargs) -> NullStim:
+        stim = self.stims.setdefault(key, NullStim(**kwargs))
+        stim.text = text
+        return stim
+
+    def rect(self, key: str, **kwargs) -> NullStim:
+        return self.stims.setdefault(key, NullStim(**kwargs))
+
+    def flip(self) -> float:
+        self.clock.sleep(self.frame_period)
+        self.flip_times.append(self.clock.now())
+
+        callbacks, self._on_flip = self._on_flip, []
+        for callback in callbacks:
+            callback()
+
+        return self.flip_times[-1]
+
+    def on_flip(self, function: Callable, *args, **kwargs):
+        self._on_flip.append(lambda: function(*args, **kwargs))
+
+    def show(self, duration: float, *keys: str) -> float:
+        # One flip for the onset, then sleep the remaining frames at once
+        n_frames = max(1, int(round(duration / self.frame_period)))
+        onset = self.flip()
+        self.clock.sleep((n_frames - 1) * self.frame_period)
+        return onset
+
+    @staticmethod
+    def get_keypress() -> Optional[str]:
+        return None
+
+    @staticmethod
+    def wait_keys():
+        pass
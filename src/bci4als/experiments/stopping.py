@@ -0,0 +1,147 @@
+from typing import List, Optional, Sequence
+
+import numpy as np
+from nptyping import NDArray
+
+# The stopping rules
+POSTERIOR = 'posterior'
+SPRT = 'sprt'
+
+
+def log_probabilities(scores) -> NDArray:
+    """
+    Convert classifier decision scores to log probabilities of the classes.
+    For LDA the decision scores are the log posteriors up to a constant, so this is a log-softmax.
+    :param scores: the decision scores, a scalar for 2 classes (positive for the second class)
+    :return: array of the log probability of each class
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    if scores.ndim == 0:
+        scores = np.array([0., float(scores)])
+
+    scores = scores - scores.max()
+    return scores - np.log(np.exp(scores).sum())
+
+
+class EvidenceAccumulator:
+    """
+    Accumulate the classifier evidence across the prediction windows of a trial, and decide on a class
+    as soon as the evidence is enough, instead of after a fixed number of correct windows.
+
+    Each window adds the log probabilities of the classes (naive Bayes over the windows, uniform prior).
+    The decision can be on any class: the target means the trial succeeded, other class means a
+    wrong selection. Two stopping rules:
+        'posterior' - stop when the posterior of a class reaches `bound` (e.g. 0.95).
+        'sprt'      - sequential probability ratio test of the leading class against the runner up,
+                      stop when the log likelihood ratio crosses log((1 - bound) / bound), where `bound`
+                      is the error rate (e.g. 0.05).
+
+    Usage:
+        accumulator = EvidenceAccumulator(classes=[0, 1, 2, 3, 4], rule='sprt', bound=0.05)
+        while accumulator.decision is None:
+            accumulator.update(scores=model_scores)
+
+    Attributes:
+
+        classes (List[int]):
+            The classes in the order of the decision scores.
+
+        rule (str):
+            The stopping rule, 'posterior' or 'sprt'.
+
+        bound (float):
+            The posterior to reach ('posterior') or the error rate ('sprt').
+
+        hit_rate (float):
+            The assumed accuracy of a window which has only a prediction and no scores.
+
+        evidence (NDArray):
+            The accumulated log probability of each class.
+
+        n_windows (int):
+            The windows accumulated so far.
+
+        decision (Optional[int]):
+            The decided class, None until the bound is reached.
+    """
+
+    def __init__(self, classes: Sequence[int], rule: str = SPRT, bound: Optional[float] = None,
+                 hit_rate: float = 2 / 3):
+
+        if rule not in (POSTERIOR, SPRT):
+            raise ValueError(f'Unknown stopping rule `{rule}`, use `{POSTERIOR}` or `{SPRT}`')
+
+        self.classes: List[int] = [int(c) for c in classes]
+        self.rule: str = rule
+        self.bound: float = bound if bound is not None else (0.95 if rule == POSTERIOR else 0.05)
+        self.hit_rate: float = hit_rate
+        self.evidence: NDArray = np.zeros(len(self.classes))
+        self.n_windows: int = 0
+        self.decision: Optional[int] = None
+        self._margins: List[float] = []
+
+        if not 0 < self.bound < 1:
+            raise ValueError(f'The bound must be in (0, 1), got {self.bound}')
+
+    @property
+    def threshold(self) -> float:
+        """The log ratio of the leading class over the others which stops the trial"""
+        if self.rule == POSTERIOR:
+            return float(np.log(self.bound / (1 - self.bound)))
+        return float(np.log((1 - self.bound) / self.bound))
+
+    def _margin(self, evidence: NDArray, index: int) -> float:
+        """The log ratio of the class over the others: the rest of the posterior, or the runner up for SPRT"""
+        others = np.delete(evidence, index)
+        if self.rule == POSTERIOR:
+            top = others.max()
+            return float(evidence[index] - (top + np.log(np.exp(others - top).sum())))
+        return float(evidence[index] - others.max())
+
+    def update(self, scores=None, prediction: Optional[int] = None) -> Optional[int]:
+        """
+        Add the evidence of a prediction window.
+        :param scores: the decision scores of the window (see `log_probabilities`)
+        :param prediction: the predicted class, used with `hit_rate` if the window has no scores
+        :return: the decided class, or None if the evidence is not enough yet
+        """
+        if scores is not None:
+            log_p = log_probabilities(scores)
+        elif prediction is not None:
+            miss_rate = (1 - self.hit_rate) / (len(self.classes) - 1)
+            log_p = np.full(len(self.classes), np.log(miss_rate))
+            log_p[self.classes.index(int(prediction))] = np.log(self.hit_rate)
+        else:
+            raise ValueError('Either scores or prediction must be given')
+
+        self.evidence += log_p
+        self.n_windows += 1
+
+        leader = int(np.argmax(self.evidence))
+        margin = self._margin(self.evidence, leader)
+        self._margins.append(margin)
+        if self.decision is None and margin >= self.threshold:
+            self.decision = self.classes[leader]
+
+        return self.decision
+
+    def posterior(self) -> NDArray:
+        """Return the posterior probability of each class"""
+        evidence = self.evidence - self.evidence.max()
+        return np.exp(evidence) / np.exp(evidence).sum()
+
+    def progress(self, target: int) -> float:
+        """Return the fraction of the stopping bound the target reached, between 0 and 1"""
+        margin = self._margin(self.evidence, self.classes.index(int(target)))
+        return float(np.clip(margin / self.threshold, 0, 1))
+
+    def expected_windows(self) -> float:
+        """
+        Wald's approximation of the windows until a decision: the stopping threshold divided by the mean
+        evidence the leading class gained per window so far. Infinite if the evidence does not grow.
+        """
+        if not self._margins:
+            return np.inf
+
+        drift = self._margins[-1] / len(self._margins)
+        return float(np.ceil(self.threshold / drift)) if drift > 0 else np.inf
@@ -0,0 +1,115 @@
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from bci4als.eeg import EEG
+from nptyping import NDArray
+
+
+class TrialCollector:
+    """
+    Cut the trials of an offline session while the session runs.
+
+    Every call to `collect` drains the board and cuts the trials whose stop marker arrived.
+    Only the samples of the running trial are kept between calls, so the trials store is complete
+    when the last trial ends. Each marker is validated against the expected labels when it arrives,
+    so a lost marker is reported right after the trial and not at the end of the session.
+
+    Attributes:
+
+        expected_labels (List[int]):
+            The labels of the session trials, in order.
+
+        trials (List[pd.DataFrame]):
+            The trials cut so far, each trial is a DataFrame with the channels as columns.
+
+        labels (List[int]):
+            The labels of the cut trials, as decoded from the markers.
+
+        errors (List[str]):
+            Description of each marker problem found.
+    """
+
+    def __init__(self, eeg: EEG, labels: List[int]):
+
+        self.eeg: EEG = eeg
+        self.expected_labels: List[int] = labels
+        self.ch_names: List[str] = eeg.get_board_names()
+        self.ch_channels: List[int] = eeg.get_board_channels()
+
+        self.trials: List[pd.DataFrame] = []
+        self.labels: List[int] = []
+        self.errors: List[str] = []
+
+        # The label & index of the running trial, and its samples so far
+        self._running: Optional[Tuple[int, int]] = None
+        self._chunks: List[NDArray] = []
+        self._next_index: int = 0
+
+    @property
+    def complete(self) -> bool:
+        """Are all the expected trials collected"""
+        return self._running is None and len(self.trials) == len(self.expected_labels)
+
+    def collect(self) -> int:
+        """
+        Drain the board and cut the finished trials.
+        :return: the number of trials cut in this call
+        """
+        return self.feed(self.eeg.get_board_data())
+
+    def feed(self, data: NDArray) -> int:
+        """
+        Cut the finished trials from the given board data.
+        :param data: board data (all the board rows) following the previously fed data
+        :return: the number of trials cut from the data
+        """
+        n_trials = len(self.trials)
+        position = 0
+
+        for idx in np.where(data[self.eeg.marker_row, :] != 0)[0]:
+
+            status, label, index = self.eeg.decode_marker(data[self.eeg.marker_row, idx])
+
+            if status == 'start':
+                if self._running is not None:
+                    self._error(f'Trial {self._running[1]} has no stop marker')
+                self._validate(label, index)
+                self._running, self._chunks = (label, index), []
+
+            elif self._running is None:
+                self._error(f'Stop marker of trial {index} without start marker')
+
+            else:
+                if self._running != (label, index):
+                    self._error(f'Stop marker of trial {index} does not match the start marker '
+                                f'of trial {self._running[1]}')
+                self._chunks.append(data[self.ch_channels, position:idx])
+                self._cut()
+
+            position = idx
+
+        # Keep the samples of the running trial for the next call
+        if self._running is not None:
+            self._chunks.append(data[self.ch_channels, position:])
+
+        return len(self.trials) - n_trials
+
+    def _cut(self):
+        trial = np.concatenate(self._chunks, axis=1)
+        self.trials.append(pd.DataFrame(data=trial.T, columns=self.ch_names))
+        self.labels.append(self._running[0])
+        self._running, self._chunks = None, []
+
+    def _validate(self, label: int, index: int):
+        if index >= len(self.expected_labels):
+            self._error(f'Start marker of trial {index} after all the {len(self.expected_labels)} expected trials')
+        elif label != self.expected_labels[index]:
+            self._error(f'Expected label {self.expected_labels[index]} for trial {index}, got label {label}')
+        elif index != self._next_index:
+            self._error(f'Expected trial {self._next_index}, got trial {index}')
+        self._next_index = index + 1
+
+    def _error(self, message: str):
+        print(f'Markers error: {message}')
+        self.errors.append(message)
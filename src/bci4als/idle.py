@@ -0,0 +1,121 @@
+import threading
+import time
+from typing import Callable, Optional
+
+
+class PynputMoveSource:
+    """
+    Mouse move events from a pynput listener.
+    pynput is imported on start, since it needs a display.
+    """
+
+    def __init__(self):
+        self._listener = None
+
+    def start(self, on_move: Callable[[float, float], None]):
+        from pynput.mouse import Listener
+
+        self._listener = Listener(on_move=on_move)
+        self._listener.daemon = True
+        self._listener.start()
+
+    def stop(self):
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+
+
+class IdleDetector:
+    """
+    Detect that the cursor stands still, from the mouse move events.
+
+    A move counts as motion only if the cursor left the circle of radius `r` around the point it
+    stopped at, so small tremor is ignored. The cursor is idle when no motion happened for `dwell`
+    seconds. Waiting for idle sleeps until the dwell ends or the next move event, without polling.
+    If the cursor did not move since the previous wait returned, the dwell counts from the new wait,
+    so consecutive waits without motion (e.g. after a click) each last at least `dwell`.
+
+    Usage:
+        detector = IdleDetector(r=25, dwell=2)
+        detector.start()
+        motion_stop = detector.wait_idle()
+
+    Attributes:
+
+        r (float):
+            The radius in pixels of the movement which is not considered as motion.
+
+        dwell (float):
+            The seconds without motion until the cursor is idle.
+
+        source:
+            The move events source, with `start(on_move)` and `stop()`. `PynputMoveSource` by default.
+
+        last_motion (float):
+            The time (`time.perf_counter`) of the last motion.
+    """
+
+    def __init__(self, r: float = 25, dwell: float = 2, source=None, clock: Callable[[], float] = time.perf_counter):
+
+        self.r: float = r
+        self.dwell: float = dwell
+        self.source = source if source is not None else PynputMoveSource()
+        self.clock = clock
+        self.last_motion: float = clock()
+
+        self._anchor: Optional[tuple] = None
+        self._returned: Optional[float] = None
+        self._condition = threading.Condition()
+        self._started = False
+
+    def start(self):
+        """Start listening to the move events"""
+        if not self._started:
+            self.source.start(self.on_move)
+            self._started = True
+
+    def stop(self):
+        """Stop listening to the move events"""
+        if self._started:
+            self.source.stop()
+            self._started = False
+
+    def on_move(self, x: float, y: float):
+        """Handle a move event of the cursor to (x, y)"""
+        if self._anchor is not None and (x - self._anchor[0]) ** 2 + (y - self._anchor[1]) ** 2 < self.r ** 2:
+            return
+
+        with self._condition:
+            self._anchor = (x, y)
+            self.last_motion = self.clock()
+            self._condition.notify_all()
+
+    def wait_idle(self, timeout: Optional[float] = None) -> Optional[float]:
+        """
+        Wait until the cursor is idle.
+        :param timeout: the maximal seconds to wait, forever by default
+        :return: the time the motion stopped (or the wait started, without motion since the previous wait),
+                 or None on timeout
+        """
+        self.start()
+        called = self.clock()
+        deadline = None if timeout is None else called + timeout
+
+        with self._condition:
+            while True:
+                # Without motion since the previous wait, the standstill is counted again from this wait
+                rearmed = self._returned is not None and self.last_motion <= self._returned
+                standstill = called if rearmed else self.last_motion
+
+                now = self.clock()
+                remaining = standstill + self.dwell - now
+                if remaining <= 0:
+                    self._returned = now
+                    return standstill
+                if deadline is not None:
+                    if now >= deadline:
+                        return None
+                    remaining = min(remaining, deadline - now)
+
+                # Wake at the end of the dwell, or earlier on motion
+                self._condition.wait(remaining)
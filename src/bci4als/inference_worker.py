@@ -0,0 +1,294 @@
+import multiprocessing
+import pickle
+import time
+import traceback
+from collections import deque
+from typing import Deque, List, Optional, Tuple
+
+import numpy as np
+from bci4als.stream_hub import SharedRing
+from nptyping import NDArray
+
+# The samples of the windows ring, about 4 minutes of 13 channels at 125 Hz
+WINDOWS_CAPACITY = 32768
+
+
+class WorkerError(Exception):
+    """The inference worker failed a request, or crashed more than the restarts limit"""
+
+
+class _Rates:
+    """The sampling rates of an `EEG`, all the model needs from it in the worker"""
+
+    def __init__(self, sfreq: float, channels_sfreq: float):
+        self.sfreq = sfreq
+        self.channels_sfreq = channels_sfreq
+
+
+class _WorkerTrace:
+    """Collect the stage marks of the model in the worker, for the `DecisionTrace` of the caller"""
+
+    def __init__(self):
+        self.marks: List[Tuple[str, float]] = []
+
+    def mark(self, stage: str):
+        self.marks.append((stage, time.time()))
+
+
+def _serve(conn, model_bytes: bytes, ring_name: str, persist_path: Optional[str]):
+    """The worker process: answer the requests of the connection in order, until `stop`"""
+    model = pickle.loads(model_bytes)
+    ring = SharedRing.attach(ring_name)
+
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            break
+        kind = request[0]
+        if kind == 'stop':
+            break
+
+        try:
+            if kind == 'predict':
+                _, start, stop, rates = request
+                trace = _WorkerTrace()
+                window = np.concatenate(ring.segments(start, stop), axis=1)
+                prediction, scores = model.online_predict(window, rates, return_scores=True, trace=trace)
+                conn.send(('ok', (prediction, scores, trace.marks)))
+            elif kind == 'fit':
+                _, start, stop, rates, label = request
+                model.partial_fit(rates, np.concatenate(ring.segments(start, stop), axis=1), label)
+                if persist_path is not None:
+                    with open(persist_path, 'wb') as file:
+                        pickle.dump(model, file)
+                conn.send(('ok', len(model.labels)))
+            elif kind == 'replay':
+                # Restore the co-learning trials of the crashed worker, and train once
+                _, windows, labels, rates = request
+                for window, label in zip(windows, labels):
+                    model.add_trial(rates, window, label)
+                if windows:
+                    model.offline_training(rates)
+                conn.send(('ok', len(model.labels)))
+            elif kind == 'model':
+                conn.send(('ok', pickle.dumps(model)))
+            else:
+                raise ValueError(f'Unknown request `{kind}`')
+        except Exception as e:
+            conn.send(('error', f'{type(e).__name__}: {e}\n{traceback.format_exc()}'))
+
+    ring.close()
+
+
+class InferenceWorker:
+    """
+    Run the `MLModel` predictions and the co-learning training in a dedicated process, so the model
+    work and the render loop do not share the GIL.
+
+    The windows are copied into a shared memory ring (see `SharedRing`), and the requests on the pipe
+    are only the samples range of the window. The worker answers the requests in order. Training is
+    asynchronous: `partial_fit` returns at once, and the next prediction waits for the retrain, like
+    the in-process model. After each retrain the worker pickles its model to `persist_path`.
+
+    If the worker process dies it is restarted (up to `max_restarts` times) with the initial model
+    and the co-learning trials sent since, and the request in flight is sent again.
+
+    Usage:
+        with InferenceWorker(model) as worker:
+            prediction = worker.online_predict(window, eeg)
+            worker.partial_fit(eeg, window, label)
+
+    Attributes:
+
+        model (MLModel):
+            The initial model (the worker trains its own copy).
+
+        persist_path (Optional[str]):
+            The pickle of the worker model, updated after each retrain.
+
+        timeout (float):
+            The seconds to wait for a reply before failing.
+
+        max_restarts (int):
+            The restarts allowed after worker crashes.
+
+        restarts (int):
+            The number of restarts so far.
+
+        n_trials (int):
+            The trials of the worker model (including the requested co-learning trials).
+    """
+
+    def __init__(self, model, persist_path: Optional[str] = None, capacity: int = WINDOWS_CAPACITY,
+                 timeout: float = 60., max_restarts: int = 3, context: str = 'spawn'):
+
+        self.model = model
+        self.persist_path: Optional[str] = persist_path
+        self.timeout: float = timeout
+        self.max_restarts: int = max_restarts
+        self.restarts: int = 0
+        self.n_trials: int = len(model.labels)
+
+        self._context = multiprocessing.get_context(context)
+        self._model_bytes: bytes = pickle.dumps(model)
+        self._n_channels: int = model.buffer.n_channels
+        self._capacity: int = capacity
+        self._ring: Optional[SharedRing] = None
+        self._process = None
+        self._conn = None
+
+        # The requests waiting for replies: (kind, window start, window stop, request), and the co-learning trials
+        self._pending: Deque[Tuple[str, Optional[int], Optional[int], tuple]] = deque()
+        self._fits: List[Tuple[NDArray, int]] = []
+        self._rates: Optional[_Rates] = None
+
+    @property
+    def alive(self) -> bool:
+        return self._process is not None and self._process.is_alive()
+
+    def start(self):
+        """Start the worker process"""
+        if self._ring is None:
+            self._ring = SharedRing.create(self._n_channels, self._capacity, sfreq=0)
+
+        self._conn, child_conn = self._context.Pipe()
+        self._process = self._context.Process(target=_serve, name='inference-worker', daemon=True,
+                                              args=(child_conn, self._model_bytes, self._ring.name,
+                                                    self.persist_path))
+        self._process.start()
+        child_conn.close()
+
+    def close(self):
+        """Stop the worker process (after the pending requests) and remove the windows ring"""
+        if self._process is not None:
+            try:
+                self._conn.send(('stop',))
+            except (BrokenPipeError, OSError):
+                pass
+            self._process.join(self.timeout)
+            if self._process.is_alive():
+                self._process.terminate()
+                self._process.join()
+            self._conn.close()
+            self._process = self._conn = None
+
+        if self._ring is not None:
+            self._ring.close()
+            self._ring = None
+        self._pending.clear()
+
+    def __enter__(self) -> 'InferenceWorker':
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _write(self, window: NDArray) -> Tuple[int, int]:
+        """Copy the window into the ring, after the windows of the pending requests were read"""
+        n_samples = window.shape[1]
+        if n_samples > self._capacity:
+            raise ValueError(f'The window has {n_samples} samples, the worker ring holds {self._capacity}')
+
+        start = self._ring.written
+        while self._oldest_window() is not None and start + n_samples - self._oldest_window() > self._capacity:
+            self._receive()
+
+        self._ring.write(np.asarray(window, dtype=np.float64))
+        return start, start + n_samples
+
+    def _oldest_window(self) -> Optional[int]:
+        """The first sample in the ring a pending request still needs"""
+        return next((start for _, start, _, _ in self._pending if start is not None), None)
+
+    def _send(self, kind: str, request: tuple):
+        window = request[1:3] if kind in ('predict', 'fit') else (None, None)
+        self._pending.append((kind, *window, request))
+        try:
+            self._conn.send(request)
+        except (BrokenPipeError, OSError):
+            # The worker died, the request is sent again after the restart (see `_receive`)
+            pass
+
+    def _receive(self):
+        """Wait for the reply of the oldest pending request, restart the worker if it died"""
+        deadline = time.perf_counter() + self.timeout
+        while True:
+            try:
+                if self._conn.poll(0.05):
+                    status, result = self._conn.recv()
+                    break
+            except (EOFError, OSError):
+                pass
+            else:
+                if self.alive:
+                    if time.perf_counter() > deadline:
+                        raise WorkerError(f'The worker did not reply in {self.timeout} seconds')
+                    continue
+            # The restarted worker has the whole timeout for its reply (its startup imports are slow)
+            self._recover()
+            deadline = time.perf_counter() + self.timeout
+
+        self._pending.popleft()
+        if status == 'error':
+            raise WorkerError(result)
+        return result
+
+    def _recover(self):
+        """Restart a crashed worker with its co-learning trials, and resend the pending predictions"""
+        self.restarts += 1
+        if self.restarts > self.max_restarts:
+            raise WorkerError(f'The worker crashed more than {self.max_restarts} times')
+        print(f'Inference worker crashed (exit code {self._process.exitcode}), restarting')
+
+        self._conn.close()
+        self.start()
+
+        # The trials of the pending fits are in the replay, the other pending requests are sent again
+        pending = [p for p in self._pending if p[0] not in ('fit', 'replay')]
+        self._pending.clear()
+        self._send('replay', ('replay', [w for w, _ in self._fits], [y for _, y in self._fits], self._rates))
+        for kind, _, _, request in pending:
+            self._send(kind, request)
+
+        # The replay is the oldest pending request, its reply is received by the caller (see `_receive`),
+        # so a worker which crashes again is restarted up to `max_restarts` as well
+
+    def wait(self):
+        """Wait until the worker answered all the requests (e.g. the last retrain)"""
+        while self._pending:
+            self._receive()
+
+    def _reply(self):
+        """Wait for the replies of all the pending requests, return the reply of the last one (the caller's)"""
+        result = None
+        while self._pending:
+            result = self._receive()
+        return result
+
+    def online_predict(self, data: NDArray, eeg, return_scores: bool = False, trace=None):
+        """Predict the window in the worker, the same as `MLModel.online_predict`"""
+        rates = _Rates(eeg.sfreq, getattr(eeg, 'channels_sfreq', eeg.sfreq))
+        start, stop = self._write(data)
+        self._send('predict', ('predict', start, stop, rates))
+        prediction, scores, marks = self._reply()
+
+        if trace is not None:
+            trace.extend(marks)
+
+        return (prediction, scores) if return_scores else prediction
+
+    def partial_fit(self, eeg, X: NDArray, y: int):
+        """Retrain the worker model with the window, without waiting for the training"""
+        rates = _Rates(eeg.sfreq, getattr(eeg, 'channels_sfreq', eeg.sfreq))
+        start, stop = self._write(X)
+        self._fits.append((np.array(X, dtype=np.float64), y))
+        self._rates = rates
+        self._send('fit', ('fit', start, stop, rates, y))
+        self.n_trials += 1
+
+    def fetch_model(self):
+        """Return a copy of the current worker model (after the pending retrains)"""
+        self._send('model', ('model',))
+        return pickle.loads(self._reply())
@@ -1,17 +1,23 @@
 import os
 import pickle
-from typing import List
-import mne
+from typing import List, Optional
 import pandas as pd
+from bci4als.buffer import EpochBuffer
+from bci4als.dataset import EpochCache, band_pass, preprocess_epochs
 from bci4als.eeg import EEG
+from bci4als.multirate import decimate, decimation_factor
+from bci4als.profiling import PROFILER, profiled
+from bci4als.tracing import DecisionTrace
 import numpy as np
 from matplotlib.figure import Figure
-from mne.channels import make_standard_montage
 from mne.decoding import CSP
 from nptyping import NDArray
 from sklearn.discriminant_analysis import LinearDiscriminantAnalysis
 from sklearn.pipeline import Pipeline
 
+# The band-pass of the model
+L_FREQ, H_FREQ = 7., 30.
+
 
 class MLModel:
     """
@@ -21,77 +27,195 @@ class MLModel:
 
     Attributes
     ----------
+    buffer : EpochBuffer
+        the training trials & labels, in one contiguous array which grows with the co-learning updates
     trials : list
-        a formatted string to print out what the animal says
+        the training trials (views of the buffer), each with the shape (channels, samples)
+    labels : NDArray
+        the labels of the training trials
+    channels : list
+        the indices of the channels the model uses (reduced montage), all the channels if None
+    decimate : bool
+        process the trials and the windows at the lowest rate which keeps the model band
+    decimation : int
+        the decimation factor of the buffer trials (1 until the trials are decimated)
+    dtype : np.dtype
+        the samples type of the trials, the windows and the filtering (float32 for single precision)
     """
 
-    def __init__(self, trials: List[pd.DataFrame], labels: List[int]):
-
-        self.trials: List[NDArray] = [t.to_numpy().T for t in trials]
-        self.labels: List[int] = labels
+    def __init__(self, trials: List[pd.DataFrame], labels: List[int], sfreq: Optional[float] = None,
+                 channels: Optional[List[int]] = None, decimate: bool = False, dtype=np.float64):
+
+        # The trials are DataFrames (samples, channels) or arrays (channels, samples)
+        self.dtype: np.dtype = np.dtype(dtype)
+        self.buffer: EpochBuffer = EpochBuffer(capacity=max(2 * len(trials), 16), dtype=self.dtype)
+        self.buffer.extend(trials, labels)
+        self.sfreq: Optional[float] = sfreq
+        self.channels: Optional[List[int]] = None if channels is None else list(channels)
+        self.decimate: bool = decimate
+        self.decimation: int = 1
         self.debug = True
         self.clf = None
 
-    def offline_training(self, eeg: EEG, model_type: str = 'csp_lda'):
+    def __setstate__(self, state):
+        # Models pickled before the buffer keep the trials & labels as lists
+        if 'buffer' not in state:
+            buffer = EpochBuffer(capacity=max(2 * len(state['trials']), 16))
+            buffer.extend(state.pop('trials'), state.pop('labels'))
+            state['buffer'] = buffer
+        state.setdefault('sfreq', None)
+        state.setdefault('channels', None)
+        state.setdefault('decimate', False)
+        state.setdefault('decimation', 1)
+        state.setdefault('dtype', np.dtype(np.float64))
+        self.__dict__.update(state)
+
+    @property
+    def trials(self) -> List[NDArray]:
+        return self.buffer.to_list()
+
+    @property
+    def labels(self) -> NDArray:
+        return self.buffer.labels
+
+    def offline_training(self, eeg: Optional[EEG], model_type: str = 'csp_lda', cache: Optional[EpochCache] = None):
 
         if model_type.lower() == 'csp_lda':
 
-            self._csp_lda(eeg)
+            self._csp_lda(eeg, cache)
 
         else:
 
             raise NotImplementedError(f'The model type `{model_type}` is not implemented yet')
 
-    def _csp_lda(self, eeg: EEG):
+    def _csp_lda(self, eeg: Optional[EEG], cache: Optional[EpochCache] = None):
 
         print('Training CSP & LDA model')
-
-        # convert data to mne.Epochs
-        ch_names = eeg.get_board_names()
-        ch_types = ['eeg'] * len(ch_names)
-        sfreq: int = eeg.sfreq
-        n_samples: int = min([t.shape[1] for t in self.trials])
-        epochs_array: np.ndarray = np.stack([t[:, :n_samples] for t in self.trials])
-
-        info = mne.create_info(ch_names, sfreq, ch_types)
-        epochs = mne.EpochsArray(epochs_array, info)
-
-        # set montage
-        montage = make_standard_montage('standard_1020')
-        epochs.set_montage(montage)
-
-        # Apply band-pass filter
-        epochs.filter(7., 30., fir_design='firwin', skip_by_annotation='edge', verbose=False)
+        epochs_data = self.training_epochs(eeg, cache)
 
         # Assemble a classifier
+        self.clf = self.csp_lda_pipeline(min(6, epochs_data.shape[1]))
+
+        # fit transformer and classifier to data (the MNE CSP estimates the covariances in double precision)
+        with PROFILER.span('fit', 'model', n_trials=len(epochs_data)):
+            self.clf.fit(epochs_data, self.labels)
+
+    def training_epochs(self, eeg: Optional[EEG] = None, cache: Optional[EpochCache] = None) -> NDArray:
+        """
+        Return the preprocessed epochs the classifier is trained on, e.g. to cross validate the model.
+        :param eeg: the EEG of the trials, None for the model sampling rate
+        :param cache: the preprocessed epochs cache
+        :return: float64 epochs with the shape (n_trials, n_channels, n_samples)
+        """
+        # The trials cut to the shortest trial, a view of the buffer (without EEG the model sampling rate is used)
+        if self.decimate:
+            self._decimate_trials(self._trials_sfreq(eeg))
+        sfreq: int = self._trials_sfreq(eeg)
+        epochs_array: np.ndarray = self.buffer.epochs()
+        if self.channels is not None:
+            epochs_array = epochs_array[:, self.channels]
+
+        # Apply band-pass filter (taken from the cache if the same trials were already filtered)
+        precision = {} if self.dtype == np.float64 else {'dtype': self.dtype.name}
+        with PROFILER.span('filter', 'model', n_trials=len(epochs_array)):
+            if cache is not None:
+                epochs_data = cache.preprocess(epochs_array, sfreq, l_freq=L_FREQ, h_freq=H_FREQ, **precision)
+            else:
+                epochs_data = preprocess_epochs(epochs_array, sfreq, l_freq=L_FREQ, h_freq=H_FREQ, **precision)
+
+        return np.asarray(epochs_data, dtype=np.float64)
+
+    def _trials_sfreq(self, eeg: Optional[EEG]) -> float:
+        """The sampling rate of the buffer trials: the model rate once decimated, else the EEG rate"""
+        return eeg.sfreq if eeg is not None and self.decimation == 1 else self.sfreq
+
+    def _decimate_trials(self, sfreq: float):
+        """
+        Decimate the buffer trials to the lowest rate which keeps the model band, once.
+        The model sampling rate becomes the decimated rate.
+        :param sfreq: the sampling rate of the buffer trials
+        """
+        factor = decimation_factor(sfreq, H_FREQ)
+        if self.decimation > 1 or factor == 1:
+            return
+
+        buffer = EpochBuffer(capacity=self.buffer.capacity, dtype=self.buffer.dtype)
+        buffer.extend([decimate(trial, factor) for trial in self.buffer.to_list()], self.buffer.labels)
+        self.buffer, self.sfreq, self.decimation = buffer, sfreq / factor, factor
+
+    def _to_model_rate(self, data: NDArray, eeg: Optional[EEG]):
+        """
+        Decimate a window of `eeg.get_channels_data` to the rate of the buffer trials.
+        Without EEG the window is at the model sampling rate.
+        :return: the window and its sampling rate
+        :raise ValueError: if the window rate is not an integer multiple of the trials rate (e.g. the EEG
+                           decimates and the model does not)
+        """
+        if eeg is None:
+            return data, self.sfreq
+
+        sfreq, trials_sfreq = getattr(eeg, 'channels_sfreq', eeg.sfreq), self._trials_sfreq(eeg)
+        factor = int(round(sfreq / trials_sfreq))
+        if factor < 1 or abs(sfreq / trials_sfreq - factor) > 1e-6:
+            raise ValueError(f'The window rate ({sfreq:g} Hz) is not a multiple of the trials rate '
+                             f'({trials_sfreq:g} Hz), train the model with decimate=True to decimate the EEG')
+        if factor > 1:
+            return decimate(data, factor), sfreq / factor
+
+        return data, sfreq
+
+    @staticmethod
+    def csp_lda_pipeline(n_components: int = 6) -> Pipeline:
+        """Return new (unfitted) CSP & LDA pipeline"""
         lda = LinearDiscriminantAnalysis()
-        csp = CSP(n_components=6, reg=None, log=True, norm_trace=False)
+        csp = CSP(n_components=n_components, reg=None, log=True, norm_trace=False)
 
         # Use scikit-learn Pipeline
-        self.clf = Pipeline([('CSP', csp), ('LDA', lda)])
-
-        # fit transformer and classifier to data
-        self.clf.fit(epochs.get_data(), self.labels)
-
-    def online_predict(self, data: NDArray, eeg: EEG):
-        # Prepare the data to MNE functions
-        data = data.astype(np.float64)
-
-        # Filter the data ( band-pass only)
-        data = mne.filter.filter_data(data, l_freq=8, h_freq=30, sfreq=eeg.sfreq, verbose=False)
-
-        # Predict
-        prediction = self.clf.predict(data[np.newaxis])[0]
+        return Pipeline([('CSP', csp), ('LDA', lda)])
+
+    def online_predict(self, data: NDArray, eeg: EEG, return_scores: bool = False,
+                       trace: Optional[DecisionTrace] = None):
+        # Prepare the data to MNE functions (only the channels of the model)
+        data = data.astype(self.dtype) if self.channels is None else data[self.channels].astype(self.dtype)
+
+        # Filter the data ( band-pass only) at the rate of the model
+        with PROFILER.span('filter', 'model'):
+            data, sfreq = self._to_model_rate(data, eeg)
+            data = band_pass(data.astype(self.dtype, copy=False), sfreq, l_freq=8, h_freq=H_FREQ)
+        if trace is not None:
+            trace.mark('filter')
+
+        # Features (CSP spatial filter & log variance) & classifier (LDA) stages of the pipeline
+        with PROFILER.span('feature', 'model'):
+            features = self.clf[:-1].transform(data[np.newaxis])
+        if trace is not None:
+            trace.mark('feature')
+
+        with PROFILER.span('predict', 'model'):
+            if not return_scores:
+                prediction = self.clf[-1].predict(features)[0]
+            else:
+                # Predict from the decision scores, the same way LDA does
+                scores = self.clf[-1].decision_function(features)[0]
+                classes = self.clf.classes_
+                prediction = classes[int(scores > 0)] if np.ndim(scores) == 0 else classes[np.argmax(scores)]
+        if trace is not None:
+            trace.mark('predict')
+
+        if return_scores:
+            return prediction, scores
 
         return prediction
 
-    def partial_fit(self, eeg, X: NDArray, y: int):
+    def add_trial(self, eeg, X: NDArray, y: int):
+        """Append a window of `eeg.get_channels_data` & its label to the trials, without training"""
+        self.buffer.append(self._to_model_rate(X, eeg)[0], y)
 
-        # Append X to trials
-        self.trials.append(X)
+    @profiled('retrain', 'model')
+    def partial_fit(self, eeg, X: NDArray, y: int):
 
-        # Append y to labels
-        self.labels.append(y)
+        # Append X & y to the trials buffer, at the rate of the trials
+        self.add_trial(eeg, X, y)
 
         # Fit with trials and labels
         self._csp_lda(eeg)
@@ -2,8 +2,12 @@ import os
 import time
 from typing import Optional, List
 from PyQt5.QtCore import Qt
+from bci4als.artifacts import ArtifactGate
 from bci4als.eeg import EEG
+from bci4als.idle import IdleDetector
 from bci4als.ml_model import MLModel
+from bci4als.profiling import PROFILER
+from bci4als.tracing import DecisionTrace, LatencyTracer
 from pynput.mouse import Button
 from pynput.mouse import Controller as Controller_mouse
 from pynput.keyboard import Key
@@ -79,7 +83,8 @@ class MouseConfig(QWidget):
 
 class VirtualMouse:
 
-    def __init__(self, eeg: EEG, model: MLModel, mouse_actions: List[str]):
+    def __init__(self, eeg: EEG, model: MLModel, mouse_actions: List[str],
+                 idle_detector: Optional[IdleDetector] = None, artifact_gate: Optional[ArtifactGate] = None):
 
         self.mouse = Controller_mouse()
         self.keyboard = Controller_keyboard()
@@ -90,6 +95,19 @@ class VirtualMouse:
         self.eeg: EEG = eeg
         self.model: MLModel = model
 
+        # Standstill detection from the mouse move events
+        self.idle_detector: IdleDetector = idle_detector if idle_detector is not None else IdleDetector()
+
+        # Optionally reject the windows with artifacts instead of acting on them
+        self.artifact_gate: Optional[ArtifactGate] = artifact_gate
+
+        # Latency of each decision from the newest sample until the action fired
+        self.tracer = LatencyTracer(clock=eeg.sample_clock)
+        self._trace: Optional[DecisionTrace] = None
+
+        # The time (`time.perf_counter`) of the last acquisition, the board has no data before it
+        self._last_acquisition: Optional[float] = None
+
         # Assert all actions from the config object exist in the virtual mouse object
         self.assert_actions(mouse_actions)
 
@@ -105,47 +123,59 @@ class VirtualMouse:
 
                 raise ValueError(f'The action `{a}` is in ConfigMouse but not implemented in VirtualMouse')
 
-    def monitor(self, r: float, counter_limit: int, interval: float) -> bool:
-
-        x_center, y_center = self.mouse.position
-        counter = 0
-
-        while counter < counter_limit:
-
-            x, y = self.mouse.position
-
-            if ((x - x_center) ** 2) + ((y - y_center) ** 2) < r ** 2:
-
-                counter += 1
-                # print(f'Counter: {counter}')
-
-            else:
-
-                x_center, y_center = x, y
-                counter = 0
+    def wait_idle(self, timeout: Optional[float] = None) -> Optional[float]:
+        """
+        Wait until the cursor stands still.
+        :param timeout: the maximal seconds to wait, forever by default
+        :return: the time the motion stopped (`time.perf_counter`), or None on timeout
+        """
+        with PROFILER.span('idle', 'mouse'):
+            motion_stop = self.idle_detector.wait_idle(timeout)
+        if motion_stop is not None:
+            print('No movement monitored...')
 
-            time.sleep(interval)
+        return motion_stop
 
-        print('No movement monitored...')
+    def monitor(self, r: float, counter_limit: int, interval: float) -> bool:
+        """
+        Wait until the cursor stands still for `counter_limit * interval` seconds in a circle of radius `r`.
+        Kept for old scripts, use `wait_idle`.
+        """
+        self.idle_detector.r, self.idle_detector.dwell = r, counter_limit * interval
+        self.wait_idle()
         return True
 
-    def predict(self, buffer_time: int) -> int:
+    def predict(self, buffer_time: int, since: Optional[float] = None) -> Optional[int]:
         """
         Predict the label the user imagined.
         :param buffer_time: time of data acquisition in seconds
-        :return:
+        :param since: the time the acquisition started (`time.perf_counter`), e.g. when the motion stopped,
+                      now by default
+        :return: the label, or None if the artifact gate rejected the window
         """
         # todo: what about the threshold? predict according the first label?
 
-        # Sleep in order to get EEG data
+        # Sleep until the EEG window since the given time is full (the acquisition drains the board,
+        # so the window starts after the previous acquisition)
         print('Predicting label...')
-        time.sleep(buffer_time)
+        since = time.perf_counter() if since is None else since
+        if self._last_acquisition is not None:
+            since = max(since, self._last_acquisition)
+        with PROFILER.span('buffer', 'mouse'):
+            time.sleep(max(buffer_time - (time.perf_counter() - since), 0))
+
+        # Data Acquisition (the last buffer time of the data)
+        data = self.eeg.get_channels_data()[:, -int(buffer_time * self.eeg.channels_sfreq):]
+        self._last_acquisition = time.perf_counter()
+        if self.artifact_gate is not None and not self.artifact_gate.accept(data):
+            print(f'Window rejected: {self.artifact_gate.last_reasons}')
+            return None
 
-        # Data Acquisition
-        data = self.eeg.get_channels_data()
+        self._trace = self.tracer.start(self.eeg.last_sample_time)
+        self._trace.mark('acquire')
 
         # Predict label
-        prediction = self.model.online_predict(data, eeg=self.eeg)
+        prediction = self.model.online_predict(data, eeg=self.eeg, trace=self._trace)
 
         return prediction
 
@@ -161,7 +191,14 @@ class VirtualMouse:
 
         if action is not None:
 
-            self.actions[action.lower()]()
+            with PROFILER.span('action', 'mouse', action=action):
+                self.actions[action.lower()]()
+
+        # Close the trace of the decision which led to the action
+        if self._trace is not None:
+            self._trace.mark('action')
+            self._trace.finish()
+            self._trace = None
 
     def right_click(self):
         self.mouse.press(Button.right)
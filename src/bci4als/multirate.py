@@ -0,0 +1,120 @@
+from typing import Optional
+
+import numpy as np
+from nptyping import NDArray
+from scipy.signal import firwin, resample_poly
+
+# The processing rate is at least this factor above the high cut frequency of the model band,
+# so the band is far from the new Nyquist frequency and the anti-aliasing filter transition
+NYQUIST_MARGIN = 2.5
+
+
+def decimation_factor(sfreq: float, h_freq: Optional[float], margin: float = NYQUIST_MARGIN) -> int:
+    """
+    Choose the integer decimation factor for the band of the model.
+    :param sfreq: the input sampling rate
+    :param h_freq: the high cut frequency of the model band (None for no decimation)
+    :param margin: the minimal ratio of the new rate to the high cut frequency
+    :return: the largest factor which keeps the rate at least margin * h_freq (1 for no decimation)
+    """
+    if h_freq is None:
+        return 1
+
+    return max(int(sfreq // (margin * h_freq)), 1)
+
+
+def _anti_alias_taps(factor: int) -> NDArray:
+    """The low-pass filter of the decimation, the same design as `scipy.signal.resample_poly`"""
+    half_len = 10 * factor
+    return firwin(2 * half_len + 1, 1. / factor, window=('kaiser', 5.0))
+
+
+def decimate(data: NDArray, factor: int) -> NDArray:
+    """
+    Anti-aliased polyphase decimation of a whole window or epochs (zero phase, the samples stay aligned).
+    :param data: array with the samples in the last axis
+    :param factor: the decimation factor
+    :return: array with `ceil(n_samples / factor)` samples
+    """
+    if factor == 1:
+        return data
+
+    return resample_poly(data, 1, factor, axis=-1, padtype='line')
+
+
+class Decimator:
+    """
+    Streaming anti-aliased polyphase decimation of the acquisition.
+
+    The chunks may have any length: the filter tail and the phase are kept between the chunks, so the
+    output is the same as decimating the whole stream at once. Only the kept output samples are
+    computed (polyphase), which is `factor` times cheaper than filtering and then dropping samples.
+    The filter is causal and delays the stream by `delay` seconds.
+
+    Usage:
+        decimator = Decimator(sfreq=500, h_freq=30)   # 500 Hz -> 83.3 Hz
+        low_rate_chunk = decimator.process(chunk)
+
+    Attributes:
+
+        factor (int):
+            The decimation factor.
+
+        sfreq_in (float):
+            The input sampling rate.
+
+        sfreq (float):
+            The output sampling rate.
+
+        taps (NDArray):
+            The anti-aliasing low-pass filter.
+    """
+
+    def __init__(self, sfreq: float, factor: Optional[int] = None, h_freq: Optional[float] = 30.):
+
+        self.factor: int = factor if factor is not None else decimation_factor(sfreq, h_freq)
+        self.sfreq_in: float = sfreq
+        self.sfreq: float = sfreq / self.factor
+        self.taps: NDArray = _anti_alias_taps(self.factor) if self.factor > 1 else np.ones(1)
+
+        self._tail: Optional[NDArray] = None
+        self._skip: int = 0  # input samples to skip until the next kept output
+
+    @property
+    def delay(self) -> float:
+        """The group delay of the filter in seconds"""
+        return (len(self.taps) - 1) / 2 / self.sfreq_in
+
+    def reset(self):
+        """Forget the stream, the next chunk starts a new stream"""
+        self._tail, self._skip = None, 0
+
+    def process(self, chunk: NDArray) -> NDArray:
+        """
+        Decimate the next chunk of the stream.
+        :param chunk: array with the shape (n_channels, n_samples)
+        :return: array with the shape (n_channels, n_output_samples)
+        """
+        if self.factor == 1:
+            return chunk
+
+        # Single precision chunks are decimated in single precision
+        dtype = np.float32 if chunk.dtype == np.float32 else np.float64
+        n_taps = len(self.taps)
+        if self._tail is None:
+            # The stream starts at rest (zeros before the first sample)
+            self._tail = np.zeros((chunk.shape[0], n_taps - 1), dtype=dtype)
+
+        # Output m uses the n_taps input samples which end at its input sample
+        signal = np.concatenate([self._tail.astype(dtype, copy=False), np.asarray(chunk, dtype=dtype)], axis=1)
+        ends = np.arange(n_taps - 1 + self._skip, signal.shape[1], self.factor)
+        if len(ends):
+            windows = np.lib.stride_tricks.sliding_window_view(signal, n_taps, axis=1)[:, ends - (n_taps - 1)]
+            output = windows @ self.taps[::-1].astype(dtype)
+            self._skip = ends[-1] + self.factor - signal.shape[1]
+        else:
+            output = np.zeros((chunk.shape[0], 0), dtype=dtype)
+            self._skip -= chunk.shape[1]
+
+        self._tail = signal[:, signal.shape[1] - (n_taps - 1):]
+        return output
@@ -0,0 +1,179 @@
+import functools
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+# Name of the trace file inside the session directory
+TRACE_FILE = 'trace.json'
+
+# Set to 1 to enable the profiler of the process on import
+PROFILE_ENV = 'BCI4ALS_PROFILE'
+
+
+class _NullSpan:
+    """The span of a disabled profiler, does nothing"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    """A timed stage, recorded as a complete event when it exits"""
+    __slots__ = ('profiler', 'name', 'category', 'args', 'start')
+
+    def __init__(self, profiler: 'Profiler', name: str, category: str, args: Dict[str, Any]):
+        self.profiler, self.name, self.category, self.args = profiler, name, category, args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        self.profiler.add(self.name, self.category, 'X', self.start, end - self.start, self.args)
+        return False
+
+
+class Profiler:
+    """
+    Time the stages of the pipeline (acquire, filter, feature, predict, retrain, persist, render...)
+    and export them as a Chrome trace, which opens in chrome://tracing or https://ui.perfetto.dev.
+
+    When disabled, a span is a shared object which does nothing, so the hooks can stay in the hot paths.
+    The process profiler is `PROFILER`, enabled with `PROFILER.enable()` or the environment variable
+    BCI4ALS_PROFILE=1.
+
+    Usage:
+        with PROFILER.span('filter', 'model', n_samples=500):
+            data = filter_data(data)
+
+    Attributes:
+
+        enabled (bool):
+            Record the spans or not.
+
+        events (List[Dict[str, Any]]):
+            The recorded events, in the Chrome trace event format.
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled: bool = enabled
+        self.events: List[Dict[str, Any]] = []
+        self._origin: float = time.perf_counter()
+        self._threads: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def clear(self):
+        """Remove the recorded events and restart the trace time"""
+        with self._lock:
+            self.events, self._threads = [], {}
+            self._origin = time.perf_counter()
+
+    def span(self, name: str, category: str = 'stage', **args):
+        """
+        Return a context manager which times the stage.
+        :param name: the stage name
+        :param category: the component of the stage (e.g. 'eeg', 'model', 'online')
+        :param args: extra data shown with the event
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+
+        return _Span(self, name, category, args)
+
+    def instant(self, name: str, category: str = 'stage', **args):
+        """Record an event without duration (e.g. a marker)"""
+        if self.enabled:
+            self.add(name, category, 'i', time.perf_counter(), None, args)
+
+    def add(self, name: str, category: str, phase: str, start: float, duration: Optional[float],
+            args: Dict[str, Any]):
+        """Record an event, times in seconds of `time.perf_counter`"""
+        thread = threading.current_thread()
+        event = {'name': name, 'cat': category, 'ph': phase, 'ts': (start - self._origin) * 1e6,
+                 'pid': os.getpid(), 'tid': thread.ident}
+        if duration is not None:
+            event['dur'] = duration * 1e6
+        if phase == 'i':
+            event['s'] = 't'
+        if args:
+            event['args'] = args
+
+        with self._lock:
+            self.events.append(event)
+            self._threads.setdefault(thread.ident, thread.name)
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        """Return the trace in the Chrome trace JSON format, with the names of the threads"""
+        with self._lock:
+            names = [{'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': tid, 'args': {'name': name}}
+                     for tid, name in self._threads.items()]
+            return {'traceEvents': names + list(self.events), 'displayTimeUnit': 'ms'}
+
+    def save(self, path: str):
+        """Save the trace as Chrome trace JSON file"""
+        with open(path, 'w') as file:
+            json.dump(self.to_chrome_trace(), file, default=str)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Return the count, total and mean duration (ms) of each stage"""
+        durations: Dict[str, List[float]] = {}
+        with self._lock:
+            for event in self.events:
+                if event['ph'] == 'X':
+                    durations.setdefault(f"{event['cat']}.{event['name']}", []).append(event['dur'] / 1000)
+
+        return {name: {'count': len(d), 'total_ms': float(np.sum(d)), 'mean_ms': float(np.mean(d))}
+                for name, d in durations.items()}
+
+
+# The profiler of the process
+PROFILER = Profiler(enabled=os.environ.get(PROFILE_ENV) == '1')
+
+
+def profiled(name: str, category: str = 'stage') -> Callable:
+    """Decorator which times every call of the function as a span of the process profiler"""
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not PROFILER.enabled:
+                return func(*args, **kwargs)
+            with PROFILER.span(name, category):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def save_session_trace(session_directory: str) -> Optional[str]:
+    """
+    Save the trace of the session, if the profiler is enabled, and start a new trace for the next session.
+    :param session_directory: the session folder
+    :return: the trace path, or None if the profiler is disabled
+    """
+    if not PROFILER.enabled:
+        return None
+
+    path = os.path.join(session_directory, TRACE_FILE)
+    PROFILER.save(path)
+    print(f'Profiling summary: {PROFILER.summary()}')
+    PROFILER.clear()
+
+    return path
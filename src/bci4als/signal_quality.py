@@ -0,0 +1,242 @@
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from nptyping import NDArray
+
+# The channel states, in the order of precedence
+OK = 'ok'
+RAILED = 'railed'
+FLAT = 'flat'
+NOISY = 'noisy'
+LINE_NOISE = 'line_noise'
+STATES = (RAILED, FLAT, NOISY, LINE_NOISE)
+
+# The input range of the Cyton & Daisy ADC (4.5 V reference, gain 24), in uV
+CYTON_RAIL = 4.5 / 24 * 1e6
+
+
+class SignalQualityMonitor:
+    """
+    Monitor the signal quality of each channel on the acquisition stream, to find bad electrodes
+    during the session instead of after it.
+
+    The stream is fed chunk by chunk (`update`), and the statistics are of the last `window` seconds.
+    They are running statistics over a ring of the window samples: each chunk adds its samples to the
+    sums and removes the samples it overwrites, vectorized over the channels & the samples, so the
+    cost is linear in the chunk and not in the window. The sums are recomputed from the ring on
+    each wrap around, so the rounding errors do not accumulate.
+        rms        - the RMS of the channel around its mean (uV)
+        line_ratio - the fraction of the channel power at `line_freq`, from a sliding DFT bin
+        railed     - the fraction of the samples near the ADC rails (`rail_fraction` of `rail`)
+    A channel is `railed` if more than `railed_max` of its samples are railed, `flat` if the RMS is
+    below `flat_rms`, `noisy` if the RMS is above `rms_max`, and `line_noise` if the line ratio
+    is above `line_max`.
+
+    Usage:
+        monitor = SignalQualityMonitor(eeg.sfreq, eeg.eeg_names)
+        monitor.update(chunk)
+        print(monitor.bad_channels())
+
+    Attributes:
+
+        sfreq (float):
+            The sampling rate of the stream.
+
+        ch_names (List[str]):
+            The channels of the stream.
+
+        n_window (int):
+            The samples of the window.
+
+        written (int):
+            The number of samples fed so far.
+    """
+
+    def __init__(self, sfreq: float, ch_names: List[str], window: float = 2., line_freq: Optional[float] = 50.,
+                 rms_max: float = 100., flat_rms: float = 0.5, line_max: float = 0.5,
+                 rail: float = CYTON_RAIL, rail_fraction: float = 0.9, railed_max: float = 0.1):
+
+        self.sfreq: float = sfreq
+        self.ch_names: List[str] = list(ch_names)
+        self.rms_max: float = rms_max
+        self.flat_rms: float = flat_rms
+        self.line_max: float = line_max
+        self.rail_level: float = rail_fraction * rail
+        self.railed_max: float = railed_max
+
+        # The line frequency must be below Nyquist to be measured
+        self.line_freq: Optional[float] = line_freq if line_freq is not None and line_freq < sfreq / 2 else None
+
+        self.n_window: int = max(int(round(window * sfreq)), 2)
+        self.written: int = 0
+        self._ring: NDArray = np.zeros((len(self.ch_names), self.n_window))
+
+        # Running sums of the window: samples, squares, railed samples and the line DFT bin
+        self._sum: NDArray = np.zeros(len(self.ch_names))
+        self._sum_sq: NDArray = np.zeros(len(self.ch_names))
+        self._railed: NDArray = np.zeros(len(self.ch_names))
+        self._line: NDArray = np.zeros(len(self.ch_names), dtype=np.complex128)
+
+    @property
+    def n_samples(self) -> int:
+        """The samples in the window (less than `n_window` at the beginning of the stream)"""
+        return min(self.written, self.n_window)
+
+    def reset(self):
+        """Forget the stream, e.g. when the board is restarted"""
+        self.written = 0
+        self._ring[:] = 0
+        self._sum[:] = self._sum_sq[:] = self._railed[:] = 0
+        self._line[:] = 0
+
+    def _phasors(self, start: int, stop: int) -> NDArray:
+        """The DFT phasors of the line frequency at the absolute sample indices [start, stop)"""
+        # The phase is reduced per sample index, so it stays exact in long sessions
+        cycles = (np.arange(start, stop) * self.line_freq) % self.sfreq
+        return np.exp(-2j * np.pi * cycles / self.sfreq)
+
+    def _phasors_sum(self) -> complex:
+        """The sum of the line phasors over the window (to remove the mean from the line bin)"""
+        if self.line_freq is None or self.n_samples == 0:
+            return 0j
+        return self._phasors(self.written - self.n_samples, self.written).sum()
+
+    def update(self, data: NDArray):
+        """
+        Add the new samples of the stream to the window statistics.
+        :param data: the new samples, (n_channels, n_samples) in uV
+        """
+        data = np.asarray(data, dtype=np.float64)
+        n_new = data.shape[1]
+        if n_new == 0:
+            return
+
+        # A chunk longer than the window replaces it
+        if n_new >= self.n_window:
+            start = self.written + n_new - self.n_window
+            self._ring[:, np.arange(start, start + self.n_window) % self.n_window] = data[:, -self.n_window:]
+            self.written += n_new
+            self._recompute()
+            return
+
+        # Remove the overwritten samples (the ring starts with zeros, which add nothing) and add the new ones
+        slots = np.arange(self.written, self.written + n_new) % self.n_window
+        old = self._ring[:, slots]
+        self._sum += data.sum(axis=1) - old.sum(axis=1)
+        self._sum_sq += np.einsum('ij,ij->i', data, data) - np.einsum('ij,ij->i', old, old)
+        self._railed += (np.abs(data) >= self.rail_level).sum(axis=1) - (np.abs(old) >= self.rail_level).sum(axis=1)
+        if self.line_freq is not None:
+            old_start = self.written - self.n_window
+            self._line += data @ self._phasors(self.written, self.written + n_new)
+            self._line -= old @ self._phasors(old_start, old_start + n_new)
+
+        wrapped = (self.written + n_new) // self.n_window > self.written // self.n_window
+        self._ring[:, slots] = data
+        self.written += n_new
+        if wrapped:
+            self._recompute()
+
+    def _recompute(self):
+        """Compute the window sums from the ring"""
+        n = self.n_samples
+        window = self._ring[:, np.arange(self.written - n, self.written) % self.n_window]
+        self._sum = window.sum(axis=1)
+        self._sum_sq = np.einsum('ij,ij->i', window, window)
+        self._railed = (np.abs(window) >= self.rail_level).sum(axis=1).astype(np.float64)
+        if self.line_freq is not None:
+            self._line = window @ self._phasors(self.written - n, self.written)
+
+    @property
+    def rms(self) -> NDArray:
+        """The RMS of each channel around its mean in the window (uV)"""
+        n = max(self.n_samples, 1)
+        mean = self._sum / n
+        return np.sqrt(np.maximum(self._sum_sq / n - mean ** 2, 0))
+
+    @property
+    def line_ratio(self) -> NDArray:
+        """The fraction of the power of each channel at the line frequency (NaN if above Nyquist)"""
+        n = max(self.n_samples, 1)
+        if self.line_freq is None:
+            return np.full(len(self.ch_names), np.nan)
+
+        # The line bin of the signal around its mean, a sine of amplitude A has power A^2 / 2
+        line = self._line - self._sum / n * self._phasors_sum()
+        line_power = 2 * np.abs(line) ** 2 / n ** 2
+        return np.minimum(line_power / np.maximum(self.rms ** 2, 1e-12), 1.)
+
+    @property
+    def railed(self) -> NDArray:
+        """The fraction of the samples of each channel near the ADC rails"""
+        return self._railed / max(self.n_samples, 1)
+
+    def states(self) -> Dict[str, NDArray]:
+        """Return the boolean array of the channels in each bad state"""
+        rms = self.rms
+        return {RAILED: self.railed > self.railed_max,
+                FLAT: rms < self.flat_rms,
+                NOISY: rms > self.rms_max,
+                LINE_NOISE: self.line_ratio > self.line_max}
+
+    def status(self) -> List[str]:
+        """Return the state of each channel, the first bad state by precedence or `ok`"""
+        states = self.states()
+        status = [OK] * len(self.ch_names)
+        for state in reversed(STATES):
+            for channel in np.flatnonzero(states[state]):
+                status[channel] = state
+
+        return status
+
+    def bad_channels(self) -> Dict[str, str]:
+        """Return the state of the bad channels by name"""
+        return {name: state for name, state in zip(self.ch_names, self.status()) if state != OK}
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return the statistics & the state of each channel (JSON serializable, e.g. for the event log)"""
+        rms, line_ratio, railed, status = self.rms, self.line_ratio, self.railed, self.status()
+        channels = {}
+        for i, name in enumerate(self.ch_names):
+            channels[name] = {'rms': float(rms[i]), 'railed': float(railed[i]), 'status': status[i],
+                              'line_ratio': None if np.isnan(line_ratio[i]) else float(line_ratio[i])}
+
+        return {'seconds': self.written / self.sfreq, 'window': self.n_samples / self.sfreq, 'channels': channels}
+
+
+class QualityOverlay:
+    """
+    Draw the bad channels of a `SignalQualityMonitor` over the experiment window.
+
+    The text is updated at most every `interval` seconds, since changing a psychopy text rebuilds it.
+
+    Attributes:
+
+        monitor (SignalQualityMonitor):
+            The monitor to display.
+
+        interval (float):
+            The minimal seconds between text updates.
+    """
+
+    def __init__(self, renderer, monitor: SignalQualityMonitor, clock, interval: float = 1.,
+                 pos=(0, 0.9), height: float = 0.05):
+
+        self.renderer = renderer
+        self.monitor: SignalQualityMonitor = monitor
+        self.clock = clock
+        self.interval: float = interval
+        self._updated: Optional[float] = None
+        renderer.text('signal_quality', '', pos=pos, height=height, color='orange')
+
+    def text(self) -> str:
+        """The overlay text, the bad channels and their state"""
+        bad = self.monitor.bad_channels()
+        return ' '.join(f'{name}:{state}' for name, state in bad.items())
+
+    def draw(self):
+        """Draw the overlay (call before the flip)"""
+        now = self.clock.now()
+        if self._updated is None or now - self._updated >= self.interval:
+            self.renderer.text('signal_quality', self.text())
+            self._updated = now
+        self.renderer.draw('signal_quality')
@@ -0,0 +1,173 @@
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+from bci4als.eeg import EEG
+from bci4als.experiments.clock import WallClock
+from brainflow import BoardIds, BoardShim
+from nptyping import NDArray
+
+
+class SimulatedBoard:
+    """
+    Simulate a BrainFlow board on an experiment clock.
+
+    The board has the same rows layout as the simulated board id, and implements the `BoardShim`
+    methods used by `EEG`. The samples are generated lazily when the data is read, according to
+    the clock time passed since the stream started, so with a `VirtualClock` a whole session is
+    generated without waiting.
+
+    The EEG rows are gaussian noise. While a trial is running (between the start and stop markers)
+    a 10 Hz rhythm is added to one channel according to the trial label, so models trained on the
+    simulated data can separate the labels.
+
+    Attributes:
+
+        board_id (int):
+            The id of the board to simulate.
+
+        clock:
+            The time source of the board.
+
+        noise (float):
+            The std of the noise in uV.
+
+        amplitude (float):
+            The amplitude of the label rhythm in uV.
+    """
+
+    def __init__(self, board_id: int = BoardIds.CYTON_DAISY_BOARD.value, clock=None,
+                 noise: float = 10., amplitude: float = 20., seed: Optional[int] = None):
+
+        self.board_id: int = board_id
+        self.clock = clock if clock is not None else WallClock()
+        self.noise: float = noise
+        self.amplitude: float = amplitude
+        self.rng = np.random.default_rng(seed)
+
+        self.sfreq: int = BoardShim.get_sampling_rate(board_id)
+        self.n_rows: int = BoardShim.get_num_rows(board_id)
+        self.eeg_rows: List[int] = BoardShim.get_eeg_channels(board_id)
+
+        self.streaming: bool = False
+        self._start_time: float = 0.
+        self._start_unix: float = 0.
+        self._read: int = 0  # samples already read
+        self._markers: List[Tuple[int, float]] = []  # pending (sample index, marker value)
+        self._trials: List[List] = []  # [start index, stop index, label] of the trials not read yet
+
+    # Board descriptions, same as BoardShim
+    get_sampling_rate = staticmethod(BoardShim.get_sampling_rate)
+    get_eeg_channels = staticmethod(BoardShim.get_eeg_channels)
+    get_eeg_names = staticmethod(BoardShim.get_eeg_names)
+    get_marker_channel = staticmethod(BoardShim.get_marker_channel)
+    get_timestamp_channel = staticmethod(BoardShim.get_timestamp_channel)
+    get_accel_channels = staticmethod(BoardShim.get_accel_channels)
+    get_num_rows = staticmethod(BoardShim.get_num_rows)
+
+    def prepare_session(self):
+        pass
+
+    def release_session(self):
+        pass
+
+    def start_stream(self):
+        self.streaming = True
+        self._start_time = self.clock.now()
+        self._start_unix = time.time()
+        self._read = 0
+        self._markers, self._trials = [], []
+
+    def stop_stream(self):
+        self.streaming = False
+
+    def insert_marker(self, value: float):
+        """Put the marker on the sample of the current clock time"""
+        index = max(self._available(), self._markers[-1][0] + 1 if self._markers else 0)
+        self._markers.append((index, value))
+
+        # Track the trials for the simulated rhythm
+        status, label, _ = EEG.decode_marker(value)
+        if status == 'start':
+            self._trials.append([index, None, label])
+        elif self._trials:
+            self._trials[-1][1] = index
+
+    def now(self) -> float:
+        """The timestamp of the stream now: its unix start time plus the clock time since the start"""
+        return self._start_unix + self.clock.now() - self._start_time
+
+    def get_board_data_count(self) -> int:
+        return self._available() - self._read
+
+    def get_board_data(self) -> NDArray:
+        """Return all the samples since the last read and remove them from the board"""
+        stop = self._available()
+        data = self._generate(self._read, stop)
+        self._read = stop
+        return data
+
+    def _available(self) -> int:
+        if not self.streaming:
+            return self._read
+        return int((self.clock.now() - self._start_time) * self.sfreq)
+
+    def _generate(self, start: int, stop: int) -> NDArray:
+
+        n_samples = stop - start
+        data = np.zeros((self.n_rows, n_samples))
+
+        # Noise, timestamps & package numbers
+        data[self.eeg_rows] = self.rng.normal(0, self.noise, (len(self.eeg_rows), n_samples))
+        data[self.get_timestamp_channel(self.board_id)] = self._start_unix + np.arange(start, stop) / self.sfreq
+        data[0] = np.arange(start, stop) % 256
+
+        # Label rhythm of the trials
+        rhythm = self.amplitude * np.sin(2 * np.pi * 10 * np.arange(start, stop) / self.sfreq)
+        for trial_start, trial_stop, label in self._trials:
+            low, high = max(trial_start, start) - start, min(stop if trial_stop is None else trial_stop, stop) - start
+            if low < high:
+                data[self.eeg_rows[label % len(self.eeg_rows)], low:high] += rhythm[low:high]
+        self._trials = [t for t in self._trials if t[1] is None or t[1] > stop]
+
+        # Markers
+        marker_row = self.get_marker_channel(self.board_id)
+        for index, value in self._markers:
+            if start <= index < stop:
+                data[marker_row, index - start] = value
+        self._markers = [m for m in self._markers if m[0] >= stop]
+
+        return data
+
+
+class SimulatedEEG(EEG):
+    """
+    `EEG` on top of a `SimulatedBoard`, without any hardware or serial port.
+
+    Attributes:
+
+        board (SimulatedBoard):
+            The simulated board. Its clock should be the clock of the experiment.
+    """
+
+    def __init__(self, board_id: int = BoardIds.CYTON_DAISY_BOARD.value, headset: str = "avi13",
+                 clock=None, seed: Optional[int] = None, dtype=np.float64, **board_params):
+
+        # Board Id and Headset Name
+        self.board_id = board_id
+        self.headset: str = headset
+
+        # The simulated board replace the BrainFlow params & board
+        self.params = None
+        self.board = SimulatedBoard(board_id, clock=clock, seed=seed, **board_params)
+
+        # Other Params
+        self.sfreq = self.board.get_sampling_rate(board_id)
+        self.marker_row = self.board.get_marker_channel(self.board_id)
+        self.timestamp_row = self.board.get_timestamp_channel(self.board_id)
+        self.eeg_names = self.get_board_names()
+        self.last_sample_time: Optional[float] = None
+        self.sample_clock = self.board
+        self.decimator = None
+        self.quality = None
+        self.dtype: np.dtype = np.dtype(dtype)
@@ -0,0 +1,331 @@
+import json
+import os
+import pickle
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from nptyping import NDArray
+
+# Name of the store folder inside the session directory
+STORE_DIR = 'store'
+
+# Files of the store
+SAMPLES_FILE = 'samples.npy'
+OFFSETS_FILE = 'offsets.npy'
+LENGTHS_FILE = 'lengths.npy'
+LABELS_FILE = 'labels.npy'
+CHANNELS_FILE = 'channels.npy'
+META_FILE = 'meta.json'
+
+
+class StoreWriter:
+    """
+    Write the trials of a session to a store folder one trial at a time.
+
+    Only the running trial is held in memory: the trials are appended to a temporary file and laid
+    out to the samples file (trial by trial) when the writer is closed, when the longest trial is known.
+
+    Usage:
+        with StoreWriter(session_directory, ch_names, sfreq) as writer:
+            for trial, label in trials:
+                writer.append(trial, label)
+
+    Attributes:
+
+        path (str):
+            The store folder.
+
+        lengths (List[int]):
+            The number of samples of each trial written so far.
+
+        labels (List[int]):
+            The label of each trial written so far.
+    """
+
+    def __init__(self, directory: str, ch_names: List[str], sfreq: float, metadata: Optional[Dict[str, Any]] = None,
+                 dtype=np.float64, align: bool = True):
+
+        self.path: str = os.path.join(directory, STORE_DIR)
+        self.ch_names: List[str] = list(ch_names)
+        self.sfreq: float = sfreq
+        self.metadata: Dict[str, Any] = dict(metadata or {})
+        self.dtype = np.dtype(dtype)
+        self.align: bool = align
+
+        self.lengths: List[int] = []
+        self.labels: List[int] = []
+
+        os.makedirs(self.path, exist_ok=True)
+        self._tmp_path = os.path.join(self.path, SAMPLES_FILE + '.tmp')
+        self._tmp = open(self._tmp_path, 'wb')
+
+    def append(self, trial: NDArray, label: int):
+        """
+        Append a trial to the store.
+        :param trial: the trial samples with the shape (n_channels, n_samples)
+        :param label: the trial label
+        """
+        trial = np.asarray(trial)
+        if trial.shape[0] != len(self.ch_names):
+            raise ValueError(f'Got trial with {trial.shape[0]} channels, expected {len(self.ch_names)} channels')
+
+        self._tmp.write(np.ascontiguousarray(trial, dtype=self.dtype).tobytes())
+        self.lengths.append(trial.shape[1])
+        self.labels.append(int(label))
+
+    def close(self) -> str:
+        """
+        Write the samples file and the index files of the store.
+        :return: the path of the store folder
+        """
+        self._tmp.close()
+
+        lengths = np.array(self.lengths, dtype=np.int64)
+        stride = int(lengths.max()) if len(lengths) and self.align else None
+        if not len(lengths):
+            offsets = np.zeros(0, np.int64)
+        elif stride is not None:
+            offsets = np.arange(len(lengths), dtype=np.int64) * stride
+        else:
+            offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]]).astype(np.int64)
+        n_total = int(offsets[-1] + (stride or lengths[-1])) if len(lengths) else 0
+
+        # Lay the trials out to the samples file, a trial at a time
+        n_channels = len(self.ch_names)
+        samples = np.lib.format.open_memmap(os.path.join(self.path, SAMPLES_FILE), mode='w+', dtype=self.dtype,
+                                            shape=(n_channels, n_total))
+        position = 0
+        for offset, length in zip(offsets, lengths):
+            trial = np.fromfile(self._tmp_path, dtype=self.dtype, count=n_channels * length,
+                                offset=position * self.dtype.itemsize)
+            samples[:, offset:offset + length] = trial.reshape(n_channels, length)
+            position += n_channels * length
+        samples.flush()
+        del samples
+        os.remove(self._tmp_path)
+
+        np.save(os.path.join(self.path, OFFSETS_FILE), offsets)
+        np.save(os.path.join(self.path, LENGTHS_FILE), lengths)
+        np.save(os.path.join(self.path, LABELS_FILE), np.array(self.labels, dtype=np.int64))
+        np.save(os.path.join(self.path, CHANNELS_FILE), np.asarray(self.ch_names, dtype=str))
+
+        meta = {'sfreq': self.sfreq, 'n_trials': len(lengths), 'n_channels': n_channels, 'stride': stride,
+                'dtype': self.dtype.name, 'created': datetime.now().isoformat()}
+        meta.update(self.metadata)
+        with open(os.path.join(self.path, META_FILE), 'w') as file:
+            json.dump(meta, file, indent=4)
+
+        return self.path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        # Leave no partial store after an error
+        if exc_type is not None:
+            self._tmp.close()
+            os.remove(self._tmp_path)
+        else:
+            self.close()
+
+
+def write_session(directory: str, trials: List[NDArray], labels: List[int], ch_names: List[str],
+                  sfreq: float, metadata: Optional[Dict[str, Any]] = None,
+                  dtype=np.float64, align: bool = True) -> str:
+    """
+    Write the trials of a session to a store folder inside the session directory.
+
+    All the trials are written to one contiguous (n_channels, n_total_samples) array.
+    With `align`, every trial starts `stride` samples after the previous one (the longest trial
+    length, the gap is zero padded), so equal-length epochs of all the trials are a strided view
+    of the samples file, without any copy.
+
+    :param directory: the session directory
+    :param trials: list of trials, each with the shape (n_channels, n_samples)
+    :param labels: the label of each trial
+    :param ch_names: the channel names
+    :param sfreq: the sampling rate of the trials
+    :param metadata: optionally more data for the metadata file (must be JSON serializable)
+    :param dtype: the samples data type
+    :param align: write the trials at equal strides
+    :return: the path of the store folder
+    """
+    if len(trials) != len(labels):
+        raise ValueError(f'Got {len(trials)} trials and {len(labels)} labels')
+
+    writer = StoreWriter(directory, ch_names, sfreq, metadata=metadata, dtype=dtype, align=align)
+    for trial, label in zip(trials, labels):
+        writer.append(trial, label)
+
+    return writer.close()
+
+
+class SessionStore:
+    """
+    Read a session store written by `write_session`.
+
+    The samples are memory mapped, so opening a store reads only the small index files,
+    and the trials are views on the samples file.
+
+    Attributes:
+
+        samples (NDArray):
+            The samples of all the trials with the shape (n_channels, n_total_samples).
+
+        offsets (NDArray):
+            The first sample of each trial.
+
+        lengths (NDArray):
+            The number of samples of each trial.
+
+        labels (NDArray):
+            The label of each trial.
+
+        ch_names (List[str]):
+            The channel names.
+
+        sfreq (float):
+            The sampling rate.
+
+        meta (Dict[str, Any]):
+            The metadata of the store.
+    """
+
+    def __init__(self, path: str, mmap: bool = True):
+
+        # Accept the session directory as well
+        if os.path.isdir(os.path.join(path, STORE_DIR)):
+            path = os.path.join(path, STORE_DIR)
+
+        self.path: str = path
+        self.samples: NDArray = np.load(os.path.join(path, SAMPLES_FILE), mmap_mode='r' if mmap else None)
+        self.offsets: NDArray = np.load(os.path.join(path, OFFSETS_FILE))
+        self.lengths: NDArray = np.load(os.path.join(path, LENGTHS_FILE))
+        self.labels: NDArray = np.load(os.path.join(path, LABELS_FILE))
+        self.ch_names: List[str] = np.load(os.path.join(path, CHANNELS_FILE)).tolist()
+
+        with open(os.path.join(path, META_FILE)) as file:
+            self.meta: Dict[str, Any] = json.load(file)
+        self.sfreq: float = self.meta['sfreq']
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def trial(self, index: int) -> NDArray:
+        """Return view on the trial samples with the shape (n_channels, n_samples)"""
+        offset, length = self.offsets[index], self.lengths[index]
+        return self.samples[:, offset:offset + length]
+
+    def epochs(self, n_samples: Optional[int] = None, start: int = 0) -> NDArray:
+        """
+        Return equal-length epochs of all the trials.
+        For aligned stores the epochs are a view on the samples (no copy), otherwise they are stacked.
+        :param n_samples: the number of samples of each epoch, the shortest trial length by default
+        :param start: the first sample of each epoch, relative to the trial start
+        :return: array with the shape (n_trials, n_channels, n_samples)
+        """
+        # A store without trials (e.g. a recording without complete trials)
+        if len(self) == 0:
+            return np.zeros((0, self.samples.shape[0], n_samples or 0), dtype=self.samples.dtype)
+
+        if n_samples is None:
+            n_samples = int(self.lengths.min()) - start
+        if start < 0 or start + n_samples > self.lengths.min():
+            raise ValueError(f'Epochs of samples [{start}, {start + n_samples}) exceed the shortest trial '
+                             f'({self.lengths.min()} samples)')
+
+        stride = self.meta.get('stride')
+        if stride is None:
+            return np.stack([self.trial(i)[:, start:start + n_samples] for i in range(len(self))])
+
+        step = self.samples.strides[1]
+        return np.lib.stride_tricks.as_strided(self.samples[:, start:], writeable=False,
+                                               shape=(len(self), self.samples.shape[0], n_samples),
+                                               strides=(stride * step, self.samples.strides[0], step))
+
+    def to_dataframes(self) -> List[pd.DataFrame]:
+        """Return the trials as list of DataFrames, the same as `trials.pickle`"""
+        return [pd.DataFrame(self.trial(i).T, columns=self.ch_names) for i in range(len(self))]
+
+
+def read_metadata_channels(session_directory: str) -> Optional[List[str]]:
+    """
+    Parse the channels list from the `metadata.txt` of the session.
+    :param session_directory: path to the session folder
+    :return: the channel names or None if the session has no metadata
+    """
+    path = os.path.join(session_directory, 'metadata.txt')
+    if not os.path.isfile(path):
+        return None
+
+    with open(path) as file:
+        channels = [line.split(':', 1)[1].strip() for line in file if line.startswith('Channel ')]
+
+    return channels or None
+
+
+def load_legacy_session(session_directory: str) -> Optional[Tuple[List[NDArray], List[int], Optional[List[str]]]]:
+    """
+    Load the trials of a session saved before the store format.
+    The trials are taken from `trials.pickle` & `labels.csv` or from the trials of `model.pickle`.
+    :param session_directory: path to the session folder
+    :return: (trials with the shape (n_channels, n_samples), labels, channel names) or None if the
+             session has no trials
+    """
+    trials_path = os.path.join(session_directory, 'trials.pickle')
+    labels_path = os.path.join(session_directory, 'labels.csv')
+    model_path = os.path.join(session_directory, 'model.pickle')
+
+    if os.path.isfile(trials_path) and os.path.isfile(labels_path):
+        with open(trials_path, 'rb') as file:
+            trials: List[pd.DataFrame] = pickle.load(file)
+        labels = pd.read_csv(labels_path, header=None).to_numpy().ravel().tolist()
+        return [t.to_numpy().T for t in trials], labels, [str(c) for c in trials[0].columns]
+
+    if os.path.isfile(model_path):
+        with open(model_path, 'rb') as file:
+            model = pickle.load(file)
+
+        # Old models are bare sklearn pipelines without the trials
+        if hasattr(model, 'trials') and hasattr(model, 'labels'):
+            return [np.asarray(t) for t in model.trials], list(model.labels), read_metadata_channels(session_directory)
+
+    return None
+
+
+def convert_recordings(root: str, sfreq: float = 125, overwrite: bool = False) -> List[str]:
+    """
+    Convert all the sessions in the recordings tree (root/<subject>/<session>) to the store format.
+    :param root: the recordings folder
+    :param sfreq: the sampling rate of the recordings (not saved in the old formats)
+    :param overwrite: convert sessions which already have a store
+    :return: list of the converted session directories
+    """
+    converted = []
+    for subject in sorted(os.listdir(root)):
+        subject_dir = os.path.join(root, subject)
+        if not os.path.isdir(subject_dir):
+            continue
+
+        for session in sorted(os.listdir(subject_dir)):
+            session_dir = os.path.join(subject_dir, session)
+            if not os.path.isdir(session_dir):
+                continue
+            if os.path.isdir(os.path.join(session_dir, STORE_DIR)) and not overwrite:
+                continue
+
+            loaded = load_legacy_session(session_dir)
+            if loaded is None:
+                continue
+
+            trials, labels, ch_names = loaded
+            ch_names = ch_names if ch_names and len(ch_names) == len(trials[0]) else \
+                [f'ch{i + 1}' for i in range(len(trials[0]))]
+            print(f'Converting {session_dir} ({len(trials)} trials)')
+            write_session(session_dir, trials, labels, ch_names, sfreq,
+                          metadata={'subject': subject, 'session': session, 'source': 'legacy'})
+            converted.append(session_dir)
+
+    return converted
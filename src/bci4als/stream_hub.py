@@ -0,0 +1,487 @@
+import copy
+import json
+import os
+import threading
+import time
+import multiprocessing
+from multiprocessing import resource_tracker, shared_memory
+from typing import List, Optional
+
+import numpy as np
+from brainflow import BoardShim
+from nptyping import NDArray
+
+# The int64 fields of the ring header, followed by the sampling rate (float64)
+N_ROWS, CAPACITY, WRITTEN, CLOSED, BOARD_ID = range(5)
+HEADER_INTS = 6
+HEADER_BYTES = 8 * (HEADER_INTS + 1)
+
+# The files of a raw recording
+RAW_FILE = 'raw.bin'
+RAW_META_FILE = 'raw.json'
+
+
+class BufferOverrun(Exception):
+    """A consumer read samples which the producer already overwrote"""
+
+
+class SharedRing:
+    """
+    Ring buffer of the board samples in `multiprocessing.shared_memory`.
+
+    The samples are kept as (n_rows, capacity), so a range of samples is a view of each row. The header
+    keeps the total number of samples written, which the writer updates after the samples, so a reader
+    which reads the counter first never sees samples which are not written yet.
+
+    Usage:
+        ring = SharedRing.create(n_rows, capacity, sfreq)   # the producer
+        ring = SharedRing.attach(ring.name)                  # any other process
+
+    Attributes:
+
+        name (str):
+            The name of the shared memory block, to attach from other processes.
+
+        n_rows (int):
+            The rows of each sample (all the board rows).
+
+        capacity (int):
+            The samples the ring holds.
+
+        sfreq (float):
+            The sampling rate.
+
+        board_id (int):
+            The id of the board.
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool):
+
+        self._shm = shm
+        self._owner: bool = owner
+        self._header: NDArray = np.ndarray((HEADER_INTS,), dtype=np.int64, buffer=shm.buf)
+        self.n_rows: int = int(self._header[N_ROWS])
+        self.capacity: int = int(self._header[CAPACITY])
+        self.board_id: int = int(self._header[BOARD_ID])
+        self.sfreq: float = float(np.ndarray((1,), dtype=np.float64, buffer=shm.buf, offset=8 * HEADER_INTS)[0])
+        self.data: NDArray = np.ndarray((self.n_rows, self.capacity), dtype=np.float64, buffer=shm.buf,
+                                        offset=HEADER_BYTES)
+
+    @classmethod
+    def create(cls, n_rows: int, capacity: int, sfreq: float, board_id: int = 0,
+               name: Optional[str] = None) -> 'SharedRing':
+        """Create new shared ring, the caller owns it and unlinks it on close"""
+        shm = shared_memory.SharedMemory(name=name, create=True, size=HEADER_BYTES + 8 * n_rows * capacity)
+        header = np.ndarray((HEADER_INTS,), dtype=np.int64, buffer=shm.buf)
+        header[:] = 0
+        header[N_ROWS], header[CAPACITY], header[BOARD_ID] = n_rows, capacity, board_id
+        np.ndarray((1,), dtype=np.float64, buffer=shm.buf, offset=8 * HEADER_INTS)[0] = sfreq
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name: str) -> 'SharedRing':
+        """Attach to the shared ring of the producer"""
+        try:
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Before Python 3.13 the attached block is tracked, and an unrelated process (with its own
+            # resource tracker) would unlink it on exit. Child processes share the tracker of the hub.
+            shm = shared_memory.SharedMemory(name=name)
+            if multiprocessing.parent_process() is None:
+                resource_tracker.unregister(shm._name, 'shared_memory')
+        return cls(shm, owner=False)
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    @property
+    def written(self) -> int:
+        """The total number of samples written since the ring was created"""
+        return int(self._header[WRITTEN])
+
+    @property
+    def closed(self) -> bool:
+        """True after the producer stopped writing"""
+        return bool(self._header[CLOSED])
+
+    def write(self, chunk: NDArray):
+        """
+        Copy the samples into the ring, overwriting the oldest samples.
+        :param chunk: array with the shape (n_rows, n_samples)
+        """
+        written, n_samples = self.written, chunk.shape[1]
+        if n_samples > self.capacity:
+            # Only the newest samples fit, the older are overwritten at once
+            chunk, written = chunk[:, -self.capacity:], written + n_samples - self.capacity
+
+        for start, stop, offset in self._segments(written, written + chunk.shape[1]):
+            self.data[:, start:stop] = chunk[:, offset:offset + stop - start]
+
+        # Publish the samples after they are written
+        self._header[WRITTEN] = written + chunk.shape[1]
+
+    def segments(self, start: int, stop: int) -> List[NDArray]:
+        """Return views of the samples [start, stop), one view or two when the range wraps around the ring"""
+        return [self.data[:, a:b] for a, b, _ in self._segments(start, stop)]
+
+    def _segments(self, start: int, stop: int):
+        first = start % self.capacity
+        if stop - start <= self.capacity - first:
+            return [(first, first + stop - start, 0)] if stop > start else []
+        return [(first, self.capacity, 0), (0, stop - start - (self.capacity - first), self.capacity - first)]
+
+    def close(self):
+        """Detach from the ring, and remove it if this process created it"""
+        if self._owner:
+            self._header[CLOSED] = 1
+        self._header = self.data = None
+        try:
+            self._shm.close()
+        except BufferError:
+            # Views of the samples are still alive, the memory is released with them
+            pass
+        if self._owner:
+            self._shm.unlink()
+
+
+class StreamConsumer:
+    """
+    Independent read cursor of a shared ring, for a thread or a process.
+
+    Each consumer reads all the samples written since its previous read, without removing them from
+    the ring, so consumers never take samples from each other. A consumer which falls behind by more
+    than the ring capacity loses the overwritten samples: the read skips to the oldest sample in the
+    ring and counts the overrun (or raises `BufferOverrun` if `strict`).
+
+    Reads are zero-copy when the samples do not wrap around the ring. The views stay valid until the
+    producer overwrites them, i.e. for about the ring length in seconds; `valid` checks the last read.
+
+    Usage:
+        consumer = StreamConsumer.attach(hub_name)
+        data = consumer.read()   # (n_rows, n_new_samples)
+
+    Attributes:
+
+        ring (SharedRing):
+            The ring of the samples.
+
+        cursor (int):
+            The index of the next sample to read.
+
+        overruns (int):
+            The number of reads which missed overwritten samples.
+
+        lost (int):
+            The number of overwritten samples the consumer missed.
+
+        strict (bool):
+            Raise `BufferOverrun` instead of skipping the overwritten samples.
+    """
+
+    def __init__(self, ring: SharedRing, start: str = 'latest', strict: bool = False):
+
+        self.ring: SharedRing = ring
+        self.strict: bool = strict
+        self.overruns: int = 0
+        self.lost: int = 0
+
+        written = ring.written
+        if start == 'latest':
+            self.cursor: int = written
+        elif start == 'oldest':
+            self.cursor = max(written - ring.capacity, 0)
+        else:
+            raise ValueError(f'Unknown start `{start}`, use latest or oldest')
+        self._last_start: int = self.cursor
+
+    @classmethod
+    def attach(cls, name: str, start: str = 'latest', strict: bool = False) -> 'StreamConsumer':
+        """Return consumer of the ring with the given name (e.g. in another process)"""
+        return cls(SharedRing.attach(name), start=start, strict=strict)
+
+    @property
+    def available(self) -> int:
+        """The number of samples not read yet (including overwritten samples)"""
+        return self.ring.written - self.cursor
+
+    def read(self, max_samples: Optional[int] = None, copy: bool = False) -> NDArray:
+        """
+        Read the new samples.
+        :param max_samples: read at most this number of samples, all the new samples by default
+        :param copy: return a copy instead of a view of the ring
+        :return: array with the shape (n_rows, n_samples)
+        """
+        written = self.ring.written
+        start = self.cursor
+        if written - start > self.ring.capacity:
+            if self.strict:
+                raise BufferOverrun(f'{written - start - self.ring.capacity} samples were overwritten')
+            self.overruns += 1
+            self.lost += written - start - self.ring.capacity
+            start = written - self.ring.capacity
+
+        stop = written if max_samples is None else min(written, start + max_samples)
+        segments = self.ring.segments(start, stop)
+        if not segments:
+            data = np.zeros((self.ring.n_rows, 0))
+        elif len(segments) == 1:
+            data = segments[0].copy() if copy else segments[0]
+        else:
+            data = np.concatenate(segments, axis=1)
+
+        self._last_start, self.cursor = start, stop
+        return data
+
+    def valid(self) -> bool:
+        """True if the samples of the last read were not overwritten since (so its views hold the samples)"""
+        return self.ring.written - self._last_start <= self.ring.capacity
+
+    def skip(self):
+        """Drop the samples not read yet"""
+        self.cursor = self.ring.written
+
+    def close(self):
+        """Detach from the ring of another process (the ring of the hub is closed by the hub)"""
+        if not self.ring._owner:
+            self.ring.close()
+
+
+class HubBoard:
+    """
+    Board of a stream consumer, which implements the `BoardShim` methods used by `EEG`.
+
+    `EEG` drains its board with every read. An `EEG` with a hub board reads its own cursor of the hub
+    instead, so many `EEG` objects (the online decoder, a recorder, a visualization) read the same
+    stream. The session is owned by the hub: starting and stopping the stream does nothing, and the
+    markers are inserted to the board of the hub (only in the process of the hub).
+
+    Attributes:
+
+        consumer (StreamConsumer):
+            The read cursor of the board.
+
+        board:
+            The board of the hub, for the markers. None in other processes.
+    """
+
+    def __init__(self, consumer: StreamConsumer, board=None):
+
+        self.consumer: StreamConsumer = consumer
+        self.board = board
+        self.board_id: int = consumer.ring.board_id
+
+    # Board descriptions, same as BoardShim
+    get_sampling_rate = staticmethod(BoardShim.get_sampling_rate)
+    get_eeg_channels = staticmethod(BoardShim.get_eeg_channels)
+    get_eeg_names = staticmethod(BoardShim.get_eeg_names)
+    get_marker_channel = staticmethod(BoardShim.get_marker_channel)
+    get_timestamp_channel = staticmethod(BoardShim.get_timestamp_channel)
+    get_accel_channels = staticmethod(BoardShim.get_accel_channels)
+    get_num_rows = staticmethod(BoardShim.get_num_rows)
+
+    def prepare_session(self):
+        pass
+
+    def release_session(self):
+        pass
+
+    def start_stream(self):
+        # The readers of the board start from the current samples, like a new stream
+        self.consumer.skip()
+
+    def stop_stream(self):
+        pass
+
+    def insert_marker(self, value: float):
+        if self.board is None:
+            raise RuntimeError('The markers can only be inserted in the process of the stream hub')
+        self.board.insert_marker(value)
+
+    def get_board_data_count(self) -> int:
+        return self.consumer.available
+
+    def get_board_data(self) -> NDArray:
+        """Return the samples since the last read of this board (a copy, the callers keep the data)"""
+        return self.consumer.read(copy=True)
+
+
+class StreamHub:
+    """
+    Single producer of the board stream for many consumers.
+
+    The hub is the only reader of the EEG board: it moves the board samples (all the rows, with the
+    markers and the timestamps) into a shared ring, from which any number of consumers read with
+    independent cursors, in this process (`consumer`, `eeg_view`) or in other processes (`StreamConsumer.attach`
+    with `name`).
+
+    Usage:
+        hub = StreamHub(eeg, seconds=30)
+        eeg.on()
+        hub.start()
+        online_eeg, offline_eeg = hub.eeg_view(), hub.eeg_view()
+        ...
+        hub.close()
+
+    Attributes:
+
+        eeg (EEG):
+            The EEG of the board.
+
+        ring (SharedRing):
+            The shared ring of the samples.
+
+        poll_interval (float):
+            The seconds between the board reads of the producer thread.
+    """
+
+    def __init__(self, eeg, seconds: float = 60., poll_interval: float = 0.02, name: Optional[str] = None):
+
+        self.eeg = eeg
+        self.poll_interval: float = poll_interval
+        n_rows = eeg.board.get_num_rows(eeg.board_id)
+        self.ring: SharedRing = SharedRing.create(n_rows, int(seconds * eeg.sfreq), eeg.sfreq,
+                                                  board_id=eeg.board_id, name=name)
+
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def name(self) -> str:
+        return self.ring.name
+
+    def pump(self) -> int:
+        """Move the new board samples into the ring, return the number of samples"""
+        data = self.eeg.board.get_board_data()
+        if data.shape[1]:
+            self.ring.write(data)
+        return data.shape[1]
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.pump()
+            self._stop.wait(self.poll_interval)
+
+    def start(self):
+        """Pump the board in a background thread (with a `VirtualClock` call `pump` instead)"""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='stream-hub', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def consumer(self, start: str = 'latest', strict: bool = False) -> StreamConsumer:
+        """Return new read cursor of the stream, in this process"""
+        return StreamConsumer(self.ring, start=start, strict=strict)
+
+    def eeg_view(self, start: str = 'latest'):
+        """
+        Return an `EEG` which reads its own cursor of the stream, with the configuration of the hub EEG.
+        Its decimation and signal quality monitor (if any) are independent of the other consumers.
+        """
+        view = copy.copy(self.eeg)
+        view.board = HubBoard(self.consumer(start=start), board=self.eeg.board)
+        view.decimator = copy.deepcopy(self.eeg.decimator)
+        view.quality = copy.deepcopy(self.eeg.quality)
+        view.last_sample_time = None
+        return view
+
+    def close(self):
+        """Stop the producer and remove the shared ring"""
+        self.stop()
+        self.ring.close()
+
+    def __enter__(self) -> 'StreamHub':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class StreamRecorder:
+    """
+    Record the raw stream of a consumer to a file, e.g. continuously during online sessions.
+
+    The samples of all the rows are appended to `raw.bin` (float64, sample after sample), the rows,
+    the sampling rate and the lost samples are written to `raw.json` on close. See `load_recording`.
+
+    Attributes:
+
+        consumer (StreamConsumer):
+            The read cursor of the recorder.
+
+        directory (str):
+            The recording folder.
+
+        n_samples (int):
+            The samples recorded so far.
+    """
+
+    def __init__(self, consumer: StreamConsumer, directory: str, poll_interval: float = 0.5):
+
+        self.consumer: StreamConsumer = consumer
+        self.directory: str = directory
+        self.poll_interval: float = poll_interval
+        self.n_samples: int = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._file = open(os.path.join(directory, RAW_FILE), 'wb')
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def poll(self) -> int:
+        """Append the new samples to the file, return the number of samples"""
+        data = self.consumer.read(copy=True)
+
+        # A lagging recorder reads the range the producer overwrites next, the samples overwritten
+        # before they were copied are torn and counted as lost
+        ring = self.consumer.ring
+        start = self.consumer.cursor - data.shape[1]
+        torn = min(max(ring.written - ring.capacity - start, 0), data.shape[1])
+        if torn:
+            self.consumer.lost += torn
+            data = data[:, torn:]
+
+        self._file.write(np.ascontiguousarray(data.T).tobytes())
+        self.n_samples += data.shape[1]
+        return data.shape[1]
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.poll()
+            self._stop.wait(self.poll_interval)
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='stream-recorder', daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """Record the last samples and write the metadata"""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+        self.poll()
+        self._file.close()
+        ring = self.consumer.ring
+        with open(os.path.join(self.directory, RAW_META_FILE), 'w') as file:
+            json.dump({'n_rows': ring.n_rows, 'n_samples': self.n_samples, 'sfreq': ring.sfreq,
+                       'board_id': ring.board_id, 'lost': self.consumer.lost, 'closed': time.time()}, file)
+
+
+def load_recording(directory: str) -> NDArray:
+    """Return the raw recording of `StreamRecorder` (memory mapped), with the shape (n_rows, n_samples)"""
+    with open(os.path.join(directory, RAW_META_FILE)) as file:
+        meta = json.load(file)
+    if meta['n_samples'] == 0:
+        return np.zeros((meta['n_rows'], 0))
+
+    samples = np.memmap(os.path.join(directory, RAW_FILE), dtype=np.float64, mode='r',
+                        shape=(meta['n_samples'], meta['n_rows']))
+    return samples.T
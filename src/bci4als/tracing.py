@@ -0,0 +1,152 @@
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Histogram bins edges in ms
+LATENCY_BINS = [0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, np.inf]
+
+# Name of the latency report file inside the session directory
+LATENCY_FILE = 'latency.json'
+
+
+class DecisionTrace:
+    """
+    The stage times of a single decision, from the newest sample in the window until the decision
+    is visible (feedback flip) or executed (mouse action).
+
+    Attributes:
+
+        sample_time (float):
+            The BrainFlow timestamp (unix time) of the newest sample the decision is based on.
+
+        marks (List[Tuple[str, float]]):
+            The stage name and the time the stage ended (on the tracer clock), in order.
+    """
+
+    def __init__(self, tracer: 'LatencyTracer', sample_time: float):
+        self.tracer = tracer
+        self.sample_time: float = sample_time
+        self.marks: List[Tuple[str, float]] = []
+        self.finished: bool = False
+
+    def mark(self, stage: str):
+        """Record the end of the given stage"""
+        self.marks.append((stage, self.tracer.now()))
+
+    def extend(self, marks: List[Tuple[str, float]]):
+        """
+        Add the stage marks of another process (e.g. the inference worker), in unix time.
+        On a simulated clock the unix times can not be compared with the marks, so the stages end now.
+        """
+        if self.tracer.clock is None:
+            self.marks.extend(marks)
+        else:
+            for stage, _ in marks:
+                self.mark(stage)
+
+    def finish(self):
+        """Close the trace and hand it to the tracer"""
+        if not self.finished:
+            self.finished = True
+            self.tracer.add(self)
+
+    def durations(self) -> Dict[str, float]:
+        """
+        Return the duration of each stage in seconds (since the previous stage ended),
+        and the total latency since the sample.
+        """
+        durations, previous = {}, self.sample_time
+        for stage, end in self.marks:
+            durations[stage] = end - previous
+            previous = end
+        durations['total'] = previous - self.sample_time
+
+        return durations
+
+
+class LatencyTracer:
+    """
+    Collect the decision traces of a session and report the latency of each stage.
+
+    Usage:
+        trace = tracer.start(eeg.last_sample_time)
+        ...
+        trace.mark('predict')
+        ...
+        trace.finish()
+
+    Attributes:
+
+        clock:
+            The time source of the marks, on the clock of the sample timestamps (e.g. the `SimulatedBoard`
+            of a simulated session). None for unix time, the clock of the BrainFlow timestamps.
+
+        traces (List[DecisionTrace]):
+            The finished traces.
+    """
+
+    def __init__(self, clock=None):
+        self.clock = clock
+        self.traces: List[DecisionTrace] = []
+        self._lock = threading.Lock()
+
+    def now(self) -> float:
+        """Return the current time on the clock of the sample timestamps"""
+        return self.clock.now() if self.clock is not None else time.time()
+
+    def start(self, sample_time: Optional[float]) -> DecisionTrace:
+        """
+        Start tracing a decision.
+        :param sample_time: the timestamp of the newest sample in the window, now if not known
+        :return: the trace of the decision
+        """
+        return DecisionTrace(self, sample_time if sample_time is not None else self.now())
+
+    def add(self, trace: DecisionTrace):
+        with self._lock:
+            self.traces.append(trace)
+
+    def latencies(self) -> Dict[str, np.ndarray]:
+        """Return the latencies of each stage in ms over all the traces"""
+        with self._lock:
+            traces = list(self.traces)
+
+        latencies: Dict[str, List[float]] = {}
+        for trace in traces:
+            for stage, duration in trace.durations().items():
+                latencies.setdefault(stage, []).append(duration * 1000)
+
+        return {stage: np.array(values) for stage, values in latencies.items()}
+
+    def summary(self) -> Dict[str, Dict]:
+        """
+        Summarize the latency of each stage.
+        :return: dict with count, mean, percentiles, max (ms) and histogram of each stage
+        """
+        summary = {}
+        for stage, values in self.latencies().items():
+            p50, p90, p95, p99 = np.percentile(values, [50, 90, 95, 99])
+            counts, _ = np.histogram(values, LATENCY_BINS)
+            summary[stage] = {'count': len(values), 'mean_ms': float(values.mean()),
+                              'p50_ms': float(p50), 'p90_ms': float(p90), 'p95_ms': float(p95),
+                              'p99_ms': float(p99), 'max_ms': float(values.max()),
+                              'histogram': {'bins_ms': [str(b) for b in LATENCY_BINS],
+                                            'counts': counts.tolist()}}
+
+        return summary
+
+    def save(self, directory: str) -> str:
+        """
+        Save the latency summary to the given directory.
+        :param directory: the session directory
+        :return: the path of the latency file
+        """
+        path = os.path.join(directory, LATENCY_FILE)
+        with open(path, 'w') as file:
+            json.dump(self.summary(), file, indent=4)
+
+        return path
@@ -0,0 +1,314 @@
+import struct
+import xml.etree.ElementTree as ElementTree
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from bci4als.storage import StoreWriter
+from nptyping import NDArray
+
+XDF_MAGIC = b'XDF:'
+
+# Chunk tags
+FILE_HEADER = 1
+STREAM_HEADER = 2
+SAMPLES = 3
+CLOCK_OFFSET = 4
+BOUNDARY = 5
+STREAM_FOOTER = 6
+
+# Numeric channel formats
+FORMATS = {'float32': '<f4', 'double64': '<f8', 'int8': '<i1', 'int16': '<i2', 'int32': '<i4', 'int64': '<i8'}
+
+
+class XDFStream:
+    """
+    The header of a stream in the XDF file.
+
+    Attributes:
+
+        stream_id (int):
+            The stream id in the file.
+
+        name (str):
+            The stream name.
+
+        type (str):
+            The stream type (e.g. 'EEG', 'Markers').
+
+        channel_count (int):
+            The number of channels.
+
+        nominal_srate (float):
+            The sampling rate (0 for irregular streams, like markers).
+
+        channel_format (str):
+            The values format ('float32', 'string' etc.).
+
+        labels (List[str]):
+            The channels labels, if the stream has them.
+    """
+
+    def __init__(self, stream_id: int, header: bytes):
+
+        info = ElementTree.fromstring(header)
+        self.stream_id: int = stream_id
+        self.name: str = info.findtext('name')
+        self.type: str = info.findtext('type')
+        self.channel_count: int = int(info.findtext('channel_count'))
+        self.nominal_srate: float = float(info.findtext('nominal_srate'))
+        self.channel_format: str = info.findtext('channel_format')
+        self.labels: List[str] = [ch.findtext('label') for ch in info.findall('desc/channels/channel')]
+
+    def __repr__(self):
+        return f'XDFStream({self.stream_id}, {self.name}, {self.type}, {self.channel_count} channels)'
+
+
+def _read_varlen(data, position: int) -> Tuple[int, int]:
+    """Read variable length int (1 byte of the int size and the int) and return it with the new position"""
+    n_bytes = data[position]
+    return int.from_bytes(data[position + 1:position + 1 + n_bytes], 'little'), position + 1 + n_bytes
+
+
+def iter_chunks(path: str, want: Callable[[int, Optional[int]], bool] = lambda tag, stream_id: True) \
+        -> Iterator[Tuple[int, Optional[int], bytes]]:
+    """
+    Iterate over the chunks of the XDF file, a chunk at a time.
+    :param path: the XDF file
+    :param want: filter of the chunks by tag and stream id, the other chunks are skipped without reading
+    :return: iterator of (tag, stream id (None for chunks without stream), chunk content)
+    """
+    with open(path, 'rb') as file:
+        if file.read(4) != XDF_MAGIC:
+            raise ValueError(f'{path} is not XDF file')
+
+        while True:
+            n_bytes = file.read(1)
+            if not n_bytes:
+                return
+
+            length = int.from_bytes(file.read(n_bytes[0]), 'little')
+            tag = struct.unpack('<H', file.read(2))[0]
+            length -= 2
+
+            stream_id = None
+            if tag in (STREAM_HEADER, SAMPLES, CLOCK_OFFSET, STREAM_FOOTER):
+                stream_id = struct.unpack('<I', file.read(4))[0]
+                length -= 4
+
+            if want(tag, stream_id):
+                yield tag, stream_id, file.read(length)
+            else:
+                file.seek(length, 1)
+
+
+def read_streams(path: str) -> Dict[int, XDFStream]:
+    """Return the streams headers of the XDF file by stream id"""
+    return {stream_id: XDFStream(stream_id, content)
+            for _, stream_id, content in iter_chunks(path, lambda tag, _: tag == STREAM_HEADER)}
+
+
+def decode_samples(content: bytes, stream: XDFStream, last_time: Optional[float]) \
+        -> Tuple[NDArray, NDArray, Optional[float]]:
+    """
+    Decode a samples chunk.
+    Samples without timestamp get the previous timestamp plus the sampling period.
+    :param content: the chunk content (after the stream id)
+    :param stream: the stream of the chunk
+    :param last_time: the timestamp of the last sample of the previous chunk
+    :return: timestamps, values with the shape (n_samples, n_channels) and the last timestamp
+    """
+    n_samples, position = _read_varlen(content, 0)
+    period = 1 / stream.nominal_srate if stream.nominal_srate > 0 else 0.
+    numeric = stream.channel_format in FORMATS
+
+    # Fast path: numeric samples which all have timestamps
+    if numeric:
+        dtype = np.dtype([('time_bytes', 'u1'), ('time', '<f8'),
+                          ('values', FORMATS[stream.channel_format], (stream.channel_count,))])
+        if len(content) - position == n_samples * dtype.itemsize:
+            samples = np.frombuffer(content, dtype, offset=position)
+            if (samples['time_bytes'] == 8).all():
+                times = samples['time'].copy()
+                return times, samples['values'].copy(), times[-1] if n_samples else last_time
+
+    times = np.empty(n_samples)
+    values = np.empty((n_samples, stream.channel_count), dtype=FORMATS.get(stream.channel_format, object))
+    value_dtype = np.dtype(FORMATS[stream.channel_format]) if numeric else None
+    for i in range(n_samples):
+        if content[position] == 8:
+            last_time = struct.unpack_from('<d', content, position + 1)[0]
+            position += 9
+        else:
+            last_time = (last_time if last_time is not None else 0.) + period
+            position += 1
+        times[i] = last_time
+
+        if numeric:
+            values[i] = np.frombuffer(content, value_dtype, stream.channel_count, position)
+            position += value_dtype.itemsize * stream.channel_count
+        else:
+            for ch in range(stream.channel_count):
+                length, position = _read_varlen(content, position)
+                values[i, ch] = content[position:position + length].decode('utf-8')
+                position += length
+
+    return times, values, last_time
+
+
+def iter_samples(path: str, stream: XDFStream) -> Iterator[Tuple[NDArray, NDArray]]:
+    """
+    Iterate over the samples of a stream, a chunk at a time.
+    :param path: the XDF file
+    :param stream: the stream
+    :return: iterator of (timestamps, values with the shape (n_samples, n_channels))
+    """
+    last_time = None
+    for _, _, content in iter_chunks(path, lambda tag, sid: tag == SAMPLES and sid == stream.stream_id):
+        times, values, last_time = decode_samples(content, stream, last_time)
+        yield times, values
+
+
+def find_stream(streams: Dict[int, XDFStream], stream_type: str) -> XDFStream:
+    """Return the first stream of the given type"""
+    for stream in streams.values():
+        if stream.type == stream_type:
+            return stream
+
+    raise ValueError(f'No {stream_type} stream, the streams are {list(streams.values())}')
+
+
+def _marker_value(marker) -> Optional[float]:
+    """The numeric value of a marker, None for the other markers (e.g. `session start`)"""
+    try:
+        return float(marker)
+    except (TypeError, ValueError):
+        return None
+
+
+def marker_trials(times: NDArray, markers: List[str], start_marker: float = 1111, stop_marker: float = 9) \
+        -> List[Tuple[float, float, int]]:
+    """
+    Decode the trials from the markers of the lab recorder protocol: start marker, then the label marker,
+    and a stop marker at the end of the trial. Other markers (e.g. session start) are ignored.
+    :param times: the markers timestamps
+    :param markers: the markers values
+    :param start_marker: the trial start marker
+    :param stop_marker: the trial stop marker
+    :return: list of (start time, stop time, label) of each complete trial
+    """
+    trials, start, label = [], None, None
+    values = [_marker_value(m) for m in markers]
+    for i, (time, value) in enumerate(zip(times, values)):
+        if value == start_marker and i + 1 < len(values) and values[i + 1] is not None:
+            start, label = time, int(values[i + 1])
+        elif value == stop_marker and start is not None:
+            trials.append((start, time, label))
+            start = None
+
+    return trials
+
+
+def fit_timestamps(path: str, stream: XDFStream) -> Tuple[float, float, int]:
+    """
+    Fit a line to the stream timestamps by the sample index, to remove the jitter of the chunks timestamps.
+    The fit accumulates sums only, so it reads the stream a chunk at a time.
+    :param path: the XDF file
+    :param stream: the stream
+    :return: the sampling period, the timestamp of the first sample and the number of samples
+    """
+    n, sum_i, sum_t, sum_ii, sum_it, origin = 0, 0., 0., 0., 0., None
+    for times, _ in iter_samples(path, stream):
+        if origin is None and len(times):
+            origin = times[0]
+
+        # Sums relative to the first timestamp, for precision
+        index = np.arange(n, n + len(times), dtype=np.float64)
+        times = times - origin
+        sum_i, sum_t = sum_i + index.sum(), sum_t + times.sum()
+        sum_ii, sum_it = sum_ii + (index ** 2).sum(), sum_it + (index * times).sum()
+        n += len(times)
+
+    if n < 2:
+        raise ValueError(f'The stream {stream.name} has {n} samples')
+
+    period = (n * sum_it - sum_i * sum_t) / (n * sum_ii - sum_i ** 2)
+    return period, origin + (sum_t - period * sum_i) / n, n
+
+
+def xdf_to_store(path: str, directory: str, ch_names: Optional[List[str]] = None,
+                 channels: Optional[List[int]] = None, eeg_type: str = 'EEG', marker_type: str = 'Markers',
+                 start_marker: float = 1111, stop_marker: float = 9, dtype=np.float64) \
+        -> Tuple[List[Tuple[int, int]], List[int]]:
+    """
+    Cut the trials of an XDF recording into a session store.
+
+    The file is read in chunks: first the headers, the markers and the EEG timestamps (fitted to a line,
+    like the pyxdf dejitter), then the EEG samples, so only one chunk and the running trial are in memory,
+    regardless of the file size. The stream clock offsets are not applied (the streams are assumed to
+    come from the same computer).
+
+    :param path: the XDF file
+    :param directory: the session directory of the store
+    :param ch_names: the names of the kept channels, by default the stream labels or ch1, ch2...
+    :param channels: the indices of the kept EEG channels, all by default
+    :param eeg_type: the type of the EEG stream
+    :param marker_type: the type of the markers stream
+    :param start_marker: the trial start marker (see `marker_trials`)
+    :param stop_marker: the trial stop marker
+    :param dtype: the samples type of the store
+    :return: the durations (start & stop sample index in the EEG stream) and the labels of the trials,
+             the same as `EEG.extract_trials`
+    """
+    streams = read_streams(path)
+    eeg, marker = find_stream(streams, eeg_type), find_stream(streams, marker_type)
+
+    # The markers are few, read them all
+    marker_times, marker_values = [], []
+    for times, values in iter_samples(path, marker):
+        marker_times.extend(times)
+        marker_values.extend(values[:, 0])
+
+    # The trials start & stop sample index (the first sample at the marker time or after it)
+    period, first_time, n_total = fit_timestamps(path, eeg)
+    trials = [(int(np.ceil((start - first_time) / period)), int(np.ceil((stop - first_time) / period)), label)
+              for start, stop, label in marker_trials(np.array(marker_times), marker_values,
+                                                      start_marker, stop_marker)]
+    complete = [(max(start, 0), stop, label) for start, stop, label in trials if stop <= n_total]
+    if len(complete) < len(trials):
+        print(f'{len(trials) - len(complete)} trials end after the EEG stream, skipping them')
+
+    # Trials without samples (stopped at the start sample, or before the stream)
+    kept = [(start, stop, label) for start, stop, label in complete if start < stop]
+    if len(kept) < len(complete):
+        print(f'{len(complete) - len(kept)} trials have no EEG samples, skipping them')
+    durations = [(start, stop) for start, stop, _ in kept]
+    labels = [label for _, _, label in kept]
+
+    channels = list(range(eeg.channel_count)) if channels is None else list(channels)
+    if ch_names is None:
+        ch_names = [eeg.labels[c] for c in channels] if eeg.labels else [f'ch{c + 1}' for c in channels]
+
+    writer = StoreWriter(directory, ch_names, eeg.nominal_srate, dtype=dtype,
+                         metadata={'source': path, 'stream': eeg.name, 'durations': durations})
+
+    # Cut the trials while streaming the EEG samples, keep only the samples of the running trial
+    trial, parts, n_samples = 0, [], 0
+    for _, values in iter_samples(path, eeg):
+        chunk_end = n_samples + len(values)
+        while trial < len(durations):
+            start, stop = durations[trial]
+            if start < chunk_end and stop > n_samples:
+                parts.append(values[max(start - n_samples, 0):stop - n_samples, channels])
+
+            # The trial continues in the next chunk
+            if stop > chunk_end:
+                break
+
+            writer.append(np.concatenate(parts).T, labels[trial])
+            trial, parts = trial + 1, []
+
+        n_samples = chunk_end
+
+    writer.close()
+
+    return durations, labels
@@ -0,0 +1,6 @@
+"""Pytest configuration: the tests run on servers without a display."""
+
+import os
+
+# Set before anything imports bci4als, since pyglet (through psychopy) opens the display on import
+os.environ.setdefault('PYGLET_HEADLESS', '1')
@@ -0,0 +1,64 @@
+"""Tests for the online sessions analytics."""
+
+import json
+import os
+
+import numpy as np
+import pytest
+
+from bci4als.analytics import OnlineAnalytics, wolpaw_bits
+from bci4als.experiments.event_log import EventLog
+
+
+def test_wolpaw_bits():
+    assert wolpaw_bits(1., 5) == pytest.approx(np.log2(5))
+    assert wolpaw_bits(0.2, 5) == 0 and wolpaw_bits(0.1, 5) == 0
+    # 2 classes, 90% accuracy
+    assert wolpaw_bits(0.9, 2) == pytest.approx(1 + 0.9 * np.log2(0.9) + 0.1 * np.log2(0.1))
+
+
+@pytest.fixture
+def sessions(tmpdir):
+    # Old session with results.json, threshold 2
+    old = os.path.join(tmpdir, 'avi', '1')
+    os.makedirs(old)
+    json.dump([[[0, 0], [0, 1], [0, 0]], [[1, 2], [1, 2]]], open(os.path.join(old, 'results.json'), 'w'))
+
+    # New session with the event log, a prediction every 2 seconds
+    new = os.path.join(tmpdir, 'eden', '1')
+    os.makedirs(new)
+    with EventLog(os.path.join(new, 'events.jsonl')) as log:
+        for attempt, prediction in enumerate([3, 3]):
+            log.log('prediction', trial=0, attempt=attempt, target=3, prediction=prediction)
+        log.log('trial_end', trial=0, target=3, accuracy=1., confident=True)
+    events = [json.loads(line) for line in open(os.path.join(new, 'events.jsonl'))]
+    with open(os.path.join(new, 'events.jsonl'), 'w') as file:
+        for i, e in enumerate(events):
+            file.write(json.dumps({**e, 'time': 100. + 2 * i}) + '\n')
+
+    return [old, new]
+
+
+def test_summary(sessions, tmpdir):
+    cache_path = os.path.join(tmpdir, 'analytics.json')
+    analytics = OnlineAnalytics(sessions, buffer_time=2, cache_path=cache_path)
+    summary = analytics.sessions_summary()
+
+    assert summary['threshold'].tolist() == [2, 2]
+    assert summary['accuracy'].tolist() == pytest.approx([2 / 5, 1])
+    assert summary['skip_rate'].tolist() == [0.5, 0]
+    assert summary['attempts_to_threshold'].tolist() == [3, 2]
+    assert summary['time_to_target'].tolist() == [6, 4]
+
+    # A trial is a selection: the old session selected 1 of 2 trials in 10 seconds, the new 1 of 1 in 4 seconds
+    assert summary['selection_accuracy'].tolist() == [0.5, 1]
+    assert summary['itr'].tolist() == pytest.approx([wolpaw_bits(0.5, 5) * 60 / 5, np.log2(5) * 60 / 4])
+    assert summary['window_itr'][1] == pytest.approx(np.log2(5) * 60 / 2)
+
+    subjects = analytics.subjects_summary()
+    assert subjects['subject'].tolist() == ['avi', 'eden'] and subjects['n_attempts'].tolist() == [5, 2]
+    assert analytics.confusion('subject')[0][1, 2] == 2 and analytics.confusion()[1][3, 3] == 2
+
+    # The aggregates come from the cache without loading the records
+    cached = OnlineAnalytics(sessions, buffer_time=2, cache_path=cache_path)
+    assert cached.sessions_summary().equals(summary) and cached._records is None
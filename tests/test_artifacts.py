@@ -0,0 +1,72 @@
+"""Tests for the artifact rejection gate."""
+
+import os
+
+import numpy as np
+
+from bci4als.artifacts import ArtifactGate, detrend
+from bci4als.experiments.clock import VirtualClock
+from bci4als.experiments.event_log import read_events
+from bci4als.experiments.online import OnlineExperiment
+from bci4als.simulation import SimulatedEEG
+
+
+def clean_window(rng, n_channels=4, n_samples=500):
+    return rng.normal(0, 10, (n_channels, n_samples))
+
+
+def test_detrend():
+    t = np.arange(100)
+    data = np.stack([3 * t + 5, -t]).astype(float)
+    assert np.allclose(detrend(data), 0)
+
+
+def test_thresholds():
+    rng = np.random.default_rng(0)
+    gate = ArtifactGate(ptp_max=200, flat_min=1)
+
+    # Slow drift (offset & trend) is not an artifact
+    assert gate.accept(clean_window(rng) + np.linspace(0, 1000, 500) + 5000)
+
+    # Blink on channel 1
+    blink = clean_window(rng)
+    blink[1, 200:250] += 300 * np.hanning(50)
+    assert not gate.accept(blink)
+    assert gate.last_reasons == {'peak_to_peak': [1]}
+
+    # Disconnected channel 3
+    flat = clean_window(rng)
+    flat[3] = 0
+    assert not gate.accept(flat)
+    assert gate.last_reasons == {'flatline': [3]}
+
+    assert gate.summary()['rejected'] == 2 and gate.summary()['windows'] == 3
+    assert gate.channel_counts.tolist() == [0, 1, 0, 1]
+
+
+def test_adaptive_baseline():
+    rng = np.random.default_rng(0)
+    gate = ArtifactGate(ptp_max=None, flat_min=None, adaptive=True, warmup=5)
+    assert all(gate.accept(clean_window(rng)) for _ in range(10))
+
+    # Muscle activity triples the std of channel 2, below any absolute threshold
+    noisy = clean_window(rng)
+    noisy[2] *= 3
+    assert not gate.accept(noisy)
+    assert gate.last_reasons == {'adaptive': [2]}
+
+
+def test_online_rejects_windows(tmpdir):
+    clock = VirtualClock()
+    session = os.path.join(tmpdir, '1')
+    gate = ArtifactGate(ptp_max=1)
+    exp = OnlineExperiment(eeg=SimulatedEEG(clock=clock, seed=0), model=None, num_trials=2, buffer_time=2,
+                           threshold=3, skip_after=3, debug=True, audio=False, session_directory=session,
+                           headless=True, clock=clock, artifact_gate=gate)
+    exp.run()
+
+    # Every window is rejected, so each trial is skipped without predictions
+    events = os.path.join(session, 'events.jsonl')
+    assert list(read_events(events, 'prediction')) == []
+    assert len(list(read_events(events, 'artifact'))) == 6
+    assert gate.summary()['rejected'] == 6
@@ -0,0 +1,33 @@
+"""Tests for the audio cue engine."""
+
+import numpy as np
+import pytest
+
+from bci4als.experiments.audio import AudioEngine, NullOutput, default_cues
+
+
+@pytest.fixture
+def engine():
+    return AudioEngine(output=NullOutput())
+
+
+def test_cues_decoded_once(engine):
+    """All the shipped cues are decoded to the same rate and channels"""
+    assert set(engine.cues) == set(default_cues())
+    for samples in engine.cues.values():
+        assert samples.dtype == np.float32
+        assert samples.ndim == 2 and samples.shape[1] == engine.n_channels
+
+
+def test_play_is_recorded(engine):
+    engine.play('start')
+    engine.play('success')
+
+    assert engine.output.played == ['start', 'success']
+    assert [name for name, _ in engine.latencies] == ['start', 'success']
+    assert engine.latency_summary()['count'] == 2
+
+
+def test_unknown_cue(engine):
+    with pytest.raises(KeyError):
+        engine.play('unknown')
@@ -0,0 +1,55 @@
+"""Tests for the parallel batch trainer."""
+
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from bci4als.batch import SUMMARY_FILE, BatchTrainer, train_session
+from bci4als.storage import write_session
+from sklearn.model_selection import StratifiedKFold, cross_val_score
+
+
+def _session(root, subject, session, seed, sfreq=125):
+    rng = np.random.default_rng(seed)
+    labels = [0, 1] * 10
+    trials = [rng.normal(size=(8, 300)) * (1 + label * np.arange(8)[:, None] / 4) for label in labels]
+    path = os.path.join(root, subject, str(session))
+    write_session(path, trials, labels, [f'ch{i}' for i in range(8)], sfreq)
+    return path
+
+
+def test_train_and_resume(tmpdir):
+    sessions = [_session(str(tmpdir), 'avi', 1, 0), _session(str(tmpdir), 'eden', 1, 1),
+                os.path.join(str(tmpdir), 'eden', '2')]
+    output = os.path.join(str(tmpdir), 'models')
+    trainer = BatchTrainer(output, workers=2, n_folds=4, cache=os.path.join(str(tmpdir), 'cache'))
+
+    summary = trainer.run(sessions)
+    assert summary['status'].tolist() == ['ok', 'ok', 'failed']
+    assert (summary['cv_mean'][:2] > 0.8).all()
+    assert pd.read_csv(os.path.join(output, SUMMARY_FILE))['subject'].tolist() == ['avi', 'eden', 'eden']
+
+    model = pickle.load(open(summary['model_path'][0], 'rb'))
+    assert model.clf is not None and len(model.trials) == 20
+
+    # The trained sessions are skipped, the failed session is trained again
+    mtime = os.path.getmtime(summary['model_path'][0])
+    summary = trainer.run(sessions)
+    assert os.path.getmtime(summary['model_path'][0]) == mtime
+    assert summary['status'].tolist() == ['ok', 'ok', 'failed']
+
+
+def test_session_rate_and_score(tmpdir):
+    session = _session(str(tmpdir), 'avi', 1, 0, sfreq=250)
+    params = {'model_type': 'csp_lda', 'sfreq': None, 'n_folds': 4, 'cache': None}
+    result = train_session(session, os.path.join(str(tmpdir), 'models'), params)
+    assert result['status'] == 'ok' and result['sfreq'] == 250
+
+    # The score is of the saved model pipeline, on the epochs it was trained on
+    model = pickle.load(open(result['model_path'], 'rb'))
+    assert model.sfreq == 250
+    scores = cross_val_score(model.csp_lda_pipeline(6), model.training_epochs(), model.labels,
+                             cv=StratifiedKFold(4, shuffle=True, random_state=0))
+    assert result['cv_mean'] == scores.mean()
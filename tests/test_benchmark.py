@@ -0,0 +1,37 @@
+"""Tests for the hot paths benchmarks."""
+
+import json
+import os
+import subprocess
+import sys
+
+from bci4als.benchmark import compare, main, run_benchmarks
+
+
+def test_run_benchmarks():
+    results = run_benchmarks(channels=4, trials=6, session_length=60, repeat=2,
+                             only=['EEG.extract_trials', 'EEG.laplacian', 'MLModel.online_predict'])
+
+    assert set(results) == {'EEG.extract_trials', 'EEG.laplacian', 'MLModel.online_predict'}
+    assert all(r['median_ms'] > 0 and r['repeat'] == 2 for r in results.values())
+
+
+def test_report_and_compare(tmpdir):
+    output = os.path.join(tmpdir, 'results.json')
+    main(['--trials', '4', '--session-length', '30', '--repeat', '1', '--only', 'EEG.decode_marker',
+          '--output', output])
+
+    with open(output) as file:
+        report = json.load(file)
+    assert report['sizes']['trials'] == 4
+    assert list(report['results']) == ['EEG.decode_marker']
+
+    baseline = {'results': {'EEG.decode_marker': {'median_ms': 2 * report['results']['EEG.decode_marker']['median_ms']}}}
+    assert compare(baseline, report) == {'EEG.decode_marker': 2}
+
+
+def test_help():
+    # The options of the suite, not the psychopy preferences parser
+    output = subprocess.run([sys.executable, '-m', 'bci4als.benchmark', '--help'], capture_output=True, text=True,
+                            env={**os.environ, 'PYGLET_HEADLESS': '1'}, check=True).stdout
+    assert '--board-rates' in output
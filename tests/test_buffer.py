@@ -0,0 +1,56 @@
+"""Tests for the growable epochs buffer."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from bci4als.buffer import EpochBuffer
+from bci4als.ml_model import MLModel
+
+
+def test_append_grows():
+    rng = np.random.default_rng(0)
+    epochs = [rng.normal(size=(3, 100)) for _ in range(5)]
+    buffer = EpochBuffer(capacity=2)
+    for i, epoch in enumerate(epochs):
+        buffer.append(epoch, i)
+
+    assert len(buffer) == 5 and buffer.capacity == 8
+    assert buffer.labels.tolist() == [0, 1, 2, 3, 4]
+    assert all(np.array_equal(buffer[i], e) for i, e in enumerate(epochs))
+
+    # The epochs are a view of the buffer
+    assert np.shares_memory(buffer.epochs(), buffer.data)
+
+
+def test_different_lengths():
+    buffer = EpochBuffer()
+    buffer.append(np.ones((2, 50)), 0)
+    buffer.append(pd.DataFrame(np.ones((60, 2))), 1)
+
+    assert buffer.n_samples == 60
+    assert buffer.lengths.tolist() == [50, 60]
+    assert buffer.mask.sum(axis=1).tolist() == [50, 60]
+    assert buffer[0].shape == (2, 50) and buffer.data[0, :, 50:].sum() == 0
+    assert buffer.epochs().shape == (2, 2, 50)
+    with pytest.raises(ValueError):
+        buffer.epochs(55)
+    with pytest.raises(ValueError):
+        buffer.append(np.ones((3, 50)), 0)
+
+
+def test_model_buffer():
+    rng = np.random.default_rng(0)
+    trials = [rng.normal(size=(4, 250)) for _ in range(6)]
+    labels = [0, 1] * 3
+    model = MLModel(trials, labels, sfreq=125)
+
+    model.partial_fit(None, rng.normal(size=(4, 260)), 1)
+    assert len(model.trials) == 7 and model.labels.tolist() == labels + [1]
+    assert model.clf is not None
+
+    # Models pickled with the trials list are migrated to the buffer
+    old = MLModel.__new__(MLModel)
+    old.__setstate__({'trials': trials, 'labels': labels, 'debug': True, 'clf': None})
+    assert len(old.buffer) == 6 and old.sfreq is None
+    assert np.array_equal(old.trials[2], trials[2])
@@ -0,0 +1,68 @@
+"""Tests for the recordings catalog."""
+
+import json
+import os
+
+import numpy as np
+import pytest
+
+import bci4als.catalog
+
+from bci4als.catalog import CATALOG_FILE, Catalog, session_ids
+from bci4als.storage import write_session
+
+
+def _offline_session(root, subject, session, n_trials, channels=('C3', 'C4')):
+    path = os.path.join(root, subject, str(session))
+    os.makedirs(path)
+    with open(os.path.join(path, 'metadata.txt'), 'w') as file:
+        file.write('EEG Channels:\n*************\n')
+        file.write(''.join(f'Channel {i + 1}: {ch}\n' for i, ch in enumerate(channels)))
+        file.write('\nExperiment Data\n***************\nExperiment Type: Offline\n')
+    with open(os.path.join(path, 'labels.csv'), 'w') as file:
+        file.write(''.join(f'{i % 5}\n' for i in range(n_trials)))
+    return path
+
+
+@pytest.fixture
+def root(tmpdir):
+    root = str(tmpdir)
+    _offline_session(root, 'avi', 1, 10)
+    _offline_session(root, 'avi', 2, 25, channels=('CP2', 'FC2', 'CP6', 'C4', 'C3', 'CP5', 'FC1', 'CP1', 'Cz',
+                                                   'FC6', 'T8', 'T7', 'FC5'))
+    _offline_session(root, 'eden', 1, 30)
+    online = os.path.join(root, 'avi', '3')
+    os.makedirs(online)
+    json.dump([[[1, 1], [1, 0]], [[2, 2]]], open(os.path.join(online, 'results.json'), 'w'))
+    return root
+
+
+def test_query(root):
+    catalog = Catalog(root)
+
+    assert [e['session'] for e in catalog.query(subject='avi', experiment_type='offline')] == ['1', '2']
+    assert [e['session'] for e in catalog.query(subject='avi', min_trials=20, headset='avi13')] == ['2']
+
+    online = catalog.query(experiment_type='Online')[0]
+    assert online['n_trials'] == 2 and online['label_counts'] == {'1': 1, '2': 1}
+    assert session_ids(os.path.join(root, 'avi')) == [1, 2, 3]
+
+
+def test_incremental_refresh(root, monkeypatch):
+    assert Catalog(root).refresh() == 0
+    assert os.path.isfile(os.path.join(root, CATALOG_FILE))
+
+    # A new session and a changed session are indexed, the rest come from the cache
+    _offline_session(root, 'sagi', 1, 5)
+    path = os.path.join(root, 'avi', '1')
+    write_session(path, [np.zeros((2, 10))] * 3, [4, 4, 4], ['C3', 'C4'], 125)
+    os.utime(path, (1e10, 1e10))
+
+    indexed = []
+    index_session = bci4als.catalog.index_session
+    monkeypatch.setattr(bci4als.catalog, 'index_session', lambda d: indexed.append(d) or index_session(d))
+    catalog = Catalog(root)
+    assert sorted(indexed) == [path, os.path.join(root, 'sagi', '1')]
+    assert catalog.refresh() == 0
+    assert catalog.query(subject='avi', label=4)[0]['n_trials'] == 3
+    assert len(catalog.query(subject='sagi')) == 1
@@ -0,0 +1,47 @@
+"""Tests for the channels ranking and the reduced montage models."""
+
+import numpy as np
+
+from bci4als.channel_selection import rank_channels, reduced_model
+from bci4als.ml_model import MLModel
+
+
+def synthetic_trials(n_trials, n_channels, n_samples=250, sfreq=125, amplitude=4.):
+    """Noisy trials with a weak 10 Hz rhythm on the channel of the label (0 or 1)"""
+    rng = np.random.default_rng(0)
+    labels = [i % 2 for i in range(n_trials)]
+    trials = rng.normal(0, 10, (n_trials, n_channels, n_samples))
+    rhythm = amplitude * np.sin(2 * np.pi * 10 * np.arange(n_samples) / sfreq)
+    for trial, label in zip(trials, labels):
+        trial[label] += rhythm
+    return list(trials), labels
+
+
+def test_rank_and_reduce():
+    # The labels rhythm is on the first 2 channels, the other channels are noise
+    trials, labels = synthetic_trials(n_trials=40, n_channels=5)
+    ch_names = ['C3', 'C4', 'Cz', 'FC1', 'FC2']
+
+    ranking = rank_channels(np.stack(trials), labels, 125, ch_names, n_folds=3, min_channels=2, workers=1)
+
+    assert set(ranking.top(2)) == {'C3', 'C4'}
+    assert ranking.report['n_channels'].tolist() == [5, 4, 3, 2]
+    assert ranking.report['cv_mean'].iloc[-1] > 0.75
+    assert ranking.best_k(tolerance=0.05) <= 5
+
+    model = MLModel(trials, labels, sfreq=125)
+    reduced = reduced_model(model, ranking, 2)
+    assert reduced.channels == [0, 1]
+    eeg = type('EEG', (), {'sfreq': 125})()
+    predictions = [reduced.online_predict(t, eeg=eeg) for t in trials]
+    assert np.mean(np.array(predictions) == labels) > 0.75
+
+
+def test_parallel_matches_serial():
+    trials, labels = synthetic_trials(n_trials=20, n_channels=4)
+    ch_names = ['a', 'b', 'c', 'd']
+    serial = rank_channels(np.stack(trials), labels, 125, ch_names, n_folds=3, workers=1)
+    parallel = rank_channels(np.stack(trials), labels, 125, ch_names, n_folds=3, workers=2)
+
+    assert serial.ranking == parallel.ranking
+    assert np.allclose(serial.report['cv_mean'], parallel.report['cv_mean'])
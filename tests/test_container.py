@@ -0,0 +1,60 @@
+"""Tests for the EEG data container and its MNE bridge."""
+
+import mne
+import numpy as np
+import pytest
+
+from bci4als.container import EEGData
+from bci4als.experiments.clock import VirtualClock
+from bci4als.simulation import SimulatedEEG
+
+
+def test_container():
+    rng = np.random.default_rng(0)
+    data = rng.normal(0, 10, (3, 500))
+    window = EEGData(data, ['C3', 'Cz', 'C4'], sfreq=125)
+
+    assert window.get_data() is data and not window.epoched
+    assert np.array_equal(window.pick(['C4', 'C3']).get_data(), data[[2, 0]])
+    assert window.crop(1, 2).n_samples == 125 and np.shares_memory(window.crop(1, 2).data, data)
+
+    filtered = window.filter(8, 30)
+    assert np.allclose(filtered.data, mne.filter.filter_data(data, 125, 8, 30, verbose=False))
+    assert window.data is data
+
+    with pytest.raises(ValueError):
+        EEGData(data, ['C3', 'C4'], sfreq=125)
+
+
+def test_to_mne():
+    rng = np.random.default_rng(0)
+
+    # Float64 volts are shared with MNE, microvolts are scaled
+    volts = EEGData(rng.normal(0, 1e-5, (2, 250)), ['C3', 'C4'], sfreq=125, units='V')
+    raw = volts.to_mne()
+    assert isinstance(raw, mne.io.RawArray) and np.shares_memory(raw._data, volts.data)
+
+    micro = EEGData(volts.data * 1e6, ['C3', 'C4'], sfreq=125)
+    assert np.allclose(micro.to_mne().get_data(), volts.data)
+
+    epochs = EEGData.from_epochs(rng.normal(0, 1e-5, (4, 2, 250)), [0, 1, 0, 1], ['C3', 'C4'], 125, units='V')
+    mne_epochs = epochs.to_mne()
+    assert isinstance(mne_epochs, mne.EpochsArray) and len(mne_epochs['1']) == 2
+    assert np.shares_memory(mne_epochs.get_data(copy=False), epochs.data)
+
+
+def test_eeg_raw_data():
+    clock = VirtualClock()
+    eeg = SimulatedEEG(clock=clock, seed=0)
+    eeg.on()
+    clock.sleep(1)
+    eeg.insert_marker('start', 1, 0)
+    clock.sleep(1)
+
+    raw = eeg.get_raw_data(['C3', 'C4'])
+    assert raw.data.shape == (2, 2 * eeg.sfreq) and raw.units == 'V'
+    assert raw.events[:, 2].tolist() == [eeg.encode_marker('start', 1, 0)]
+
+    clock.sleep(2)
+    assert eeg.get_features(['C3', 'C4'], ['pow_freq_bands', 'variance']).shape == (1, 8)
+    eeg.off()
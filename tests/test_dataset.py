@@ -0,0 +1,92 @@
+"""Tests for the multi-session dataset and the preprocessed epochs cache."""
+
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from bci4als.dataset import EpochCache, SessionDataset, preprocess_epochs
+from bci4als.storage import write_session
+
+CHANNELS = ['C3', 'C4', 'Cz']
+
+
+@pytest.fixture
+def sessions(tmpdir):
+    rng = np.random.default_rng(0)
+
+    # A session with a store and an old session with trials.pickle (other channels order)
+    store_session = os.path.join(tmpdir, 'avi', '1')
+    write_session(store_session, [rng.normal(size=(3, 400 + i)) for i in range(4)], [0, 1, 0, 1], CHANNELS, 125)
+
+    legacy_session = os.path.join(tmpdir, 'avi', '2')
+    os.makedirs(legacy_session)
+    trials = [pd.DataFrame(rng.normal(size=(390, 3)), columns=CHANNELS[::-1]) for _ in range(6)]
+    pickle.dump(trials, open(os.path.join(legacy_session, 'trials.pickle'), 'wb'))
+    pd.DataFrame({'name': [1, 0] * 3}).to_csv(os.path.join(legacy_session, 'labels.csv'), index=False, header=False)
+
+    return [store_session, legacy_session]
+
+
+def test_load(sessions):
+    dataset = SessionDataset(sessions, tmin=0.5, reference='average')
+    X, y = dataset.load()
+
+    assert dataset.n_samples == 390
+    assert X.shape == (10, 3, 390 - 62)
+    assert y.tolist() == [0, 1, 0, 1] + [1, 0] * 3
+    assert dataset.groups().tolist() == [0] * 4 + [1] * 6
+    np.testing.assert_allclose(X.mean(axis=1), 0, atol=1e-12)
+
+    # The legacy session channels are reordered to the dataset channels
+    raw, _ = dataset.raw_epochs(1)
+    legacy = pickle.load(open(os.path.join(sessions[1], 'trials.pickle'), 'rb'))
+    np.testing.assert_array_equal(raw[0], legacy[0][CHANNELS].to_numpy().T)
+
+
+def test_sampling_rate(sessions, tmpdir):
+    assert SessionDataset(sessions).sfreq == 125
+
+    # The rate recorded in the store is used, a different given rate is an error
+    session = os.path.join(tmpdir, 'avi', '3')
+    write_session(session, [np.zeros((3, 500))] * 2, [0, 1], CHANNELS, 250)
+    assert SessionDataset([session]).sfreq == 250
+    with pytest.raises(ValueError):
+        SessionDataset([session], sfreq=125)
+
+    # Sessions of other rates can not be mixed, the old sessions are at the legacy rate
+    with pytest.raises(ValueError):
+        SessionDataset([session, sessions[0]]).load()
+    with pytest.raises(ValueError):
+        SessionDataset([session, sessions[1]]).load()
+    with pytest.raises(ValueError):
+        SessionDataset([sessions[1]], sfreq=250)
+
+
+def test_cache_skips_filtering(sessions, tmpdir, monkeypatch):
+    cache = EpochCache(os.path.join(tmpdir, 'cache'))
+    X, _ = SessionDataset(sessions, cache=cache).load()
+    assert (cache.hits, cache.misses) == (0, 2)
+
+    # Second run with the same settings never filters
+    monkeypatch.setattr('bci4als.dataset.preprocess_epochs', None)
+    cache = EpochCache(os.path.join(tmpdir, 'cache'))
+    np.testing.assert_array_equal(SessionDataset(sessions, cache=cache).load()[0], X)
+    assert (cache.hits, cache.misses) == (2, 0)
+
+
+def test_cache_key_and_eviction(tmpdir):
+    epochs = np.random.default_rng(0).normal(size=(5, 3, 300))
+    cache = EpochCache(str(tmpdir), max_bytes=epochs.nbytes + 1000)
+
+    np.testing.assert_array_equal(cache.preprocess(epochs, 125), preprocess_epochs(epochs, 125))
+    cache.preprocess(epochs, 125, h_freq=20.)
+    cache.preprocess(epochs + 1, 125, h_freq=20.)
+    assert cache.misses == 3
+
+    # Only the newest entry fits in the cache
+    assert len(os.listdir(str(tmpdir))) == 1
+    cache.preprocess(epochs + 1, 125, h_freq=20.)
+    assert cache.hits == 1
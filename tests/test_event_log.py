@@ -0,0 +1,46 @@
+"""Tests for the online session events log."""
+
+import json
+import os
+
+import pytest
+
+from bci4als.experiments.event_log import EventLog, EVENTS_FILE, read_events, load_results
+
+
+def _log_session(path, results, **kwargs):
+    with EventLog(path, **kwargs) as log:
+        for trial, pairs in enumerate(results):
+            for attempt, (target, prediction) in enumerate(pairs):
+                log.log('prediction', trial=trial, attempt=attempt, target=target, prediction=prediction)
+            log.log('trial_end', trial=trial)
+
+
+@pytest.mark.parametrize('fsync', ['never', 'batch', 'always'])
+def test_rebuild_results(tmpdir, fsync):
+    results = [[[4, 4], [4, 0], [4, 4]], [[3, 3]], [[0, 1], [0, 0]]]
+    _log_session(os.path.join(tmpdir, EVENTS_FILE), results, batch_size=2, fsync=fsync)
+
+    assert load_results(str(tmpdir)) == results
+    assert len(read_events(os.path.join(tmpdir, EVENTS_FILE), event='trial_end')) == 3
+
+
+def test_truncated_line_ignored(tmpdir):
+    path = os.path.join(tmpdir, EVENTS_FILE)
+    _log_session(path, [[[1, 1]]])
+    with open(path, 'a') as file:
+        file.write('{"event": "predic')
+
+    assert load_results(str(tmpdir)) == [[[1, 1]]]
+
+
+def test_legacy_results_json(tmpdir):
+    results = [[[2, 2], [2, 2], [2, 2]]]
+    json.dump(results, open(os.path.join(tmpdir, 'results.json'), 'w'))
+
+    assert load_results(str(tmpdir)) == results
+
+
+def test_unknown_fsync(tmpdir):
+    with pytest.raises(ValueError):
+        EventLog(os.path.join(tmpdir, EVENTS_FILE), fsync='sometimes')
@@ -0,0 +1,67 @@
+"""Tests for running the experiments headless on a virtual clock."""
+
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from bci4als.experiments.clock import VirtualClock
+from bci4als.experiments.event_log import load_results
+from bci4als.experiments.offline import OfflineExperiment
+from bci4als.experiments.online import OnlineExperiment
+from bci4als.simulation import SimulatedEEG
+
+
+@pytest.fixture
+def clock():
+    return VirtualClock()
+
+
+@pytest.fixture
+def eeg(clock):
+    return SimulatedEEG(clock=clock, seed=0)
+
+
+def test_offline_session(tmpdir, clock, eeg):
+    session = os.path.join(tmpdir, '1')
+    exp = OfflineExperiment(eeg=eeg, num_trials=20, trial_length=4, session_directory=session,
+                            headless=True, clock=clock)
+
+    start = time.perf_counter()
+    trials, labels = exp.run()
+
+    # 20 trials of ~6 seconds each, in a few seconds
+    assert clock.now() > 20 * 6
+    assert time.perf_counter() - start < 10
+    assert len(trials) == len(labels) == 20
+    assert all(abs(len(t) - 4 * eeg.sfreq) <= 1 for t in trials)
+    assert {'metadata.txt', 'trials.pickle', 'labels.csv', 'store', 'frame_timing.json'} <= set(os.listdir(session))
+
+
+def test_online_session(tmpdir, clock, eeg):
+    session = os.path.join(tmpdir, '2')
+    exp = OnlineExperiment(eeg=eeg, model=None, num_trials=5, buffer_time=2, threshold=3, skip_after=8,
+                           debug=True, audio=False, session_directory=session, headless=True, clock=clock)
+    exp.run()
+
+    results = load_results(session)
+    assert {'events.jsonl', 'latency.json', 'frame_timing.json'} <= set(os.listdir(session))
+    assert [trial[0][0] for trial in results] == exp.labels
+    assert clock.now() == pytest.approx(2 * sum(len(trial) for trial in results), rel=0.01)
+
+
+def test_without_display(tmpdir):
+    # No display and no PYGLET_HEADLESS (see conftest.py), the headless session never loads the psychopy window
+    script = ('import sys\n'
+              'from bci4als.experiments.clock import VirtualClock\n'
+              'from bci4als.experiments.online import OnlineExperiment\n'
+              'from bci4als.simulation import SimulatedEEG\n'
+              'clock = VirtualClock()\n'
+              'OnlineExperiment(eeg=SimulatedEEG(clock=clock, seed=0), model=None, num_trials=1, buffer_time=2,\n'
+              '                 threshold=3, skip_after=2, debug=True, audio=False, session_directory=sys.argv[1],\n'
+              '                 headless=True, clock=clock).run()\n'
+              'assert "psychopy.visual" not in sys.modules\n')
+    env = {k: v for k, v in os.environ.items() if k not in ('PYGLET_HEADLESS', 'DISPLAY')}
+    subprocess.run([sys.executable, '-c', script, os.path.join(tmpdir, '1')], env=env, check=True)
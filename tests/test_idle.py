@@ -0,0 +1,78 @@
+"""Tests for the cursor standstill detection."""
+
+import threading
+import time
+
+from bci4als.idle import IdleDetector
+
+
+class FakeSource:
+    """Move events source driven by the test"""
+
+    def __init__(self):
+        self.on_move = None
+        self.stopped = False
+
+    def start(self, on_move):
+        self.on_move = on_move
+
+    def stop(self):
+        self.stopped = True
+
+
+def test_idle_after_dwell():
+    source = FakeSource()
+    detector = IdleDetector(r=10, dwell=0.1, source=source)
+    detector.start()
+    source.on_move(0, 0)
+
+    start = time.perf_counter()
+    motion_stop = detector.wait_idle()
+    assert 0.09 < time.perf_counter() - start < 0.5
+    assert motion_stop == detector.last_motion
+
+    detector.stop()
+    assert source.stopped
+
+
+def test_motion_restarts_dwell():
+    source = FakeSource()
+    detector = IdleDetector(r=10, dwell=0.2, source=source)
+    detector.start()
+    source.on_move(0, 0)
+
+    def move():
+        # Tremor inside the radius is not motion, a move out of it is
+        time.sleep(0.1)
+        source.on_move(5, 5)
+        time.sleep(0.05)
+        source.on_move(50, 0)
+
+    start = time.perf_counter()
+    threading.Thread(target=move).start()
+    motion_stop = detector.wait_idle()
+
+    assert motion_stop - start > 0.14
+    assert time.perf_counter() - motion_stop >= 0.2
+
+
+def test_consecutive_waits_without_motion():
+    source = FakeSource()
+    detector = IdleDetector(r=10, dwell=0.1, source=source)
+    detector.start()
+    source.on_move(0, 0)
+    first = detector.wait_idle()
+
+    # E.g. after a click the cursor did not move, the next wait still lasts the dwell
+    start = time.perf_counter()
+    second = detector.wait_idle()
+    assert time.perf_counter() - start >= 0.09
+    assert second >= start > first
+
+
+def test_timeout():
+    source = FakeSource()
+    detector = IdleDetector(dwell=10, source=source)
+    source_start = time.perf_counter()
+    assert detector.wait_idle(timeout=0.05) is None
+    assert time.perf_counter() - source_start < 1
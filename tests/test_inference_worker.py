@@ -0,0 +1,105 @@
+"""Tests for the out-of-process inference worker."""
+
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+from bci4als.benchmark import synthetic_trials
+from bci4als.experiments.clock import VirtualClock
+from bci4als.experiments.online import OnlineExperiment
+from bci4als.inference_worker import InferenceWorker, WorkerError
+from bci4als.ml_model import MLModel
+from bci4als.simulation import SimulatedEEG
+from bci4als.tracing import LatencyTracer
+
+
+@pytest.fixture
+def model():
+    trials, labels = synthetic_trials(20, 4, 500, 125)
+    model = MLModel(trials, labels, sfreq=125)
+    model.offline_training(eeg=None)
+    return model
+
+
+def test_worker_predict_and_fit(tmpdir, model):
+    eeg = SimulatedEEG(seed=0)
+    windows, labels = synthetic_trials(6, 4, 500, 125, seed=1)
+    persist_path = os.path.join(tmpdir, 'model.pickle')
+
+    with InferenceWorker(model, persist_path=persist_path) as worker:
+        # The same decisions as the in-process model
+        trace = LatencyTracer().start(0)
+        prediction, scores = worker.online_predict(windows[0], eeg, return_scores=True, trace=trace)
+        assert prediction == model.online_predict(windows[0], eeg)
+        assert np.allclose(scores, model.online_predict(windows[0], eeg, return_scores=True)[1])
+        assert [stage for stage, _ in trace.marks] == ['filter', 'feature', 'predict']
+
+        # The retrains run in the worker, the next decision comes after them
+        for window, label in zip(windows[1:4], labels[1:4]):
+            worker.partial_fit(eeg, window, label)
+            model.partial_fit(eeg, window, label)
+        assert worker.n_trials == 23
+        assert worker.online_predict(windows[4], eeg) == model.online_predict(windows[4], eeg)
+
+        worker.wait()
+        with open(persist_path, 'rb') as file:
+            assert len(pickle.load(file).labels) == 23
+        assert len(worker.fetch_model().labels) == 23
+
+
+def test_worker_crash_recovery(model):
+    eeg = SimulatedEEG(seed=0)
+    windows, labels = synthetic_trials(4, 4, 500, 125, seed=1)
+
+    with InferenceWorker(model, max_restarts=1) as worker:
+        worker.partial_fit(eeg, windows[0], labels[0])
+        worker.wait()
+
+        # The restarted worker has the co-learning trials of the crashed one
+        worker._process.kill()
+        worker._process.join()
+        assert worker.online_predict(windows[1], eeg) in (0, 1)
+        assert worker.restarts == 1 and len(worker.fetch_model().labels) == 21
+
+        worker._process.kill()
+        worker._process.join()
+        with pytest.raises(WorkerError):
+            worker.online_predict(windows[2], eeg)
+
+
+class CrashingModel(MLModel):
+    """A model whose worker dies on every co-learning trial, also when the trials are replayed"""
+
+    def add_trial(self, eeg, X, y):
+        os._exit(1)
+
+
+def test_worker_crashes_on_replay(model):
+    eeg = SimulatedEEG(seed=0)
+    windows, labels = synthetic_trials(2, 4, 500, 125, seed=1)
+    crashing = CrashingModel(model.trials, model.labels.tolist(), sfreq=125)
+    crashing.clf = model.clf
+
+    with InferenceWorker(crashing, max_restarts=2, timeout=30) as worker:
+        worker.partial_fit(eeg, windows[0], labels[0])
+        with pytest.raises(WorkerError):
+            worker.online_predict(windows[1], eeg)
+        assert worker.restarts == 3
+
+
+def test_online_experiment_takes_worker_model(tmpdir):
+    clock = VirtualClock()
+    eeg = SimulatedEEG(clock=clock, seed=0)
+    trials, labels = synthetic_trials(20, len(eeg.get_board_channels()), 250, eeg.sfreq)
+    model = MLModel(trials, labels, sfreq=eeg.sfreq)
+    model.offline_training(eeg=None)
+
+    exp = OnlineExperiment(eeg=eeg, model=model, num_trials=1, buffer_time=2, threshold=3, skip_after=2,
+                           co_learning=True, audio=False, session_directory=os.path.join(tmpdir, '1'),
+                           headless=True, clock=clock, inference_worker=True)
+    exp.run()
+
+    # The experiment model is the co-learned model of the worker
+    assert exp.worker is None and len(exp.model.labels) == 20 + len(exp.results[0])
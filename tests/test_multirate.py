@@ -0,0 +1,94 @@
+"""Tests for the multirate processing."""
+
+import numpy as np
+import pytest
+from scipy.signal import lfilter
+
+from bci4als.benchmark import run_board_rate_benchmarks, synthetic_trials
+from bci4als.experiments.clock import VirtualClock
+from bci4als.ml_model import MLModel
+from bci4als.multirate import Decimator, decimate, decimation_factor
+from bci4als.simulation import SimulatedEEG
+
+
+def test_decimation_factor():
+    assert [decimation_factor(sfreq, 30.) for sfreq in (125, 250, 500, 1000)] == [1, 3, 6, 13]
+    assert decimation_factor(1000, None) == 1
+
+
+def test_streaming_equals_one_shot():
+    rng = np.random.default_rng(0)
+    data = rng.normal(0, 10, (3, 2000))
+    decimator = Decimator(500, h_freq=30.)
+
+    # Chunks of any length, including chunks without a kept sample
+    bounds = [0, 1, 4, 100, 333, 334, 1500, 2000]
+    chunks = [decimator.process(data[:, a:b]) for a, b in zip(bounds[:-1], bounds[1:])]
+
+    expected = lfilter(decimator.taps, 1, data, axis=1)[:, ::decimator.factor]
+    assert np.allclose(np.concatenate(chunks, axis=1), expected)
+    assert decimator.sfreq == 500 / 6
+
+
+def test_decimate_keeps_the_band():
+    t = np.arange(1000) / 1000
+    alpha, noise = np.sin(2 * np.pi * 10 * t), np.sin(2 * np.pi * 200 * t)
+    low = decimate((alpha + noise)[np.newaxis], 10)[0]
+
+    # The 10 Hz rhythm is kept, the 200 Hz is removed instead of aliased
+    assert np.abs(low[10:-10] - alpha[::10][10:-10]).max() < 0.05
+
+
+def test_eeg_decimation():
+    clock = VirtualClock()
+    eeg = SimulatedEEG(clock=clock, seed=0)
+    eeg.set_decimation(factor=2)
+    eeg.on()
+
+    clock.sleep(4)
+    data = eeg.get_channels_data()
+    assert eeg.channels_sfreq == eeg.sfreq / 2
+    assert data.shape == (len(eeg.get_board_channels()), 4 * eeg.sfreq / 2)
+    eeg.off()
+
+
+def test_model_decimation():
+    trials, labels = synthetic_trials(20, 4, 2000, 500)
+    model = MLModel(trials, labels, sfreq=500, decimate=True)
+    model.offline_training(eeg=None)
+
+    assert model.decimation == 6 and model.sfreq == 500 / 6
+    assert model.buffer.n_samples == 334
+
+    # The board rate window is decimated to the model rate
+    eeg = SimulatedEEG(seed=0)
+    eeg.sfreq = 500
+    assert model.online_predict(trials[0], eeg) == labels[0]
+
+    # The decimated acquisition is already at the model rate
+    eeg.set_decimation(h_freq=30.)
+    assert model.online_predict(eeg.decimator.process(trials[1]), eeg) == labels[1]
+
+    model.partial_fit(eeg, eeg.decimator.process(trials[2]), labels[2])
+    assert len(model.labels) == 21 and model.decimation == 6
+
+
+def test_decimated_eeg_needs_decimated_model():
+    trials, labels = synthetic_trials(20, 4, 1000, 250)
+    model = MLModel(trials, labels, sfreq=250)
+    model.offline_training(eeg=None)
+
+    eeg = SimulatedEEG(seed=0)
+    eeg.sfreq = 250
+    eeg.set_decimation(h_freq=30.)
+    window = eeg.decimator.process(trials[0])
+    with pytest.raises(ValueError):
+        model.online_predict(window, eeg)
+    with pytest.raises(ValueError):
+        model.partial_fit(eeg, window, labels[0])
+    assert len(model.labels) == 20
+
+
+def test_board_rate_benchmarks():
+    results = run_board_rate_benchmarks(rates=[250], channels=4, trials=6, repeat=1)
+    assert set(results) == {'decision@250Hz', 'retrain@250Hz', 'decision@250Hz+decimate', 'retrain@250Hz+decimate'}
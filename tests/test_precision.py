@@ -0,0 +1,64 @@
+"""Tests for the single precision (float32) mode."""
+
+import mne
+import numpy as np
+
+from bci4als.benchmark import synthetic_trials
+from bci4als.dataset import FLOAT32_TOLERANCE, band_pass, preprocess_epochs
+from bci4als.experiments.clock import VirtualClock
+from bci4als.ml_model import MLModel
+from bci4als.multirate import Decimator
+from bci4als.simulation import SimulatedEEG
+
+
+def relative_error(a, b):
+    return np.abs(a - b).max() / np.abs(a).max()
+
+
+def test_band_pass():
+    rng = np.random.default_rng(0)
+    data = rng.normal(0, 10, (3, 4, 600))
+
+    for pad in ('reflect_limited', 'edge'):
+        expected = mne.filter.filter_data(data, 125, 8, 30, pad=pad, verbose=False)
+        filtered = band_pass(data.astype(np.float32), 125, 8, 30, pad=pad)
+        assert filtered.dtype == np.float32
+        assert relative_error(expected, filtered) < FLOAT32_TOLERANCE
+
+    assert np.array_equal(band_pass(data, 125, 8, 30), mne.filter.filter_data(data, 125, 8, 30, verbose=False))
+    assert preprocess_epochs(data, 125, dtype=np.float32).dtype == np.float32
+
+
+def test_model_float32():
+    trials, labels = synthetic_trials(30, 6, 500, 125)
+    double = MLModel(trials, labels, sfreq=125)
+    single = MLModel(trials, labels, sfreq=125, dtype=np.float32)
+    double.offline_training(eeg=None)
+    single.offline_training(eeg=None)
+
+    # Half the memory of the trials
+    assert single.buffer.data.nbytes == double.buffer.data.nbytes // 2
+
+    eeg = SimulatedEEG(seed=0)
+    for trial in trials[:10]:
+        prediction, scores = double.online_predict(trial, eeg, return_scores=True)
+        single_prediction, single_scores = single.online_predict(trial.astype(np.float32), eeg, return_scores=True)
+        assert prediction == single_prediction
+        assert abs(scores - single_scores) <= FLOAT32_TOLERANCE * max(abs(scores), 1)
+
+    single.partial_fit(None, trials[0], labels[0])
+    assert single.buffer.data.dtype == np.float32
+
+
+def test_acquisition_float32():
+    clock = VirtualClock()
+    eeg = SimulatedEEG(clock=clock, seed=0, dtype=np.float32)
+    eeg.on()
+    clock.sleep(2)
+    assert eeg.get_channels_data().dtype == np.float32
+    eeg.off()
+
+    data = np.random.default_rng(0).normal(0, 10, (2, 1000))
+    single = Decimator(500).process(data.astype(np.float32))
+    assert single.dtype == np.float32
+    assert relative_error(Decimator(500).process(data), single) < FLOAT32_TOLERANCE
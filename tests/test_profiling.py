@@ -0,0 +1,70 @@
+"""Tests for the stage profiling hooks."""
+
+import json
+import os
+
+import pytest
+
+from bci4als.experiments.clock import VirtualClock
+from bci4als.experiments.online import OnlineExperiment
+from bci4als.profiling import PROFILER, TRACE_FILE, Profiler, profiled
+from bci4als.simulation import SimulatedEEG
+
+
+@pytest.fixture
+def profiler():
+    PROFILER.clear()
+    PROFILER.enable()
+    yield PROFILER
+    PROFILER.disable()
+    PROFILER.clear()
+
+
+def test_disabled_records_nothing():
+    profiler = Profiler()
+    with profiler.span('filter', 'model', n=1):
+        pass
+    profiler.instant('marker')
+
+    assert profiler.events == []
+
+
+def test_chrome_trace():
+    profiler = Profiler(enabled=True)
+    with profiler.span('cycle', 'online'):
+        with profiler.span('filter', 'model', n_samples=500):
+            pass
+    profiler.instant('marker', 'eeg', label=1)
+
+    events = profiler.to_chrome_trace()['traceEvents']
+    spans = {e['name']: e for e in events if e['ph'] == 'X'}
+    assert spans['filter']['args'] == {'n_samples': 500}
+    assert spans['cycle']['ts'] <= spans['filter']['ts']
+    assert spans['cycle']['dur'] >= spans['filter']['dur']
+    assert any(e['ph'] == 'M' and e['name'] == 'thread_name' for e in events)
+    assert profiler.summary()['model.filter']['count'] == 1
+
+
+def test_profiled(profiler):
+    @profiled('retrain', 'model')
+    def retrain():
+        return 1
+
+    assert retrain() == 1
+    assert [e['name'] for e in profiler.events] == ['retrain']
+
+
+def test_online_session_trace(tmpdir, profiler):
+    clock = VirtualClock()
+    session = os.path.join(tmpdir, '1')
+    exp = OnlineExperiment(eeg=SimulatedEEG(clock=clock, seed=0), model=None, num_trials=2, buffer_time=2,
+                           threshold=2, skip_after=4, debug=True, audio=False, session_directory=session,
+                           headless=True, clock=clock)
+    exp.run()
+
+    with open(os.path.join(session, TRACE_FILE)) as file:
+        names = {e['name'] for e in json.load(file)['traceEvents']}
+    assert {'buffer', 'cycle', 'acquire'} <= names
+
+    # The trace is cleared for the next session
+    assert profiler.events == []
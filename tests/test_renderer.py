@@ -0,0 +1,42 @@
+"""Tests for the frame-paced renderer."""
+
+import pytest
+
+from bci4als.experiments.renderer import Renderer
+
+
+class FrameWindow:
+    """Window which flips on a 60 Hz frame clock, with optional late frames"""
+
+    def __init__(self, late_flips=()):
+        self.late_flips = set(late_flips)
+        self.n_flips = 0
+        self.time = 0.
+        self.monitorFramePeriod = 1 / 60
+
+    def flip(self):
+        self.n_flips += 1
+        self.time += 2 / 60 if self.n_flips in self.late_flips else 1 / 60
+        return self.time
+
+
+def test_show_counts_frames():
+    renderer = Renderer(FrameWindow(), frame_rate=60)
+    renderer.stims['cue'] = type('Stim', (), {'draw': lambda self: None})()
+
+    onset = renderer.show(0.5, 'cue')
+
+    assert onset == pytest.approx(1 / 60)
+    assert len(renderer.flip_times) == 30
+
+
+def test_timing_summary():
+    renderer = Renderer(FrameWindow(late_flips=(10, 20)), frame_rate=60)
+    for _ in range(100):
+        renderer.flip()
+
+    summary = renderer.timing_summary()
+    assert summary['flips'] == 100
+    assert summary['dropped_frames'] == 2
+    assert summary['interval_mean_ms'] == pytest.approx(1000 / 60)
+    assert summary['jitter_ms'] == pytest.approx(0, abs=1e-6)
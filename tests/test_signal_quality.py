@@ -0,0 +1,71 @@
+"""Tests for the real-time signal quality monitor."""
+
+import os
+
+import numpy as np
+
+from bci4als.experiments.clock import VirtualClock
+from bci4als.experiments.event_log import EVENTS_FILE, read_events
+from bci4als.experiments.online import OnlineExperiment
+from bci4als.signal_quality import CYTON_RAIL, SignalQualityMonitor
+from bci4als.simulation import SimulatedEEG
+
+SFREQ = 125
+
+
+def test_running_statistics():
+    rng = np.random.default_rng(0)
+    stream = rng.normal(0, 10, (3, 5000)) + np.array([[0], [5000], [-3e4]])
+    stream[1] += 30 * np.sin(2 * np.pi * 50 * np.arange(5000) / SFREQ)
+    monitor = SignalQualityMonitor(SFREQ, ['a', 'b', 'c'], window=2.)
+
+    # Chunks of any size, the statistics are of the last window
+    position = 0
+    for size in rng.integers(1, 40, 100):
+        monitor.update(stream[:, position:position + size])
+        position += size
+        window = stream[:, max(position - monitor.n_window, 0):position]
+        assert np.allclose(monitor.rms, window.std(axis=1))
+
+    # The line ratio is the fraction of the power at 50 Hz (a sine of amplitude 30 is 450 uV^2)
+    window = stream[:, position - monitor.n_window:position]
+    spectrum = np.abs(np.fft.rfft(window - window.mean(axis=1, keepdims=True))) ** 2
+    bin_50 = 50 * monitor.n_window // SFREQ
+    assert np.allclose(monitor.line_ratio, 2 * spectrum[:, bin_50] / monitor.n_window ** 2 / window.var(axis=1))
+    assert monitor.line_ratio[1] > 0.7 and monitor.line_ratio[0] < 0.05
+
+
+def test_bad_channels():
+    rng = np.random.default_rng(0)
+    data = rng.normal(0, 10, (5, 500))
+    data[1] = 1000.  # disconnected, flat
+    data[2, 100:] = CYTON_RAIL  # railed
+    data[3] *= 50  # noisy
+    data[4] += 40 * np.sin(2 * np.pi * 50 * np.arange(500) / SFREQ)
+
+    monitor = SignalQualityMonitor(SFREQ, ['ok', 'flat', 'railed', 'noisy', 'line'])
+    monitor.update(data)
+    assert monitor.bad_channels() == {'flat': 'flat', 'railed': 'railed', 'noisy': 'noisy', 'line': 'line_noise'}
+
+    snapshot = monitor.snapshot()
+    assert snapshot['channels']['ok']['status'] == 'ok' and snapshot['window'] == 2.
+
+    # The line frequency is above Nyquist of slow streams
+    assert np.isnan(SignalQualityMonitor(80, ['a']).line_ratio).all()
+
+
+def test_eeg_monitor(tmpdir):
+    clock = VirtualClock()
+    eeg = SimulatedEEG(clock=clock, seed=0)
+    monitor = eeg.monitor_quality()
+
+    session = os.path.join(tmpdir, '1')
+    exp = OnlineExperiment(eeg=eeg, model=None, num_trials=2, buffer_time=2, threshold=3, skip_after=4,
+                           debug=True, audio=False, session_directory=session, headless=True, clock=clock,
+                           quality_overlay=True)
+    exp.run()
+
+    # The simulated channels are clean noise
+    assert monitor.written > 0 and monitor.bad_channels() == {}
+    quality = read_events(os.path.join(session, EVENTS_FILE), 'signal_quality')
+    assert len(quality) == 2 and set(quality[0]['channels']) == set(eeg.eeg_names)
@@ -0,0 +1,54 @@
+"""Tests for the evidence accumulation dynamic stopping."""
+
+import os
+
+import numpy as np
+import pytest
+
+from bci4als.experiments.clock import VirtualClock
+from bci4als.experiments.event_log import read_events
+from bci4als.experiments.online import OnlineExperiment
+from bci4als.experiments.stopping import EvidenceAccumulator, log_probabilities
+from bci4als.simulation import SimulatedEEG
+
+
+def test_log_probabilities():
+    assert np.exp(log_probabilities([1., 2., 3.])).sum() == pytest.approx(1)
+    # Binary decision score is the log odds of the second class
+    assert np.exp(log_probabilities(np.log(3)))[1] == pytest.approx(0.75)
+
+
+def test_confident_scores_stop_early():
+    accumulator = EvidenceAccumulator(classes=[0, 1, 2], rule='sprt', bound=0.05)
+    scores = [0., 2., 0.]
+
+    # log(0.95 / 0.05) = 2.94, the scores give a margin of 2 per window
+    assert accumulator.update(scores=scores) is None
+    assert accumulator.progress(1) == pytest.approx(2 / np.log(19))
+    assert accumulator.update(scores=scores) == 1
+    assert accumulator.n_windows == 2
+    assert accumulator.expected_windows() == 2
+
+
+def test_decides_on_non_target():
+    accumulator = EvidenceAccumulator(classes=[0, 1, 2, 3, 4], rule='posterior', bound=0.9)
+    decisions = [accumulator.update(prediction=3) for _ in range(5)]
+
+    assert decisions[-1] == 3
+    assert accumulator.posterior()[3] >= 0.9
+    assert accumulator.progress(0) == 0
+
+
+def test_online_session_dynamic_stopping(tmpdir):
+    clock = VirtualClock()
+    session = os.path.join(tmpdir, '1')
+    exp = OnlineExperiment(eeg=SimulatedEEG(clock=clock, seed=0), model=None, num_trials=5, buffer_time=2,
+                           threshold=3, skip_after=8, debug=True, audio=False, session_directory=session,
+                           headless=True, clock=clock, stopping='posterior', stopping_bound=0.9)
+    exp.run()
+
+    ends = list(read_events(os.path.join(session, 'events.jsonl'), 'trial_end'))
+    assert len(ends) == 5
+    for end in ends:
+        assert end['confident'] == (end['decision'] == end['target'])
+        assert end['decision_time'] == 2 * end['windows']
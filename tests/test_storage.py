@@ -0,0 +1,71 @@
+"""Tests for the memory mapped session store."""
+
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from bci4als.storage import SessionStore, convert_recordings, write_session
+
+
+@pytest.fixture
+def trials():
+    rng = np.random.default_rng(0)
+    return [rng.normal(size=(3, n)) for n in (100, 103, 101)]
+
+
+def test_round_trip(tmpdir, trials):
+    write_session(str(tmpdir), trials, [0, 1, 2], ['C3', 'C4', 'Cz'], 125)
+    store = SessionStore(str(tmpdir))
+
+    assert len(store) == 3 and store.sfreq == 125 and store.ch_names == ['C3', 'C4', 'Cz']
+    assert store.labels.tolist() == [0, 1, 2]
+    for i, trial in enumerate(trials):
+        np.testing.assert_array_equal(store.trial(i), trial)
+
+
+def test_empty_store(tmpdir):
+    write_session(str(tmpdir), [], [], ['C3', 'C4'], 125)
+    store = SessionStore(str(tmpdir))
+
+    assert len(store) == 0 and store.labels.tolist() == []
+    assert store.epochs().shape == (0, 2, 0)
+
+
+def test_epochs_are_views(tmpdir, trials):
+    write_session(str(tmpdir), trials, [0, 1, 2], ['C3', 'C4', 'Cz'], 125)
+    store = SessionStore(str(tmpdir))
+
+    epochs = store.epochs(90, start=5)
+    assert epochs.shape == (3, 3, 90)
+    assert np.shares_memory(epochs, store.samples)
+    np.testing.assert_array_equal(epochs, np.stack([t[:, 5:95] for t in trials]))
+
+    with pytest.raises(ValueError):
+        store.epochs(101)
+
+
+def test_unaligned_epochs(tmpdir, trials):
+    write_session(str(tmpdir), trials, [0, 1, 2], ['C3', 'C4', 'Cz'], 125, align=False)
+    store = SessionStore(str(tmpdir))
+
+    assert store.samples.shape == (3, 304)
+    np.testing.assert_array_equal(store.epochs(), np.stack([t[:, :100] for t in trials]))
+
+
+def test_convert_recordings(tmpdir, trials):
+    session = os.path.join(tmpdir, 'subject', '1')
+    os.makedirs(session)
+    dfs = [pd.DataFrame(t.T, columns=['C3', 'C4', 'Cz']) for t in trials]
+    pickle.dump(dfs, open(os.path.join(session, 'trials.pickle'), 'wb'))
+    pd.DataFrame({'name': [2, 1, 0]}).to_csv(os.path.join(session, 'labels.csv'), index=False, header=False)
+    os.makedirs(os.path.join(tmpdir, 'subject', '2'))
+
+    assert convert_recordings(str(tmpdir)) == [session]
+    assert convert_recordings(str(tmpdir)) == []
+
+    store = SessionStore(session)
+    assert store.labels.tolist() == [2, 1, 0]
+    pd.testing.assert_frame_equal(store.to_dataframes()[1], dfs[1])
@@ -0,0 +1,136 @@
+"""Tests for the shared memory stream hub."""
+
+import multiprocessing
+import time
+
+import numpy as np
+import pytest
+
+from bci4als.experiments.clock import VirtualClock
+from bci4als.experiments.trial_collector import TrialCollector
+from bci4als.simulation import SimulatedEEG
+from bci4als.stream_hub import (BufferOverrun, SharedRing, StreamConsumer, StreamHub, StreamRecorder,
+                                load_recording)
+
+
+def chunk(start, n, n_rows=3):
+    return np.tile(np.arange(start, start + n, dtype=float), (n_rows, 1))
+
+
+def test_ring_and_cursors():
+    ring = SharedRing.create(n_rows=3, capacity=10, sfreq=125)
+    try:
+        first, second = StreamConsumer(ring), StreamConsumer(ring)
+
+        ring.write(chunk(0, 6))
+        view = first.read()
+        assert np.array_equal(view[0], np.arange(6)) and np.shares_memory(view, ring.data)
+
+        # The samples wrap around the ring, the second consumer still reads all of them
+        ring.write(chunk(6, 3))
+        assert np.array_equal(first.read()[0], [6, 7, 8])
+        assert np.array_equal(second.read()[0], np.arange(9))
+
+        # The first consumer falls behind by more than the capacity
+        ring.write(chunk(9, 25))
+        assert not first.valid()
+        data = first.read()
+        assert np.array_equal(data[0], np.arange(24, 34))
+        assert (first.overruns, first.lost) == (1, 15)
+
+        strict = StreamConsumer(ring, start='oldest', strict=True)
+        ring.write(chunk(34, 11))
+        with pytest.raises(BufferOverrun):
+            strict.read()
+    finally:
+        ring.close()
+
+
+def _read_in_process(name, queue):
+    consumer = StreamConsumer.attach(name, start='oldest')
+    queue.put(consumer.read(copy=True)[0].tolist())
+    consumer.close()
+
+
+def test_consumer_in_another_process():
+    ring = SharedRing.create(n_rows=2, capacity=100, sfreq=125)
+    try:
+        ring.write(chunk(0, 20, n_rows=2))
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=_read_in_process, args=(ring.name, queue))
+        process.start()
+        assert queue.get(timeout=30) == list(range(20))
+        process.join()
+    finally:
+        ring.close()
+
+
+def test_hub_eeg_consumers(tmpdir):
+    clock = VirtualClock()
+    eeg = SimulatedEEG(clock=clock, seed=0)
+
+    with StreamHub(eeg, seconds=30) as hub:
+        online, offline = hub.eeg_view(), hub.eeg_view()
+        recorder = StreamRecorder(hub.consumer(), str(tmpdir))
+        eeg.on()
+        online.on()
+
+        # The online decoder and the trial collector read the same samples
+        collector = TrialCollector(offline, [1])
+        clock.sleep(1)
+        online.insert_marker('start', 1, 0)
+        clock.sleep(2)
+        online.insert_marker('stop', 1, 0)
+        clock.sleep(1)
+        hub.pump()
+
+        window = online.get_channels_data()
+        assert window.shape[1] == 4 * eeg.sfreq
+        collector.collect()
+        assert len(collector.trials) == 1 and len(collector.trials[0]) == 2 * eeg.sfreq
+
+        recorder.close()
+        raw = load_recording(str(tmpdir))
+        assert raw.shape == (hub.ring.n_rows, 4 * eeg.sfreq)
+        assert np.array_equal(raw[eeg.get_board_channels()], window)
+        eeg.off()
+
+
+def test_recorder_drops_torn_samples(tmpdir):
+    ring = SharedRing.create(n_rows=2, capacity=10, sfreq=125)
+    try:
+        consumer = StreamConsumer(ring, start='oldest')
+        recorder = StreamRecorder(consumer, str(tmpdir))
+        ring.write(chunk(0, 10, n_rows=2))
+
+        # The producer overwrites 4 of the samples while the recorder copies them
+        read = consumer.read
+
+        def read_while_overwritten(*args, **kwargs):
+            data = read(*args, **kwargs)
+            ring.write(chunk(10, 4, n_rows=2))
+            return data
+
+        consumer.read = read_while_overwritten
+        assert recorder.poll() == 6
+        assert consumer.lost == 4
+
+        del consumer.read
+        recorder.close()
+        assert load_recording(str(tmpdir))[0].tolist() == list(range(4, 14))
+    finally:
+        ring.close()
+
+
+def test_producer_thread():
+    eeg = SimulatedEEG(seed=0)
+    with StreamHub(eeg, seconds=5, poll_interval=0.01) as hub:
+        consumer = hub.consumer()
+        eeg.on()
+        hub.start()
+        time.sleep(0.3)
+        hub.stop()
+        eeg.off()
+
+        assert consumer.available > 0
+        assert consumer.read().shape == (hub.ring.n_rows, hub.ring.written)
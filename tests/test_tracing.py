@@ -0,0 +1,62 @@
+"""Tests for the decisions latency tracing."""
+
+import json
+import os
+import time
+
+import pytest
+
+from bci4als.benchmark import synthetic_trials
+from bci4als.experiments.clock import VirtualClock
+from bci4als.experiments.online import OnlineExperiment
+from bci4als.ml_model import MLModel
+from bci4als.simulation import SimulatedEEG
+from bci4als.tracing import LatencyTracer, LATENCY_FILE
+
+
+def test_stage_durations():
+    tracer = LatencyTracer()
+    trace = tracer.start(time.time() - 0.1)
+    trace.mark('acquire')
+    trace.mark('predict')
+    trace.finish()
+    trace.finish()  # finishing twice is ignored
+
+    durations = tracer.traces[0].durations()
+    assert len(tracer.traces) == 1
+    assert durations['acquire'] == pytest.approx(0.1, abs=0.05)
+    assert durations['total'] == pytest.approx(durations['acquire'] + durations['predict'])
+
+
+def test_save_summary(tmpdir):
+    tracer = LatencyTracer()
+    for _ in range(10):
+        trace = tracer.start(None)
+        trace.mark('flip')
+        trace.finish()
+
+    with open(tracer.save(str(tmpdir))) as file:
+        summary = json.load(file)
+
+    assert os.path.isfile(os.path.join(tmpdir, LATENCY_FILE))
+    assert summary['total']['count'] == 10
+    assert sum(summary['flip']['histogram']['counts']) == 10
+
+
+def test_headless_session_latency(tmpdir):
+    clock = VirtualClock()
+    eeg = SimulatedEEG(clock=clock, seed=0)
+    trials, labels = synthetic_trials(20, len(eeg.get_board_channels()), 250, eeg.sfreq)
+    model = MLModel(trials, labels, sfreq=eeg.sfreq)
+    model.offline_training(eeg=None)
+
+    session = os.path.join(tmpdir, '1')
+    exp = OnlineExperiment(eeg=eeg, model=model, num_trials=1, buffer_time=2, threshold=3, skip_after=2,
+                           audio=False, session_directory=session, headless=True, clock=clock)
+    exp.run()
+
+    # The marks & the simulated timestamps are on the virtual clock, and every decision is flipped
+    with open(os.path.join(session, LATENCY_FILE)) as file:
+        summary = json.load(file)
+    assert summary['flip']['count'] == summary['total']['count'] == len(exp.results[0])
+    assert all((values >= 0).all() for values in exp.tracer.latencies().values())
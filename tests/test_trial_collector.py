@@ -0,0 +1,76 @@
+"""Tests for cutting the trials during the offline session."""
+
+import numpy as np
+import pytest
+
+from bci4als.experiments.clock import VirtualClock
+from bci4als.experiments.trial_collector import TrialCollector
+from bci4als.simulation import SimulatedEEG
+
+
+@pytest.fixture
+def clock():
+    return VirtualClock()
+
+
+@pytest.fixture
+def eeg(clock):
+    eeg = SimulatedEEG(clock=clock, seed=0)
+    eeg.on()
+    return eeg
+
+
+def _record(eeg, clock, labels, skip_stop=()):
+    """Record the trials and return the board data in chunks, a chunk per trial"""
+    chunks = []
+    for index, label in enumerate(labels):
+        clock.sleep(1)
+        eeg.insert_marker('start', label, index)
+        clock.sleep(2)
+        if index not in skip_stop:
+            eeg.insert_marker('stop', label, index)
+        clock.sleep(0.5)
+        chunks.append(eeg.get_board_data())
+    return chunks
+
+
+def test_same_as_extract_trials(eeg, clock):
+    labels = [0, 1, 2, 3, 4, 0]
+    chunks = _record(eeg, clock, labels)
+
+    collector = TrialCollector(eeg, labels)
+    for chunk in chunks:
+        collector.feed(chunk)
+
+    data = np.concatenate(chunks, axis=1)
+    durations, extracted_labels = eeg.extract_trials(data)
+
+    assert collector.complete and not collector.errors
+    assert collector.labels == extracted_labels == labels
+    for trial, (start, end) in zip(collector.trials, durations):
+        np.testing.assert_array_equal(trial.to_numpy().T, data[eeg.get_board_channels(), start:end])
+
+
+def test_trial_across_chunks(eeg, clock):
+    eeg.insert_marker('start', 2, 0)
+    collector = TrialCollector(eeg, [2])
+    for _ in range(4):
+        clock.sleep(1)
+        collector.collect()
+    eeg.insert_marker('stop', 2, 0)
+    clock.sleep(0.1)
+
+    assert collector.collect() == 1
+    assert abs(len(collector.trials[0]) - 4 * eeg.sfreq) <= 1
+
+
+def test_lost_marker_reported_early(eeg, clock):
+    labels = [0, 1, 2]
+    chunks = _record(eeg, clock, labels, skip_stop=(0,))
+
+    collector = TrialCollector(eeg, labels)
+    collector.feed(chunks[0])
+    collector.feed(chunks[1])
+
+    assert collector.errors == ['Trial 0 has no stop marker']
+    assert collector.labels == [1]
@@ -0,0 +1,52 @@
+"""Tests for the streaming XDF reader."""
+
+import os
+import pickle
+
+import numpy as np
+
+from bci4als.storage import SessionStore
+import bci4als.xdf
+from bci4als.xdf import find_stream, marker_trials, read_streams, xdf_to_store
+
+RECORDS = os.path.join(os.path.dirname(__file__), '..', 'examples', 'adi_eden_records')
+
+
+def test_marker_trials():
+    markers = ['111', '1111', '2', '9', '1111', '3', '9', '1111', '1', '99']
+    assert marker_trials(np.arange(10.), markers) == [(1., 3., 2), (4., 6., 3)]
+
+    # Text markers are ignored, also in place of the label
+    markers = ['session start', '1111', '1', '9', '1111', 'pause', '9', '9']
+    assert marker_trials(np.arange(8.), markers) == [(1., 3., 1)]
+
+
+def test_same_as_converted_pickle(tmpdir):
+    path = os.path.join(RECORDS, 'Sub2011001', 'EEG.xdf')
+    converted = pickle.load(open(os.path.join(RECORDS, 'Sub2011001.pkl'), 'rb'))
+
+    streams = read_streams(path)
+    assert find_stream(streams, 'EEG').channel_count == 16
+
+    durations, labels = xdf_to_store(path, str(tmpdir), ch_names=converted['ch_names'], channels=range(3, 16))
+    assert durations == [tuple(d) for d in converted['duration']]
+    assert labels == converted['labels']
+
+    store = SessionStore(str(tmpdir))
+    assert store.ch_names == converted['ch_names'] and store.sfreq == 125
+    for i, (start, stop) in enumerate(durations):
+        np.testing.assert_array_equal(store.trial(i), converted['data'][start:stop].T)
+
+
+def test_skip_empty_trials(tmpdir, monkeypatch):
+    path = os.path.join(RECORDS, 'Sub2011001', 'EEG.xdf')
+    expected, _ = xdf_to_store(path, os.path.join(tmpdir, 'expected'))
+
+    # A trial which stops at its start marker has no samples
+    def with_empty_trial(times, *args):
+        trials = marker_trials(times, *args)
+        return [(trials[0][0], trials[0][0], 1)] + trials
+    monkeypatch.setattr(bci4als.xdf, 'marker_trials', with_empty_trial)
+
+    durations, labels = xdf_to_store(path, os.path.join(tmpdir, 'store'))
+    assert durations == expected and len(SessionStore(os.path.join(tmpdir, 'store'))) == len(labels)